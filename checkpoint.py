@@ -0,0 +1,383 @@
+'''
+Checkpoint Data Object
+
+Purpose:
+    - Saves the progress of a long run of tothemaxmain.py at regular
+      intervals, so that a run that is stopped part way through can be
+      resumed from the last checkpoint instead of starting again
+    - Progress saved:
+        - Rows of the Gradient calculated (slope, aspect, D8 directions
+          and sink indicator of each cell, as arrays), appended as blocks
+          of rows
+        - Tie resolution state (aspect and D8 directions of tied cells
+          at the end of a loop through the Gradient)
+        - Rows of the output files written, and the file sizes at that row
+    - Checks a run being resumed is for the same input dataset (SHA-256
+      hash of the file) and the same arguments
+
+Developer Note:
+    - The state is written to a new file which then replaces the old one,
+      so a run stopped while saving still leaves the last checkpoint.
+      Blocks of rows are only appended, and the state holds the size of
+      the block file at the checkpoint, so anything written after it is
+      ignored.
+    - Only the results of each cell are saved, not its Neighbourhood
+      (about 35 bytes a cell).  When resumed, each cell is restored as a
+      light record holding just those results, which is all the tie
+      resolution and the maps need.  D8 directions are saved as a bit
+      per direction, in the same (ascending) order.
+    - The checkpoint files are removed once all output files are written.
+
+Filename:
+    - checkpoint.py
+
+Classes:
+    - Checkpoint
+
+Methods:
+    - load
+    - due
+    - save
+    - save_rows
+    - load_rows
+    - save_ties
+    - open_outputs
+    - save_outputs
+    - remove
+
+Functions:
+    - file_hash
+
+Input:
+    - Dataset URL
+    - Arguments the results depend on
+    - Interval between checkpoints (seconds)
+
+Output:
+    - Instance of Checkpoint class
+    - Files
+        - tothemax_checkpoint.pkl       - Checkpoint state
+        - tothemax_checkpoint_rows.pkl  - Blocks of Gradient rows
+'''
+
+import os
+import sys
+import time
+import pickle
+import hashlib
+from types import SimpleNamespace
+import numpy as np
+
+
+# Results saved for each cell of the Gradient.
+CELL_FIELDS = ('slope', 'slope_perc', 'slope_deg', 'aspect')
+
+# D8 directions of each bit pattern (bit n = direction n).
+D8_LISTS = [tuple(n for n in range(8) if bits >> n & 1)
+            for bits in range(256)]
+
+
+def file_hash(dataset, block_size=1 << 20):
+    '''
+    Use this function to get the SHA-256 hash of a file.
+
+    Triggered by:
+        - Checkpoint.__init__
+
+    Input:
+        - Dataset URL
+        - No. of bytes read at a time
+
+    Output:
+        - Hash (hexadecimal string)
+    '''
+    digest = hashlib.sha256()
+
+    with open(dataset, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+#----------------------------------------------------------
+# Checkpoint Class
+#----------------------------------------------------------
+class Checkpoint():
+    '''
+    Progress of a run of tothemaxmain.py.
+    '''
+
+    def __init__(self, dataset, settings, interval=600,
+                 prefix='tothemax_checkpoint'):
+        '''
+        Initialises data object instance.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - Dataset URL
+            - Arguments the results depend on (dictionary)
+            - Interval between checkpoints (seconds, 0 = none saved)
+            - Checkpoint file name prefix
+
+        Output:
+            - Checkpoint data instance
+        '''
+        self.interval = interval
+        self.state_file = prefix + '.pkl'
+        self.rows_file = prefix + '_rows.pkl'
+        self.saved_at = time.time()
+        self.state = {'hash': file_hash(dataset),
+                      'settings': settings,
+                      'rows_done': 0,
+                      'rows_size': 0,
+                      'ties': None,
+                      'keep_looping': True,
+                      'rows_written': 0,
+                      'file_sizes': None}
+
+
+    def load(self):
+        '''
+        Use this method to restore the last checkpoint saved.
+
+        Triggered by:
+            - tothemaxmain.py (--resume Y)
+
+        Input:
+            - None
+
+        Output:
+            - Checkpoint state
+            - Validation exceptions (no checkpoint, different input dataset
+              or arguments)
+        '''
+        try:
+            with open(self.state_file, 'rb') as f:
+                state = pickle.load(f)
+        except OSError:
+            sys.exit('No checkpoint to resume from (' + self.state_file
+                     + ').')
+
+        if state['hash'] != self.state['hash']:
+            sys.exit('Checkpoint is for a different input file.')
+
+        if state['settings'] != self.state['settings']:
+            sys.exit('Checkpoint is for different arguments: '
+                     + ', '.join(name + ' ' + str(value) for name, value
+                                 in sorted(state['settings'].items())))
+
+        self.state = state
+
+
+    def due(self):
+        '''
+        Use this method to check if the next checkpoint should be saved.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - None
+
+        Output:
+            - Checkpoint due indicator (True / False)
+        '''
+        return self.interval > 0 \
+            and time.time() - self.saved_at >= self.interval
+
+
+    def save(self):
+        '''
+        Use this method to save the checkpoint state, replacing the last
+        one only once it has been completely written.
+
+        Triggered by:
+            - save_rows
+            - save_ties
+            - save_outputs
+
+        Input:
+            - None
+
+        Output:
+            - Checkpoint state file
+        '''
+        with open(self.state_file + '.tmp', 'wb') as f:
+            pickle.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(self.state_file + '.tmp', self.state_file)
+        self.saved_at = time.time()
+
+
+    def save_rows(self, gradient, sinks, rows_done):
+        '''
+        Use this method to save the Gradient rows calculated since the
+        last checkpoint.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - Gradient (rows of Neighbourhood instances)
+            - Sink indicators (rows of True / False)
+            - No. of rows calculated
+
+        Output:
+            - Block of rows (cell result arrays) appended to the rows file
+            - Checkpoint state file
+        '''
+        first = self.state['rows_done']
+        rows = gradient[first:rows_done]
+
+        fields = np.array([[[getattr(cell, name) for cell in row] 
+                            for row in rows] for name in CELL_FIELDS],
+                          dtype=np.float64)
+        d8 = np.array([[sum(1 << n for n in cell.d8) for cell in row]
+                       for row in rows], dtype=np.uint8)
+        sink_rows = np.array(sinks[first:rows_done], dtype=bool)
+
+        with open(self.rows_file, 'r+b' if first else 'wb') as f:
+            f.truncate(self.state['rows_size'])
+            f.seek(self.state['rows_size'])
+            pickle.dump((fields, d8, sink_rows), f, 
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+            self.state['rows_size'] = f.tell()
+
+        self.state['rows_done'] = rows_done
+        self.save()
+
+
+    def load_rows(self, gradient, sinks):
+        '''
+        Use this method to restore the Gradient rows saved.
+
+        Triggered by:
+            - tothemaxmain.py (--resume Y)
+
+        Input:
+            - Gradient (rows, replaced in place)
+            - Sink indicators (rows, replaced in place)
+
+        Output:
+            - No. of rows restored (cells restored as records of their
+              slope, aspect and D8 directions)
+        '''
+        r = 0
+
+        if self.state['rows_done']:
+            with open(self.rows_file, 'rb') as f:
+                while f.tell() < self.state['rows_size']:
+                    fields, d8, sink_rows = pickle.load(f)
+
+                    for n in range(len(d8)):
+                        gradient[r + n] = [
+                            SimpleNamespace(**dict(zip(CELL_FIELDS, values)),
+                                            d8=list(D8_LISTS[bits]))
+                            for *values, bits in zip(
+                                *(field[n].tolist() for field in fields),
+                                d8[n].tolist())]
+
+                    sinks[r:r + len(d8)] = sink_rows.tolist()
+                    r += len(d8)
+
+        return r
+
+
+    def save_ties(self, gradient, cells, keep_looping):
+        '''
+        Use this method to save the tie resolution state at the end of a
+        loop through the Gradient.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - Gradient (rows of Neighbourhood instances)
+            - Cells (row, column) tied before tie resolution started
+            - Another loop required indicator (True / False)
+
+        Output:
+            - Checkpoint state file
+        '''
+        self.state['ties'] = {(r, c): (gradient[r][c].aspect,
+                                       gradient[r][c].d8)
+                              for r, c in cells}
+        self.state['keep_looping'] = keep_looping
+        self.save()
+
+
+    def open_outputs(self, file_names):
+        '''
+        Use this method to open the output files, continuing from the
+        checkpoint if output files had been started.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - Output file names
+
+        Output:
+            - Output files (opened for writing)
+            - No. of rows already written
+        '''
+        if self.state['file_sizes'] is None:
+            return [open(name, 'w', newline='') for name in file_names], 0
+
+        files = []
+        for name, size in zip(file_names, self.state['file_sizes']):
+            f = open(name, 'r+', newline='')
+            f.truncate(size)
+            f.seek(size)
+            files.append(f)
+
+        return files, self.state['rows_written']
+
+
+    def save_outputs(self, files, rows_written):
+        '''
+        Use this method to save the rows of the output files written.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - Output files
+            - No. of rows written
+
+        Output:
+            - Checkpoint state file
+        '''
+        for f in files:
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.state['file_sizes'] = [f.tell() for f in files]
+        self.state['rows_written'] = rows_written
+        self.save()
+
+
+    def remove(self):
+        '''
+        Use this method to remove the checkpoint files once the run is
+        complete.
+
+        Triggered by:
+            - tothemaxmain.py
+
+        Input:
+            - None
+
+        Output:
+            - None
+        '''
+        for name in (self.state_file, self.rows_file):
+            if os.path.exists(name):
+                os.remove(name)
@@ -0,0 +1,308 @@
+'''
+Contour Data Object
+
+Purpose:
+    - Traces contour lines at a fixed elevation interval over the terrain
+      using marching squares, each square being 4 neighbouring cell
+      centres
+    - Keeps the contour lines, so they can be drawn over any number of
+      Matplotlib sub plots (and redrawn when zooming) without being traced
+      again
+    - Writes the contour lines as GeoJSON in map coordinates
+
+Developer Note:
+    - Each level is traced for all squares at once with numpy arrays: the
+      case of every square (which corners are at or above the level), the
+      crossing point on every cell edge, then the line segments of each of
+      the 16 cases.  Saddle squares (opposite corners above) are split
+      using the mean of the 4 corners.
+    - Squares with a NoData (NaN) corner have no segments, so contour lines
+      stop at the edge of NoData areas.
+    - Segments are joined into lines using the cell edge they share, so no
+      floating point matching of end points is needed.
+
+Filename:
+    - contours.py
+
+Classes:
+    - Contours
+
+Methods:
+    - overlay
+    - map_lines
+    - write_geojson
+
+Functions:
+    - contour_levels
+    - level_segments
+    - join_segments
+
+Input:
+    - Elevation map data (array or nested list, NaN for NoData)
+    - Contour interval (metres)
+
+Output:
+    - Instance of Contours class
+'''
+
+import json
+import math
+import numpy as np
+from matplotlib.collections import LineCollection
+
+
+# Square edges crossed by the segments of each case.  Case bits: top left
+# 8, top right 4, bottom right 2, bottom left 1.  Saddle cases 5 and 10 are
+# 21 and 26 when the mean of the corners is at or above the level.
+CASE_EDGES = {1: ('LB',), 2: ('BR',), 3: ('LR',), 4: ('TR',),
+              5: ('TR', 'LB'), 6: ('TB',), 7: ('LT',), 8: ('LT',),
+              9: ('TB',), 10: ('LT', 'BR'), 11: ('TR',), 12: ('LR',),
+              13: ('BR',), 14: ('LB',), 21: ('LT', 'BR'), 26: ('TR', 'LB')}
+
+
+def contour_levels(grid, interval):
+    '''
+    Use this function to list the contour levels (multiples of the
+    interval) within the range of the terrain.
+
+    Triggered by:
+        - Contours.__init__
+
+    Input:
+        - Elevation map data array (NaN for NoData)
+        - Contour interval
+
+    Output:
+        - List of levels
+    '''
+    if np.all(np.isnan(grid)):
+        return []
+
+    low = math.ceil(np.nanmin(grid) / interval)
+    high = math.floor(np.nanmax(grid) / interval)
+
+    return [n * interval for n in range(low, high + 1)]
+
+
+def level_segments(grid, level):
+    '''
+    Use this function to find the contour segments of one level in every
+    square of the terrain.
+
+    Cell edges are numbered: horizontal edges (row r, columns c and c + 1)
+    first, then vertical edges (column c, rows r and r + 1).
+
+    Triggered by:
+        - Contours.__init__
+
+    Input:
+        - Elevation map data array (NaN for NoData)
+        - Contour level
+
+    Output:
+        - List of segments (pairs of edge numbers)
+        - x and y of the crossing point on each edge (cells, NaN if the
+          edge is not crossed)
+    '''
+    y_limit, x_limit = grid.shape
+    rows, cols = np.indices(grid.shape, dtype=np.float64)
+    above = grid >= level
+
+    # Crossing points, interpolated along each edge.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (level - grid[:, :-1]) / (grid[:, 1:] - grid[:, :-1])
+        h_x = np.where(above[:, :-1] != above[:, 1:], cols[:, :-1] + t,
+                       np.nan)
+        t = (level - grid[:-1, :]) / (grid[1:, :] - grid[:-1, :])
+        v_y = np.where(above[:-1, :] != above[1:, :], rows[:-1, :] + t,
+                       np.nan)
+
+    edge_x = np.concatenate((h_x.ravel(), cols[:-1, :].ravel()))
+    edge_y = np.concatenate((rows[:, :-1].ravel(), v_y.ravel()))
+
+    # Case of every square.
+    tl, tr = grid[:-1, :-1], grid[:-1, 1:]
+    br, bl = grid[1:, 1:], grid[1:, :-1]
+    case = (8 * above[:-1, :-1] + 4 * above[:-1, 1:] + 2 * above[1:, 1:]
+            + above[1:, :-1])
+    saddle = ((case == 5) | (case == 10)) & ((tl + tr + br + bl) / 4 >= level)
+    case[saddle] += 16
+    case[np.isnan(tl) | np.isnan(tr) | np.isnan(br) | np.isnan(bl)] = 0
+
+    # Edges of every square.
+    r, c = np.indices(case.shape)
+    h_count = y_limit * (x_limit - 1)
+    edges = {'T': r * (x_limit - 1) + c,
+             'B': (r + 1) * (x_limit - 1) + c,
+             'L': h_count + r * x_limit + c,
+             'R': h_count + r * x_limit + c + 1}
+
+    segments = []
+    for n, pairs in CASE_EDGES.items():
+        squares = case == n
+        if not squares.any():
+            continue
+        for e1, e2 in pairs:
+            segments.extend(zip(edges[e1][squares].tolist(),
+                                edges[e2][squares].tolist()))
+
+    return segments, edge_x, edge_y
+
+
+def join_segments(segments):
+    '''
+    Use this function to join contour segments sharing an edge into lines.
+    Open lines (ending at the terrain or NoData edge) are traced from one
+    end, closed lines end at the edge they start from.
+
+    Triggered by:
+        - Contours.__init__
+
+    Input:
+        - List of segments (pairs of edge numbers)
+
+    Output:
+        - List of lines (lists of edge numbers)
+    '''
+    links = {}
+    for i, (e1, e2) in enumerate(segments):
+        links.setdefault(e1, []).append(i)
+        links.setdefault(e2, []).append(i)
+
+    used = [False] * len(segments)
+    lines = []
+    open_ends = [e for e, ends in links.items() if len(ends) == 1]
+
+    for edge in open_ends + [e1 for e1, e2 in segments]:
+        line = [edge]
+
+        while True:
+            unused = [i for i in links[edge] if not used[i]]
+            if not unused:
+                break
+
+            used[unused[0]] = True
+            e1, e2 = segments[unused[0]]
+            edge = e2 if e1 == edge else e1
+            line.append(edge)
+
+        if len(line) > 1:
+            lines.append(line)
+
+    return lines
+
+
+class Contours():
+    '''
+    Contour lines of a terrain, traced once.
+    '''
+
+    def __init__(self, grid, interval):
+        '''
+        Initialises data object instance, tracing every contour level.
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+
+        Input:
+            - Elevation map data (array or nested list, NaN for NoData)
+            - Contour interval
+
+        Output:
+            - Contours data instance
+        '''
+        grid = np.asarray(grid, dtype=np.float64)
+        self.interval = interval
+        self.nrows, self.ncols = grid.shape
+        self.levels = contour_levels(grid, interval)
+        self.lines = []     # (level, array of x, y points in cells)
+
+        if self.nrows < 2 or self.ncols < 2:
+            return
+
+        for level in self.levels:
+            segments, edge_x, edge_y = level_segments(grid, level)
+
+            for line in join_segments(segments):
+                self.lines.append((level, np.column_stack((edge_x[line],
+                                                           edge_y[line]))))
+
+
+    def overlay(self, ax, **kwargs):
+        '''
+        Use this method to draw the contour lines over a Matplotlib sub plot
+        (axes coordinates in cells, as pyramid.Pyramid).
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+
+        Input:
+            - Matplotlib sub plot (Axes)
+            - Matplotlib LineCollection arguments
+
+        Output:
+            - Matplotlib LineCollection
+        '''
+        kwargs.setdefault('colors', 'saddlebrown')
+        kwargs.setdefault('linewidths', 0.5)
+
+        return ax.add_collection(LineCollection(
+                                    [points for level, points in self.lines],
+                                    **kwargs))
+
+
+    def map_lines(self, x_origin, y_origin, cellsize):
+        '''
+        Use this method to convert the contour lines to map coordinates.
+        Points are traced between cell centres, so cell (0, 0) is half a
+        cell in from the top left corner.
+
+        Triggered by:
+            - write_geojson
+            - any python program
+
+        Input:
+            - Lower left corner map reference (x, y)
+            - Cell size
+
+        Output:
+            - List of (level, array of x, y points in map coordinates)
+        '''
+        lines = []
+
+        for level, points in self.lines:
+            x = x_origin + (points[:, 0] + 0.5) * cellsize
+            y = y_origin + (self.nrows - points[:, 1] - 0.5) * cellsize
+            lines.append((level, np.column_stack((x, y))))
+
+        return lines
+
+
+    def write_geojson(self, file_name, x_origin, y_origin, cellsize):
+        '''
+        Use this method to write the contour lines as a GeoJSON feature
+        collection of LineStrings, each with its elevation.
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+
+        Input:
+            - Output file name
+            - Lower left corner map reference (x, y)
+            - Cell size
+
+        Output:
+            - Output file
+        '''
+        features = [{'type': 'Feature',
+                     'properties': {'elevation': level},
+                     'geometry': {'type': 'LineString',
+                                  'coordinates': np.round(points, 3).tolist()}}
+                    for level, points in self.map_lines(x_origin, y_origin,
+                                                        cellsize)]
+
+        with open(file_name, 'w') as f:
+            json.dump({'type': 'FeatureCollection', 'features': features}, f)
@@ -0,0 +1,283 @@
+'''
+Cost Distance Calculations
+
+Purpose:
+    - Accumulates the travel cost (walking time, minutes) from source
+      points (e.g. huts or car parks) given in map coordinates to every
+      cell of the terrain, for ski-touring and access route planning
+    - Traces the least cost route from the nearest source to each target
+      point
+
+Developer Note:
+    - Travel is between the 8 neighbouring cells (E, SE, S, SW, W, NW, N,
+      NE, as the Neighbourhood).  The time of each move is its length
+      over Tobler's hiking speed (6 km/h x e^(-3.5 |rise / run + 0.05|)),
+      so a move uphill costs more than the same move downhill, and gentle
+      downhill is quickest.
+    - Cells steeper than the maximum slope (slope map from
+      Neighbourhood.slope_aspect, degrees) and NoData cells are barriers.
+      A source cell is always left, however steep.
+    - Dijkstra's algorithm with a binary heap (heapq): each cell is
+      settled once, at its least cost, and stale heap entries are skipped
+      when popped.  The terrain is held as flat lists with a 1 cell
+      barrier border, so neighbours are found by adding an offset with no
+      edge checks - this keeps the loop fast enough for rasters of
+      millions of cells.
+    - The direction each cell was reached from is kept, so a route is
+      traced back from its target without searching again.
+
+Filename:
+    - costdistance.py
+
+Functions:
+    - read_points
+    - point_cell
+    - cost_distance
+    - least_cost_route
+    - write_routes
+
+Input:
+    - Elevation map data array (NaN for NoData)
+    - Slope map data array (degrees, NaN for NoData)
+    - Source and target points (map coordinates), maximum slope
+    - Map reference (lower left corner, cell size), resolution
+
+Output:
+    - Accumulated cost from the nearest source (array, NaN where not
+      reached)
+    - Least cost routes (cells, cost), GeoJSON file of the routes
+'''
+
+import sys
+import json
+import math
+import heapq
+import numpy as np
+
+
+# Row and column offsets of the 8 neighbours (E, SE, S, SW, W, NW, N, NE).
+MOVES = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0),
+         (-1, 1)]
+
+# Tobler's hiking function: 6 km/h at its best, which is 0.01 minutes per
+# metre.
+MINUTES_PER_METRE = 0.01
+TOBLER_RISE = 3.5
+TOBLER_OFFSET = 0.05
+
+
+def read_points(file_name):
+    '''
+    Use this function to read points, one x y pair (map coordinates, space
+    or comma separated) per line.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Points file name
+
+    Output:
+        - List of (x, y)
+        - Validation exceptions (not a pair of numbers)
+    '''
+    points = []
+
+    with open(file_name) as f:
+        for n, line in enumerate(f, 1):
+            fields = line.replace(',', ' ').split()
+            if not fields:
+                continue
+            try:
+                x, y = map(float, fields)
+            except ValueError:
+                sys.exit('Invalid point in line #' + str(n) + ' of '
+                         + file_name + '.')
+            points.append((x, y))
+
+    return points
+
+
+def point_cell(grid, x, y, x_origin, y_origin, cellsize):
+    '''
+    Use this function to find the cell a point is in.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Elevation map data array (NaN for NoData)
+        - Point x, y (map coordinates)
+        - Lower left corner map reference (x, y)
+        - Cell size
+
+    Output:
+        - Row, column of the cell
+        - Validation exceptions (outside the terrain or on NoData)
+    '''
+    y_limit, x_limit = grid.shape
+    r = y_limit - 1 - int(np.floor((y - y_origin) / cellsize))
+    c = int(np.floor((x - x_origin) / cellsize))
+
+    if not (0 <= r < y_limit and 0 <= c < x_limit) or np.isnan(grid[r, c]):
+        sys.exit('Point ' + f'{x:g} {y:g}'
+                 + ' is outside the terrain or on NoData.')
+
+    return r, c
+
+
+def cost_distance(elevation, slope_deg, sources, resolution, max_slope=45):
+    '''
+    Use this function to accumulate the least travel cost from the
+    sources to every cell.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Elevation map data (array or nested list, NaN for NoData)
+        - Slope map data (degrees, array or nested list, NaN for NoData)
+        - List of source cells (row, column)
+        - Resolution / cell size (metres)
+        - Maximum slope (degrees) that can be travelled over
+
+    Output:
+        - Accumulated cost, minutes (array, NaN where not reached)
+        - Direction each cell was reached from (array, index of MOVES
+          from the previous cell, -1 for a source or not reached)
+    '''
+    elevation = np.asarray(elevation, dtype=np.float64)
+    slope_deg = np.asarray(slope_deg, dtype=np.float64)
+    y_limit, x_limit = elevation.shape
+    width = x_limit + 2
+
+    # Flat lists with a barrier border (1 = can be entered).
+    passable = np.zeros((y_limit + 2, width), dtype=np.uint8)
+    with np.errstate(invalid='ignore'):
+        passable[1:-1, 1:-1] = ~np.isnan(elevation) & (slope_deg <= max_slope)
+    heights = np.zeros((y_limit + 2, width))
+    heights[1:-1, 1:-1] = np.nan_to_num(elevation)
+
+    state = bytearray(passable.tobytes())
+    heights = heights.ravel().tolist()
+    best = [math.inf] * len(heights)
+    back = bytearray(len(heights))
+
+    # Offset, minutes per metre of the move's length and 1 / length.
+    moves = [(dy * width + dx,
+              math.hypot(dy, dx) * resolution * MINUTES_PER_METRE,
+              1 / (math.hypot(dy, dx) * resolution), k + 1)
+             for k, (dy, dx) in enumerate(MOVES)]
+
+    heap = []
+    for r, c in sources:
+        i = (r + 1) * width + c + 1
+        best[i] = 0.0
+        state[i] = 1
+        heap.append((0.0, i))
+    heapq.heapify(heap)
+
+    exp = math.exp
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+
+    while heap:
+        cost, i = heappop(heap)
+        if not state[i]:
+            continue
+
+        # Settled - never entered again.
+        state[i] = 0
+        z = heights[i]
+
+        for offset, minutes, inv, k in moves:
+            j = i + offset
+            if state[j]:
+                gradient = (heights[j] - z) * inv + TOBLER_OFFSET
+                if gradient < 0:
+                    gradient = -gradient
+                total = cost + minutes * exp(TOBLER_RISE * gradient)
+                if total < best[j]:
+                    best[j] = total
+                    back[j] = k
+                    heappush(heap, (total, j))
+
+    best = np.array(best).reshape(y_limit + 2, width)[1:-1, 1:-1]
+    best[np.isinf(best)] = np.nan
+    back = np.frombuffer(bytes(back), dtype=np.uint8) \
+             .reshape(y_limit + 2, width)[1:-1, 1:-1].astype(np.int8) - 1
+
+    return best, back
+
+
+def least_cost_route(cost, back, r, c):
+    '''
+    Use this function to trace the least cost route back from a target
+    cell to its nearest source.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Accumulated cost and direction each cell was reached from (see
+          cost_distance)
+        - Target row, column
+
+    Output:
+        - Cells of the route (list of row, column) from the source to the
+          target, empty if the target can not be reached
+    '''
+    if np.isnan(cost[r, c]):
+        return []
+
+    route = [(r, c)]
+
+    while back[r, c] >= 0:
+        dy, dx = MOVES[back[r, c]]
+        r, c = r - dy, c - dx
+        route.append((r, c))
+
+    route.reverse()
+
+    return route
+
+
+def write_routes(file_name, routes, costs, nrows, x_origin, y_origin,
+                 cellsize):
+    '''
+    Use this function to write least cost routes as a GeoJSON feature
+    collection of LineStrings (cell centres), each with its cost.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Output file name
+        - Routes (lists of row, column) and their costs (minutes)
+        - No. of rows in the terrain
+        - Lower left corner map reference (x, y)
+        - Cell size
+
+    Output:
+        - Output file
+    '''
+    features = []
+
+    for route, cost in zip(routes, costs):
+        points = np.array(route, dtype=np.float64).reshape(-1, 2)
+        x = x_origin + (points[:, 1] + 0.5) * cellsize
+        y = y_origin + (nrows - points[:, 0] - 0.5) * cellsize
+        features.append({'type': 'Feature',
+                         'properties': {'minutes': round(cost, 1)},
+                         'geometry': {'type': 'LineString',
+                                      'coordinates': np.round(
+                                          np.column_stack((x, y)), 3)
+                                          .tolist()}})
+
+    with open(file_name, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
@@ -0,0 +1,125 @@
+'''
+Sink and Flat Area Diagnostics
+
+Purpose:
+    - Labels connected regions of sink cells (no downhill neighbour) and
+      flat cells (2 or more D8 directions with the same maximum slope)
+    - Reports the number, size and extent of the regions, so that
+      expensive sink filling or tie resolution can be seen before it runs
+
+Filename:
+    - diagnostics.py
+
+Functions:
+    - label_regions
+    - region_report
+
+Input:
+    - Mask of cells to be labelled (rows x columns)
+
+Output:
+    - Label array (0 = not in a region, 1... = region number)
+    - Region sizes and bounding boxes
+'''
+
+import numpy as np
+import neighbourhood as nbh
+
+
+def label_regions(mask):
+    '''
+    Use this function to label the 8-connected regions of a mask.
+
+    Each masked cell is added to a region once and each of its neighbours
+    is checked once, so the time taken is linear in the number of cells.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Mask array or nested list (True for cells to be labelled)
+
+    Output:
+        - Label array (0 = not in a region, 1... = region number)
+        - List of regions (label, no. of cells,
+          (first row, first column, last row, last column)),
+          largest region first
+    '''
+    mask = np.asarray(mask, dtype=bool)
+    y_limit, x_limit = mask.shape
+    in_mask = mask.ravel().tolist()
+    labels = [0] * (y_limit * x_limit)
+    regions = []
+
+    for start in np.flatnonzero(mask).tolist():
+
+        # Already part of an earlier region.
+        if labels[start]:
+            continue
+
+        label = len(regions) + 1
+        labels[start] = label
+        to_visit = [start]
+        size = 0
+        top, left = divmod(start, x_limit)
+        bottom, right = top, left
+
+        while to_visit:
+            r, c = divmod(to_visit.pop(), x_limit)
+            size += 1
+            top, bottom = min(top, r), max(bottom, r)
+            left, right = min(left, c), max(right, c)
+
+            for dy, dx in nbh.D8_OFFSETS:
+                y, x = r + dy, c + dx
+                if 0 <= y < y_limit and 0 <= x < x_limit:
+                    i = y * x_limit + x
+                    if in_mask[i] and not labels[i]:
+                        labels[i] = label
+                        to_visit.append(i)
+
+        regions.append((label, size, (top, left, bottom, right)))
+
+    regions.sort(key=lambda region: region[1], reverse=True)
+
+    return np.array(labels, dtype=np.int32).reshape(mask.shape), regions
+
+
+def region_report(title, regions, cell_count, max_listed=10):
+    '''
+    Use this function to summarise labelled regions for display.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Report title (e.g. 'Sink')
+        - List of regions from label_regions
+        - Total number of terrain cells
+        - Maximum number of regions listed individually
+
+    Output:
+        - Report text
+    '''
+    region_cells = sum(region[1] for region in regions)
+
+    lines = [title + ' regions: ' + str(len(regions))
+             + ', cells: ' + str(region_cells)
+             + ' (' + f'{100 * region_cells / cell_count:.1f}'
+             + '% of terrain)']
+
+    if regions:
+        lines.append(' - largest region (cells): ' + str(regions[0][1])
+                     + ', mean region (cells): '
+                     + f'{region_cells / len(regions):.1f}')
+
+    for label, size, (top, left, bottom, right) in regions[:max_listed]:
+        lines.append(' - #' + str(label) + ': ' + str(size) + ' cells, rows '
+                     + str(top) + '-' + str(bottom) + ', columns '
+                     + str(left) + '-' + str(right))
+
+    if len(regions) > max_listed:
+        lines.append(' - ... ' + str(len(regions) - max_listed)
+                     + ' other regions not listed')
+
+    return '\n'.join(lines)
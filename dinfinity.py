@@ -0,0 +1,103 @@
+'''
+D-infinity Flow Direction Calculations
+
+Purpose:
+    - Calculates the steepest downhill slope and its direction of every
+      terrain cell using the D-infinity method (Tarboton, 1997)
+
+Developer Note:
+    - D8 (Neighbourhood.slope_aspect) only looks at the 8 neighbours, so
+      the aspect is limited to 45 degree steps and cells can have several
+      equally steep directions that need resolving.  D-infinity fits a
+      plane to each of the 8 triangular facets around the processing cell,
+      giving a continuous aspect, so no tie resolution is needed.
+
+Filename:
+    - dinfinity.py
+
+Functions:
+    - dinf_slope_aspect
+
+Input:
+    - Processing cell and neighbour arrays (neighbourhood.neighbour_stack)
+    - Terrain resolution / cell size
+    - Fill sinks indicator
+
+Output:
+    - Slope array (rise over run)
+    - Aspect array (degrees, clockwise from North)
+'''
+
+import numpy as np
+
+
+# Triangular facets as (orthogonal neighbour, diagonal neighbour,
+# facet base angle multiplier, facet direction), using the neighbour
+# numbering of the Neighbourhood class (East = 0, working clockwise).
+FACETS = ((0, 7, 0, 1), (6, 7, 1, -1), (6, 5, 1, 1), (4, 5, 2, -1),
+          (4, 3, 2, 1), (2, 3, 3, -1), (2, 1, 3, 1), (0, 1, 4, -1))
+
+
+def dinf_slope_aspect(centre, neighbours, resolution, fill_sinks=False):
+    '''
+    Use this function to calculate the D-infinity slope and aspect of every
+    terrain cell at once.
+
+    Cells without a downhill facet have NaN slope and aspect, unless sinks
+    are being filled, when cells away from the edges are given a slope of 0
+    towards the lowest neighbour (as Neighbourhood.sink_fill does).  Flat
+    cells are given a slope of 0 and the direction of the first flat facet.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Processing cell array (NaN for NoData)
+        - Neighbour array (East first, working clockwise)
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+
+    Output:
+        - Slope array (rise over run)
+        - Aspect array (degrees, clockwise from North)
+    '''
+    facet_slope = np.empty((8,) + centre.shape)
+    facet_angle = np.empty((8,) + centre.shape)
+
+    for f, (e1, e2, base, direction) in enumerate(FACETS):
+        s1 = (centre - neighbours[e1]) / resolution
+        s2 = (neighbours[e1] - neighbours[e2]) / resolution
+        angle = np.arctan2(s2, s1)
+        slope = np.hypot(s1, s2)
+
+        # Steepest direction falls outside of the facet - use its edges.
+        slope = np.where(angle < 0, s1, slope)
+        angle = np.where(angle < 0, 0.0, angle)
+        outside = angle > np.pi / 4
+        slope = np.where(outside, (centre - neighbours[e2])
+                                  / (resolution * np.sqrt(2)), slope)
+        angle = np.where(outside, np.pi / 4, angle)
+
+        facet_slope[f] = slope
+        facet_angle[f] = direction * angle + base * np.pi / 2
+
+    # Steepest facet (counter-clockwise from East) converted to aspect.
+    steepest = np.argmax(np.nan_to_num(facet_slope, nan=-np.inf), axis=0)
+    slope = np.take_along_axis(facet_slope, steepest[None], axis=0)[0]
+    angle = np.take_along_axis(facet_angle, steepest[None], axis=0)[0]
+    aspect = np.mod(90 - np.degrees(angle), 360)
+
+    # No downhill facet.
+    sink = ~(slope >= 0)
+    slope[sink] = np.nan
+    aspect[sink] = np.nan
+
+    if fill_sinks:
+        interior = np.zeros(centre.shape, dtype=bool)
+        interior[1:-1, 1:-1] = True
+        fill = sink & interior & ~np.isnan(centre)
+        lowest = np.argmin(neighbours, axis=0)
+        slope[fill] = 0.0
+        aspect[fill] = np.mod(90 + 45 * lowest[fill], 360)
+
+    return slope, aspect
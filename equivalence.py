@@ -0,0 +1,655 @@
+'''
+Equivalence Checks
+Started from the command line
+
+Purpose:
+    - Checks that every other way of calculating slope and aspect gives
+      the same results as the reference Neighbourhood path of
+      tothemaxmain.py, so a faster engine can be used with confidence
+    - Runs each engine on the shipped datasets (snow.slope, NN22.asc) and
+      on generated edge case rasters:
+        - flat:          every cell the same height
+        - nodata_border: NoData around the edge, random cells inside
+        - single_row:    1 row
+        - single_column: 1 column
+        - sinks:         a pit at every other cell
+        - ties:          random cells from a small range (many D8 ties)
+    - Reports the no. of cells that differ from the reference path (slope
+      as a percentage, in degrees and aspect, as written to the output
+      files) and the time taken, side by side
+    - Also checks the reference path against the shipped output files
+      (slope_map_perc_1/2.txt, slope_map_deg_1/2.txt, aspect_map_1/2.txt)
+    - An engine (or the reference path) that fails is reported with its
+      error, and the other engines are still run
+
+Developer Note:
+    - Engines that write output files are run in a temporary directory.
+    - Slope is compared rounded to 1 decimal place, as in the output files.
+      NaN (NoData) cells are the same as each other.
+    - If the reference path fails, the engines are still run and timed,
+      but there is nothing to compare them with, so the run fails.
+    - The checkpoint engine is stopped part way through the rows, resumed
+      and stopped after the first tie loop, then resumed to the end.
+
+Filename:
+    - equivalence.py
+
+Functions:
+    - gradient_maps
+    - reference_maps
+    - storage_engine
+    - pipeline_maps
+    - window_maps
+    - mosaic_maps
+    - shard_maps
+    - incremental_maps
+    - core_maps
+    - checkpoint_maps
+    - edge_cases
+    - compare
+    - check
+
+Input:
+    - Resolution / cell size, fill sinks indicator
+    - Engines to check (default all)
+
+Output:
+    - Report of differences and timings (exit status 1 if any engine
+      differs or fails)
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import neighbourhood as nbh
+import pipeline as ppl
+import mosaic
+import shard
+import incremental as inc
+import tothemaxcore as core
+import checkpoint as ckp
+import surface
+
+
+DICT_ASPECT = {1:90, 2:135, 4:180, 8:225, 16:270, 32:315, 64:0, 128:45}
+SHIPPED = {'snow.slope': '1', 'NN22.asc': '2'}
+MAP_NAMES = ('slope_map_perc', 'slope_map_deg', 'aspect_map')
+
+
+def gradient_maps(gradient):
+    '''
+    Use this function to collect the slope and aspect map data of a
+    Gradient (rows of Neighbourhood instances) as arrays.
+
+    Triggered by:
+        - reference_maps
+        - pipeline_maps
+        - incremental_maps
+
+    Input:
+        - Gradient
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    return tuple(np.array([[getattr(cell, name) for cell in row]
+                           for row in gradient], dtype=np.float64)
+                 for name in ('slope_perc', 'slope_deg', 'aspect'))
+
+
+def reference_maps(dataset, resolution, fill_sinks, storage=None,
+                   decimals=0):
+    '''
+    Use this function to calculate slope and aspect as tothemaxmain.py
+    does: a Neighbourhood for every cell, row by row, then the D8 ties
+    resolved until no more change.
+
+    Triggered by:
+        - check
+        - storage_engine
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Elevation storage type and decimal places (optional)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset, storage=storage,
+                                    decimals=decimals)
+    terrain.read_raster()
+    terrain.close_raster()
+    y_limit, x_limit = len(terrain.cells), len(terrain.cells[0])
+    gradient = [[None] * x_limit for r in range(y_limit)]
+
+    for r in range(y_limit):
+        for c in range(x_limit):
+            cell = nbh.Neighbourhood(terrain.cells, resolution, r, c)
+
+            if cell.centre == terrain.nodata_value:
+                terrain.cells[r][c] = np.nan
+
+            cell.slope_aspect(DICT_ASPECT, terrain.nodata_value)
+
+            if fill_sinks and cell.slope == -np.inf:
+                cell.sink_fill(DICT_ASPECT)
+
+            gradient[r][c] = cell
+
+    keep_looping = True
+    while keep_looping:
+        keep_looping = False
+        for r in range(y_limit):
+            for c in range(x_limit):
+                if len(gradient[r][c].d8) > 1 \
+                        and nbh.resolve_tie(gradient, r, c, DICT_ASPECT):
+                    keep_looping = True
+
+    return gradient_maps(gradient)
+
+
+def storage_engine(storage, decimals):
+    '''
+    Use this function to make an engine using reduced precision storage.
+
+    Triggered by:
+        - ENGINES
+
+    Input:
+        - Elevation storage type
+        - Decimal places kept by integer storage
+
+    Output:
+        - Engine function
+    '''
+    def engine(dataset, resolution, fill_sinks, work_dir):
+        return reference_maps(dataset, resolution, fill_sinks, storage,
+                              decimals)
+
+    return engine
+
+
+def pipeline_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to calculate slope and aspect with pipeline.py, in
+    small blocks so that block edges are crossed.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (output files)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+
+    with contextlib.chdir(work_dir):
+        gradient = ppl.run(terrain, resolution, DICT_ASPECT, fill_sinks,
+                           'B', 'Y', block_rows=7)
+
+    terrain.close_raster()
+
+    return gradient_maps(gradient)
+
+
+def window_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to calculate slope and aspect as a single tile
+    mosaic (as timeseries.py).
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (not used)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+    terrain.read_raster()
+    terrain.close_raster()
+    tile = (0, 0, len(terrain.cells), len(terrain.cells[0]))
+
+    *maps, ties = mosaic.calculate_window(terrain.cells, 0, 0, tile,
+                                          resolution, DICT_ASPECT,
+                                          terrain.nodata_value, fill_sinks)
+    resolved = mosaic.resolve_ties(tile[2], tile[3],
+                                   mosaic.known_cells(tile, maps[2], ties),
+                                   ties, DICT_ASPECT)
+    for (r, c), aspect in resolved.items():
+        maps[2][r][c] = aspect
+
+    return tuple(np.array(grid, dtype=np.float64) for grid in maps)
+
+
+def mosaic_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to split the terrain into 2 x 2 tiles (with header
+    data) and calculate slope and aspect with mosaic.py.  Terrain too small
+    to split is calculated as one tile.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (tile and map data files)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+    terrain.read_raster()
+    terrain.close_raster()
+    grid = np.array(terrain.cells, dtype=np.float64)
+    y_limit, x_limit = grid.shape
+
+    # Tiles 2 columns wide would look like header data.
+    row_splits = [0, y_limit // 2, y_limit] if y_limit > 1 else [0, y_limit]
+    col_splits = [0, x_limit // 2, x_limit] if x_limit > 5 else [0, x_limit]
+
+    file_names = []
+    for top, bottom in zip(row_splits, row_splits[1:]):
+        for left, right in zip(col_splits, col_splits[1:]):
+            file_name = os.path.join(work_dir, 'tile_' + str(len(file_names))
+                                     + '.asc')
+            with open(file_name, 'w') as f:
+                f.write('ncols ' + str(right - left) + '\nnrows '
+                        + str(bottom - top) + '\nxllcorner '
+                        + str(left * resolution) + '\nyllcorner '
+                        + str((y_limit - bottom) * resolution)
+                        + '\ncellsize ' + str(resolution) + '\nNODATA_value '
+                        + str(terrain.nodata_value) + '\n')
+                for row in grid[top:bottom, left:right].tolist():
+                    f.write(' '.join(f'{cell:g}' for cell in row) + '\n')
+            file_names.append(file_name)
+
+    tiles = mosaic.Mosaic(file_names)
+    files = tiles.calculate(resolution, DICT_ASPECT, fill_sinks,
+                            directory=work_dir)
+    result = [np.full(grid.shape, np.nan) for m in range(3)]
+
+    for (first_row, first_col, nrows, ncols, _), tile_files in \
+            zip(tiles.tiles, files):
+        for m in range(3):
+            result[m][first_row:first_row + nrows,
+                      first_col:first_col + ncols] = \
+                np.genfromtxt(tile_files[m]).reshape(nrows, ncols)
+
+    return tuple(result)
+
+
+def shard_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to calculate slope and aspect with shard.py (plan,
+    work and merge), about 2 x 2 shards, reading back the merged output
+    files.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (shard and output files)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+    terrain.read_raster()
+    terrain.close_raster()
+    y_limit, x_limit = len(terrain.cells), len(terrain.cells[0])
+    directory = os.path.join(work_dir, 'shards')
+
+    with contextlib.chdir(work_dir):
+        shard.plan(dataset, directory, max(-(-y_limit // 2), 1),
+                   max(-(-x_limit // 2), 3), resolution,
+                   'Y' if fill_sinks else 'N')
+        shard.work(directory)
+        shard.merge(directory)
+
+        return tuple(np.genfromtxt(name + '.txt').reshape(y_limit, x_limit)
+                     for name in MAP_NAMES)
+
+
+def incremental_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to calculate slope and aspect with incremental.py.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (not used)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+    terrain.read_raster()
+    terrain.close_raster()
+
+    return gradient_maps(inc.IncrementalGradient(terrain, resolution,
+                                                 DICT_ASPECT,
+                                                 fill_sinks).gradient)
+
+
+def core_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to calculate slope and aspect with tothemaxcore.py,
+    from an elevation array (NaN for NoData).
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (not used)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+    terrain.read_raster()
+    terrain.close_raster()
+    elevation = np.array(terrain.cells, dtype=np.float64)
+    elevation[elevation == terrain.nodata_value] = np.nan
+
+    result = core.calculate(elevation, resolution, fill_sinks,
+                            nodata_value=terrain.nodata_value)
+
+    return result.slope_perc, result.slope_deg, result.aspect
+
+
+class StopRun(Exception):
+    '''
+    Run stopped part way through (checkpoint engine).
+    '''
+
+
+class StoppingCheckpoint(ckp.Checkpoint):
+    '''
+    Checkpoint saved every time it is checked, which stops the run after a
+    no. of saves, as if the run had been killed.
+    '''
+
+    def __init__(self, dataset, settings, stop_after):
+        super().__init__(dataset, settings, interval=1)
+        self.stop_after = stop_after
+        self.saves = 0
+
+
+    def due(self):
+        return True
+
+
+    def save(self):
+        super().save()
+        self.saves += 1
+        if self.saves == self.stop_after:
+            raise StopRun
+
+
+def checkpoint_maps(dataset, resolution, fill_sinks, work_dir):
+    '''
+    Use this function to calculate slope and aspect with tothemaxcore.py
+    and checkpoints (checkpoint.py), stopping and resuming the run half
+    way through the rows and again after the first tie loop.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Dataset URL
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Temporary directory (checkpoint files)
+
+    Output:
+        - Slope as a percentage, slope in degrees and aspect arrays
+    '''
+    settings = {'resolution': resolution, 'fill_sinks': fill_sinks}
+
+    with contextlib.chdir(work_dir):
+        for run in range(3):
+            terrain = surface.SurfaceRaster(dataset)
+            terrain.read_raster()
+            terrain.close_raster()
+            y_limit = len(terrain.cells)
+
+            # Stopped half way through the rows, then after the remaining
+            # rows and the first tie loop, then not stopped.
+            if run == 0:
+                checkpoint = StoppingCheckpoint(dataset, settings,
+                                                max(y_limit // 2, 1))
+            else:
+                checkpoint = StoppingCheckpoint(dataset, settings, 0)
+                checkpoint.load()
+                if run == 1:
+                    checkpoint.stop_after = y_limit + 1 \
+                                            - checkpoint.state['rows_done']
+
+            try:
+                result = core.calculate(terrain, resolution, fill_sinks,
+                                        d8_dict=DICT_ASPECT,
+                                        checkpoint=checkpoint)
+                break
+            except StopRun:
+                continue
+
+        checkpoint.remove()
+
+    return result.slope_perc, result.slope_deg, result.aspect
+
+
+ENGINES = {'float32': storage_engine('float32', 0),
+           'int16': storage_engine('int16', 1),
+           'int32': storage_engine('int32', 1),
+           'pipeline': pipeline_maps,
+           'window': window_maps,
+           'mosaic': mosaic_maps,
+           'shard': shard_maps,
+           'incremental': incremental_maps,
+           'core': core_maps,
+           'checkpoint': checkpoint_maps}
+
+
+def edge_cases(directory):
+    '''
+    Use this function to write the edge case rasters.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Directory
+
+    Output:
+        - Dictionary of edge case name: dataset URL
+    '''
+    rng = np.random.default_rng(5003)
+    r, c = np.indices((12, 12))
+    grids = {'flat': np.full((12, 12), 100),
+             'nodata_border': np.pad(rng.integers(0, 50, (10, 10)), 1,
+                                     constant_values=-9999),
+             'single_row': rng.integers(0, 50, (1, 15)),
+             'single_column': rng.integers(0, 50, (15, 1)),
+             'sinks': np.where((r % 2 == 0) & (c % 2 == 0), 5, 10),
+             'ties': rng.integers(0, 3, (16, 16))}
+    grids['ties'][5:8, 6:9] = -9999
+
+    datasets = {}
+    for name, grid in grids.items():
+        datasets[name] = os.path.join(directory, name + '.asc')
+        with open(datasets[name], 'w') as f:
+            f.write('ncols ' + str(grid.shape[1]) + '\nnrows '
+                    + str(grid.shape[0]) + '\nNODATA_value -9999\n')
+            for row in grid.tolist():
+                f.write(' '.join(map(str, row)) + '\n')
+
+    return datasets
+
+
+def compare(maps, reference):
+    '''
+    Use this function to count the cells that differ, as written to the
+    output files.
+
+    Triggered by:
+        - check
+
+    Input:
+        - Slope as a percentage, slope in degrees and aspect arrays
+        - Reference arrays
+
+    Output:
+        - No. of cells that differ in each map (None if the map size
+          differs)
+    '''
+    counts = []
+
+    for m, (grid, ref) in enumerate(zip(maps, reference)):
+        if grid.shape != ref.shape:
+            counts.append(None)
+            continue
+        if m < 2:
+            grid, ref = np.round(grid, 1), np.round(ref, 1)
+        same = (grid == ref) | (np.isnan(grid) & np.isnan(ref))
+        counts.append(int(np.sum(~same)))
+
+    return counts
+
+
+def check(datasets, engines, resolution=50, fill_sinks=True):
+    '''
+    Use this function to run the reference path and each engine on each
+    dataset and report the differences and timings.
+
+    Triggered by:
+        - Command line
+
+    Input:
+        - Dictionary of dataset name: dataset URL
+        - Engine names
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+
+    Output:
+        - Report (printed)
+        - True if every engine matched the reference path
+    '''
+    matched = True
+    print(f"{'Dataset':<14} {'Engine':<12} {'Seconds':>8} {'Speedup':>8} "
+          + f"{'Perc':>6} {'Deg':>6} {'Aspect':>6}  Result")
+
+    def report(name, engine, seconds, speedup, counts):
+        nonlocal matched
+        same = all(count == 0 for count in counts)
+        matched = matched and same
+        print(f'{name:<14} {engine:<12} {seconds:>8} {speedup:>8} '
+              + ' '.join(f"{'size' if count is None else count:>6}"
+                         for count in counts)
+              + ('  match' if same else '  DIFFERENT'))
+
+    def failed(name, engine, error):
+        nonlocal matched
+        matched = False
+        print(f'{name:<14} {engine:<12} {"":>8} {"":>8} {"":>20}  ERROR '
+              + type(error).__name__ + ': ' + str(error))
+
+    for name, dataset in datasets.items():
+        start = time.perf_counter()
+        try:
+            reference = reference_maps(dataset, resolution, fill_sinks)
+        except (Exception, SystemExit) as error:
+            failed(name, 'reference', error)
+            reference = None
+        base = time.perf_counter() - start
+        if reference is not None:
+            print(f'{name:<14} {"reference":<12} {base:>8.3f}')
+
+        # Shipped output files (made with resolution 50, sinks filled).
+        if name in SHIPPED and resolution == 50 and fill_sinks \
+                and reference is not None:
+            folder = os.path.dirname(os.path.abspath(__file__))
+            shipped = tuple(np.genfromtxt(os.path.join(
+                                folder, map_name + '_' + SHIPPED[name]
+                                + '.txt')) for map_name in MAP_NAMES)
+            report(name, 'shipped', '', '', compare(shipped, reference))
+
+        for engine in engines:
+            with tempfile.TemporaryDirectory() as work_dir:
+                start = time.perf_counter()
+                try:
+                    maps = ENGINES[engine](dataset, resolution, fill_sinks,
+                                           work_dir)
+                except (Exception, SystemExit) as error:
+                    failed(name, engine, error)
+                    continue
+                seconds = time.perf_counter() - start
+
+            if reference is None:
+                print(f'{name:<14} {engine:<12} {seconds:>8.3f}')
+            else:
+                report(name, engine, f'{seconds:.3f}',
+                       f'{base / seconds:.2f}x', compare(maps, reference))
+
+    return matched
+
+
+#----------------------------------------------------------
+# Command line: check the engines.
+#----------------------------------------------------------
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engines', dest='engines', nargs='+',
+                        default=list(ENGINES), choices=list(ENGINES),
+                        help='Engines checked (default all)')
+    parser.add_argument('--filenames', dest='file_names', nargs='*',
+                        default=None, help='Datasets checked (default '
+                        + 'snow.slope, NN22.asc and the edge cases)')
+    parser.add_argument('--resolution', dest='resolution', type=int,
+                        default=50, help='Resolution / cell size (metres, '
+                        + 'integer)')
+    parser.add_argument('--fillsinks', dest='fill_sinks', default='Y',
+                        help='Fill in sinks / holes (Y/N)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as case_dir:
+        if args.file_names is None:
+            folder = os.path.dirname(os.path.abspath(__file__))
+            datasets = {name: os.path.join(folder, name) for name in SHIPPED}
+            datasets.update(edge_cases(case_dir))
+        else:
+            datasets = {os.path.basename(name): os.path.abspath(name)
+                        for name in args.file_names}
+
+        matched = check(datasets, args.engines, args.resolution,
+                        args.fill_sinks.upper() == 'Y')
+
+    sys.exit(0 if matched else 1)
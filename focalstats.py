@@ -0,0 +1,167 @@
+'''
+Focal Statistics Calculations
+
+Purpose:
+    - Calculates curvature and terrain roughness measures of every
+      terrain cell from its 3 x 3 Neighbourhood
+    - Calculates the Topographic Position Index over larger windows using
+      summed-area tables, so the cost does not grow with the window size
+
+Developer Note:
+    - The 3 x 3 measures use the same neighbour arrays as the hillshade
+      (neighbourhood.neighbour_stack), so the terrain window is only
+      extracted once however many outputs are requested.
+
+Filename:
+    - focalstats.py
+
+Functions:
+    - curvature
+    - roughness
+    - summed_area_table
+    - window_tpi
+
+Input:
+    - Processing cell and neighbour arrays (neighbourhood.neighbour_stack)
+    - Terrain resolution / cell size
+    - TPI window radius (cells)
+
+Output:
+    - Plan and profile curvature arrays
+    - TRI, TPI and roughness arrays
+'''
+
+import numpy as np
+
+
+def curvature(centre, neighbours, resolution):
+    '''
+    Use this function to calculate the plan and profile curvature of every
+    terrain cell (Zevenbergen and Thorne method).
+
+    Values are in 1/100 z units, positive for a convex profile and for a
+    convex (diverging) plan form.  Flat cells have no curvature.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Processing cell array
+        - Neighbour array (East first, working clockwise)
+        - Terrain resolution / cell size
+
+    Output:
+        - Plan curvature array
+        - Profile curvature array
+    '''
+    e, se, s, sw, w, nw, n, ne = neighbours
+    res_sq = resolution ** 2
+
+    d = ((w + e) / 2 - centre) / res_sq
+    f = ((n + s) / 2 - centre) / res_sq
+    g = (-nw + ne + sw - se) / (4 * res_sq)
+    dz_dx = (e - w) / (2 * resolution)
+    dz_dy = (n - s) / (2 * resolution)
+    grad_sq = dz_dx ** 2 + dz_dy ** 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        plan = 200 * (d * dz_dy ** 2 + f * dz_dx ** 2 - g * dz_dx * dz_dy) \
+               / grad_sq
+        profile = -200 * (d * dz_dx ** 2 + f * dz_dy ** 2
+                          + g * dz_dx * dz_dy) / grad_sq
+
+    plan[grad_sq == 0] = 0.0
+    profile[grad_sq == 0] = 0.0
+    plan[np.isnan(centre)] = np.nan
+    profile[np.isnan(centre)] = np.nan
+
+    return plan, profile
+
+
+def roughness(centre, neighbours):
+    '''
+    Use this function to calculate the terrain roughness measures of every
+    terrain cell from its 3 x 3 Neighbourhood.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Processing cell array
+        - Neighbour array (East first, working clockwise)
+
+    Output:
+        - Terrain Ruggedness Index (root of summed squared differences)
+        - Topographic Position Index (cell less mean of its neighbours)
+        - Roughness (range of the 9 cells)
+    '''
+    diff = neighbours - centre
+
+    tri = np.sqrt(np.sum(diff ** 2, axis=0))
+    tpi = centre - np.mean(neighbours, axis=0)
+    rough = np.maximum(np.max(neighbours, axis=0), centre) \
+            - np.minimum(np.min(neighbours, axis=0), centre)
+
+    return tri, tpi, rough
+
+
+def summed_area_table(grid):
+    '''
+    Use this function to build a summed-area table, padded with a leading
+    row and column of zeros so that any window sum is 4 lookups.
+
+    Triggered by:
+        - window_tpi
+        - any python program
+
+    Input:
+        - Array of values (NaN treated as 0)
+
+    Output:
+        - Summed-area table array (rows + 1 x columns + 1)
+    '''
+    table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1))
+    table[1:, 1:] = np.nan_to_num(grid).cumsum(axis=0).cumsum(axis=1)
+
+    return table
+
+
+def window_tpi(centre, radius):
+    '''
+    Use this function to calculate the Topographic Position Index of every
+    terrain cell over a (2 x radius + 1) square window, excluding the
+    processing cell.  Windows are clipped at the terrain boundaries and
+    NoData cells are left out of the mean.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Processing cell array (NaN for NoData)
+        - Window radius (cells)
+
+    Output:
+        - Topographic Position Index array
+    '''
+    y_limit, x_limit = centre.shape
+    valid = ~np.isnan(centre)
+
+    values = summed_area_table(centre)
+    counts = summed_area_table(valid.astype(np.float64))
+
+    # Window corners for every cell, clipped to the boundaries.
+    top = np.clip(np.arange(y_limit) - radius, 0, y_limit)[:, None]
+    bottom = np.clip(np.arange(y_limit) + radius + 1, 0, y_limit)[:, None]
+    left = np.clip(np.arange(x_limit) - radius, 0, x_limit)[None, :]
+    right = np.clip(np.arange(x_limit) + radius + 1, 0, x_limit)[None, :]
+
+    window_sum = values[bottom, right] - values[top, right] \
+                 - values[bottom, left] + values[top, left]
+    window_count = counts[bottom, right] - counts[top, right] \
+                   - counts[bottom, left] + counts[top, left]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tpi = centre - (window_sum - np.nan_to_num(centre)) \
+                       / (window_count - valid)
+
+    return tpi
@@ -0,0 +1,125 @@
+'''
+Hillshade Calculations
+
+Purpose:
+    - Calculates the surface slope and aspect of every terrain cell
+    - Calculates a hillshade (shaded relief) map from the surface slope
+      and aspect, for a single or multiple sun positions
+
+Developer Note:
+    - The D8 slope and aspect held by a Neighbourhood are the steepest
+      downhill drop to a single neighbour, with aspect in 45 degree steps.
+      Shading those gives a banded relief, so the hillshade uses the
+      surface slope and aspect (Horn method) of the same 3 x 3
+      Neighbourhood, calculated for all cells at once with numpy.
+
+Filename:
+    - hillshade.py
+
+Functions:
+    - surface_slope_aspect
+    - hillshade
+    - multi_hillshade
+
+Input:
+    - Processing cell and neighbour arrays (neighbourhood.neighbour_stack)
+    - Terrain resolution / cell size
+    - Sun azimuth and altitude (degrees)
+
+Output:
+    - Hillshade array (0 - 255, NaN for NoData cells)
+'''
+
+import numpy as np
+
+
+# Sun azimuths (degrees) combined for multi-directional hillshading.
+MULTI_AZIMUTHS = (225, 270, 315, 360)
+
+
+def surface_slope_aspect(centre, neighbours, resolution):
+    '''
+    Use this function to calculate the surface slope and aspect of every
+    terrain cell from its 3 x 3 Neighbourhood (Horn method).
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Processing cell array
+        - Neighbour array (East first, working clockwise)
+        - Terrain resolution / cell size
+
+    Output:
+        - Slope array (radians)
+        - Aspect array (radians, clockwise from North, downslope direction)
+    '''
+    e, se, s, sw, w, nw, n, ne = neighbours
+
+    # Rate of change West to East and North to South.
+    dz_dx = ((ne + 2 * e + se) - (nw + 2 * w + sw)) / (8 * resolution)
+    dz_dy = ((sw + 2 * s + se) - (nw + 2 * n + ne)) / (8 * resolution)
+
+    slope = np.arctan(np.hypot(dz_dx, dz_dy))
+    aspect = np.mod(np.arctan2(-dz_dx, dz_dy), 2 * np.pi)
+    slope[np.isnan(centre)] = np.nan
+
+    return slope, aspect
+
+
+def hillshade(slope, aspect, azimuth=315, altitude=45):
+    '''
+    Use this function to calculate the illumination of every terrain cell
+    from a single sun position.
+
+    Triggered by:
+        - tothemaxmain.py
+        - multi_hillshade
+
+    Input:
+        - Slope array (radians)
+        - Aspect array (radians, clockwise from North)
+        - Sun azimuth (degrees, clockwise from North)
+        - Sun altitude (degrees above the horizon)
+
+    Output:
+        - Hillshade array (0 - 255, NaN for NoData cells)
+    '''
+    zenith = np.radians(90 - altitude)
+    azimuth = np.radians(azimuth)
+
+    shade = 255 * (np.cos(zenith) * np.cos(slope)
+                   + np.sin(zenith) * np.sin(slope)
+                   * np.cos(azimuth - aspect))
+
+    return np.clip(shade, 0, 255)
+
+
+def multi_hillshade(slope, aspect, altitude=45):
+    '''
+    Use this function to calculate a multi-directional hillshade.  The
+    hillshades from each of MULTI_AZIMUTHS are combined, weighting each
+    sun position by how obliquely it lights the cell, so that slopes
+    facing towards or away from a single sun are not flattened out.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Slope array (radians)
+        - Aspect array (radians, clockwise from North)
+        - Sun altitude (degrees above the horizon)
+
+    Output:
+        - Hillshade array (0 - 255, NaN for NoData cells)
+    '''
+    shade = np.zeros(slope.shape)
+    weights = np.zeros(slope.shape)
+
+    for azimuth in MULTI_AZIMUTHS:
+        # Flat cells have no aspect, so every sun position counts equally.
+        weight = np.sin(aspect - np.radians(azimuth)) ** 2 + 1e-6
+        shade += weight * hillshade(slope, aspect, azimuth, altitude)
+        weights += weight
+
+    return shade / weights
@@ -0,0 +1,265 @@
+'''
+Incremental Gradient Data Object
+
+Purpose:
+    - Holds the Gradient (rows of Neighbourhood instances) of a terrain
+    - Applies a local edit to the terrain and recalculates slope, aspect
+      and D8 tie resolution only where they can change, so the cost of an
+      update depends on the size of the edit, not the size of the terrain
+
+Developer Note:
+    - Slope and aspect of a cell only depend on its 3 x 3 Neighbourhood,
+      so an edited rectangle plus a 1 cell margin is recalculated.
+    - A tied cell (2 or more D8 directions) is resolved from the aspect of
+      its neighbours, which may themselves be tied.  Tied cells form
+      connected flat regions that are resolved independently of each
+      other, so any flat region touching the recalculated cells is reset
+      and resolved again, in the same row by row order as tothemaxmain.py.
+    - A NoData cell is set to NaN when it is calculated, so a cell sees
+      the NoData neighbours before it (row by row) as NaN and those after
+      it as the NoData value, and a filled NoData cell (sink_fill) depends
+      on which.  The NoData values around the rectangle are put back and
+      set to NaN again in the same order as a full pass.
+    - The result is the same as recalculating the whole terrain.
+
+Filename:
+    - incremental.py
+
+Classes:
+    - IncrementalGradient
+
+Methods:
+    - calculate_cell
+    - update
+    - recalculate
+    - patch_maps
+
+Input:
+    - Terrain surface data instance (SurfaceRaster)
+    - Terrain resolution / cell size
+    - D8 dictionary
+    - Fill sinks indicator
+
+Output:
+    - Instance of IncrementalGradient class
+'''
+
+import math
+import neighbourhood as nbh
+
+
+#----------------------------------------------------------
+# IncrementalGradient Class
+#----------------------------------------------------------
+class IncrementalGradient():
+    '''
+    Gradient of a terrain that can be updated after local edits.
+    '''
+
+    def __init__(self, terrain, resolution, d8_dict, fill_sinks=False,
+                 gradient=None):
+        '''
+        Initialises data object instance.  If no Gradient is supplied, the
+        whole terrain is calculated.
+
+        Triggered by:
+            - any python program
+
+        Input:
+            - Terrain surface data instance (SurfaceRaster, after
+              read_raster, cells held as rows of Python floats)
+            - Terrain resolution / cell size
+            - D8 dictionary
+            - Fill sinks indicator (True / False)
+            - Gradient already calculated by tothemaxmain.py (optional)
+
+        Output:
+            - Incremental Gradient data instance
+        '''
+        self.terrain = terrain
+        self.resolution = resolution
+        self.d8_dict = d8_dict
+        self.fill_sinks = fill_sinks
+        self.y_limit = len(terrain.cells)
+        self.x_limit = len(terrain.cells[0])
+
+        if gradient is None:
+            self.gradient = [[None for i in range(self.x_limit)]
+                             for j in range(self.y_limit)]
+            self.recalculate(0, 0, self.y_limit, self.x_limit)
+        else:
+            self.gradient = gradient
+
+
+    def calculate_cell(self, r, c):
+        '''
+        Use this method to calculate the slope and aspect of one cell, as
+        tothemaxmain.py does, replacing its Neighbourhood instance.
+
+        Triggered by:
+            - recalculate
+
+        Input:
+            - Terrain processing cell row number
+            - Terrain processing cell column number
+
+        Output:
+            - Neighbourhood instance (tie not yet resolved)
+        '''
+        cell = nbh.Neighbourhood(self.terrain.cells, self.resolution, r, c)
+
+        # Handle NoData cell.
+        if cell.centre == self.terrain.nodata_value:
+            self.terrain.cells[r][c] = math.nan
+
+        cell.slope_aspect(self.d8_dict, self.terrain.nodata_value)
+
+        if self.fill_sinks and cell.slope == -math.inf:
+            cell.sink_fill(self.d8_dict)
+
+        self.gradient[r][c] = cell
+
+        return cell
+
+
+    def update(self, top, left, patch):
+        '''
+        Use this method to replace a rectangle of terrain cells and bring
+        the Gradient up to date.
+
+        Triggered by:
+            - any python program
+
+        Input:
+            - Row number of the top of the rectangle
+            - Column number of the left of the rectangle
+            - New elevation values (rows of cells, NoData value allowed)
+
+        Output:
+            - Cells (row, column) whose Neighbourhood has been replaced
+        '''
+        for r, row in enumerate(patch):
+            self.terrain.cells[top + r][left:left + len(row)] = list(row)
+
+        return self.recalculate(top - 1, left - 1,
+                                top + len(patch) + 1,
+                                left + len(patch[0]) + 1)
+
+
+    def recalculate(self, top, left, bottom, right):
+        '''
+        Use this method to recalculate a rectangle of cells, then resolve
+        again the ties of every flat region touching it.
+
+        Triggered by:
+            - __init__
+            - update
+            - any python program (e.g. after editing terrain.cells)
+
+        Input:
+            - Row number of the top of the rectangle
+            - Column number of the left of the rectangle
+            - Row number below the bottom of the rectangle
+            - Column number right of the right of the rectangle
+
+        Output:
+            - Cells (row, column) whose Neighbourhood has been replaced
+        '''
+        top, left = max(top, 0), max(left, 0)
+        bottom, right = min(bottom, self.y_limit), min(right, self.x_limit)
+        cells = self.terrain.cells
+        nodata_value = self.terrain.nodata_value
+
+        # NoData cells of the rectangle, the columns either side and the
+        # row below, as they were before a full pass reached the
+        # rectangle.  The row above has already been passed.
+        first, last = max(left - 1, 0), min(right + 1, self.x_limit)
+        for r in range(top, min(bottom + 1, self.y_limit)):
+            row = cells[r]
+            for c in range(first, last):
+                if math.isnan(row[c]):
+                    row[c] = nodata_value
+
+        changed = set()
+        for r in range(top, bottom):
+            row = cells[r]
+
+            # The cell to the left is passed before the row, and the cell
+            # to the right after it.
+            if left > 0 and row[first] == nodata_value:
+                row[first] = math.nan
+
+            for c in range(left, right):
+                self.calculate_cell(r, c)
+                changed.add((r, c))
+
+            if right < self.x_limit and row[last - 1] == nodata_value:
+                row[last - 1] = math.nan
+
+        if bottom < self.y_limit:
+            row = cells[bottom]
+            for c in range(first, last):
+                if row[c] == nodata_value:
+                    row[c] = math.nan
+
+        # Extend into the tied cells of the flat regions touching the
+        # rectangle.  Untied cells outside of the rectangle can not change.
+        to_visit = list(changed)
+        while to_visit:
+            r, c = to_visit.pop()
+            for dy, dx in nbh.D8_OFFSETS:
+                y, x = r + dy, c + dx
+                if 0 <= y < self.y_limit and 0 <= x < self.x_limit \
+                        and (y, x) not in changed:
+                    cell = nbh.Neighbourhood(self.terrain.cells,
+                                             self.resolution, y, x)
+                    cell.slope_aspect(self.d8_dict,
+                                      self.terrain.nodata_value)
+                    if len(cell.d8) > 1:
+                        self.gradient[y][x] = cell
+                        changed.add((y, x))
+                        to_visit.append((y, x))
+
+        # Resolve the ties, row by row, until no more can be resolved.
+        ties = sorted(cell for cell in changed
+                      if len(self.gradient[cell[0]][cell[1]].d8) > 1)
+        keep_looping = True
+
+        while keep_looping:
+            keep_looping = False
+
+            for r, c in ties:
+                if len(self.gradient[r][c].d8) > 1 \
+                        and nbh.resolve_tie(self.gradient, r, c,
+                                            self.d8_dict):
+                    keep_looping = True
+
+        return sorted(changed)
+
+
+    def patch_maps(self, cells, slope_perc=None, slope_deg=None,
+                   aspect=None):
+        '''
+        Use this method to copy the results of changed cells into map data
+        (rows of values, as collected by tothemaxmain.py).
+
+        Triggered by:
+            - any python program
+
+        Input:
+            - Cells (row, column) returned by update or recalculate
+            - Slope map data as a percentage (optional)
+            - Slope map data in degrees (optional)
+            - Aspect map data (optional)
+
+        Output:
+            - Map data updated in place
+        '''
+        for r, c in cells:
+            cell = self.gradient[r][c]
+            if slope_perc is not None:
+                slope_perc[r][c] = cell.slope_perc
+            if slope_deg is not None:
+                slope_deg[r][c] = cell.slope_deg
+            if aspect is not None:
+                aspect[r][c] = cell.aspect
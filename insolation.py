@@ -0,0 +1,300 @@
+'''
+Solar Insolation Calculations
+
+Purpose:
+    - Calculates the clear sky solar energy (insolation) reaching every
+      terrain cell over a range of days, from the surface slope and
+      aspect, the latitude and the sun's path, for snowmelt modelling
+    - Optionally shades cells from the sun by the surrounding terrain
+      (terrain self-shadowing)
+
+Developer Note:
+    - The sun's path is stepped every STEP_MINUTES from sunrise to sunset
+      of each day.  The time steps are calculated in chunks, each chunk
+      as one set of arrays (time steps x rows x columns), so there is no
+      loop over cells.  The chunk size keeps each array to about
+      CHUNK_CELLS values.
+    - Clear sky: direct (beam) radiation through an atmosphere of
+      transmittance TRANSMITTANCE over the air mass of the sun's
+      altitude, onto the cell's surface, plus isotropic diffuse radiation
+      from the part of the sky the slope faces.
+    - Shadows: the horizon angle of every cell is calculated once for
+      each of HORIZON_AZIMUTHS directions, by walking out from the cell
+      one cell at a time, up to HORIZON_DISTANCE.  A cell is in shadow
+      when the sun is lower than its horizon, interpolated between the 2
+      nearest directions, which is a table lookup per time step instead
+      of a ray cast.
+    - The latitude is taken from the y reference (metres North or South of
+      the equator, at the middle of the terrain) unless given.
+
+Filename:
+    - insolation.py
+
+Functions:
+    - latitude
+    - day_range
+    - sun_positions
+    - horizon_angles
+    - insolation
+
+Input:
+    - Surface slope and aspect arrays (radians, hillshade.py)
+    - Elevation map data array (NaN for NoData)
+    - Latitude, date range, resolution / cell size
+
+Output:
+    - Insolation array (kWh per square metre, NaN for NoData cells)
+'''
+
+import sys
+import math
+import datetime
+import numpy as np
+
+
+# Clear sky model.
+SOLAR_CONSTANT = 1367
+TRANSMITTANCE = 0.7
+DIFFUSE_FRACTION = 0.3
+
+# Sun's path steps, and values per array when calculating a chunk of them.
+STEP_MINUTES = 30
+CHUNK_CELLS = 4000000
+
+# Directions the horizon is found in (clockwise from North), and how far
+# (metres).
+HORIZON_AZIMUTHS = 32
+HORIZON_DISTANCE = 10000
+
+# Metres per degree of latitude.
+METRES_PER_DEGREE = 111132
+
+
+def latitude(y_ref, hemisphere, extent):
+    '''
+    Use this function to get the latitude of the middle of the terrain
+    from its y reference.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - y reference (lower left corner, metres from the equator)
+        - Hemisphere of the y reference (N/S)
+        - Terrain North to South extent (metres)
+
+    Output:
+        - Latitude (degrees, negative for the Southern hemisphere)
+    '''
+    if hemisphere == 'S':
+        degrees = -(y_ref - extent / 2) / METRES_PER_DEGREE
+    else:
+        degrees = (y_ref + extent / 2) / METRES_PER_DEGREE
+
+    return max(-90.0, min(90.0, degrees))
+
+
+def day_range(dates):
+    '''
+    Use this function to get the days of the year in a date range.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Date range, first and last month-day separated by a comma
+          (e.g. 03-01,04-30), or a single month-day.  The range may run
+          over the end of the year.
+
+    Output:
+        - List of days of the year (1 - 365)
+        - Validation exceptions (not a month-day)
+    '''
+    days = []
+
+    for date in dates.split(','):
+        try:
+            # Any year that is not a leap year.
+            days.append(datetime.datetime.strptime('2021-' + date.strip(),
+                                                   '%Y-%m-%d')
+                        .timetuple().tm_yday)
+        except ValueError:
+            sys.exit('Invalid date ' + date + ' (month-day, e.g. 03-01).')
+
+    first, last = days[0], days[-1]
+
+    if last < first:
+        return list(range(first, 366)) + list(range(1, last + 1))
+
+    return list(range(first, last + 1))
+
+
+def sun_positions(lat, days, step_minutes=STEP_MINUTES):
+    '''
+    Use this function to get the sun's position, above the horizon, every
+    time step of each day, and the direct radiation at each.
+
+    Triggered by:
+        - insolation
+        - any python program
+
+    Input:
+        - Latitude (degrees)
+        - List of days of the year
+        - Minutes between time steps
+
+    Output:
+        - Sun altitude, azimuth (radians, clockwise from North) and direct
+          normal radiation (W per square metre) of each time step (arrays)
+    '''
+    phi = math.radians(lat)
+    day = np.asarray(days, dtype=np.float64)
+
+    # Declination and Earth to sun distance factor of each day.
+    declination = np.radians(23.45) * np.sin(2 * np.pi * (284 + day) / 365)
+    distance = 1 + 0.033 * np.cos(2 * np.pi * day / 365)
+
+    # Hour angles of every time step of the day, midway through each step.
+    hours = np.radians(np.arange(-180, 180, step_minutes / 4)
+                       + step_minutes / 8)
+
+    decl, hour = np.meshgrid(declination, hours, indexing='ij')
+    sin_alt = np.sin(phi) * np.sin(decl) \
+              + np.cos(phi) * np.cos(decl) * np.cos(hour)
+    up = sin_alt > 0.01
+
+    altitude = np.arcsin(np.clip(sin_alt, -1, 1))
+    azimuth = np.mod(np.arctan2(np.sin(hour), np.cos(hour) * np.sin(phi)
+                                - np.tan(decl) * np.cos(phi)) + np.pi,
+                     2 * np.pi)
+
+    # Simple air mass over the sun's altitude.
+    beam = SOLAR_CONSTANT * distance[:, None] \
+           * TRANSMITTANCE ** (1 / np.where(up, sin_alt, 1))
+
+    return altitude[up], azimuth[up], beam[up]
+
+
+def horizon_angles(elevation, resolution, azimuths=HORIZON_AZIMUTHS,
+                   max_distance=HORIZON_DISTANCE):
+    '''
+    Use this function to find the horizon angle of every cell in each
+    direction, walking out one cell at a time.
+
+    Triggered by:
+        - insolation
+        - any python program
+
+    Input:
+        - Elevation map data array (NaN for NoData)
+        - Resolution / cell size
+        - No. of directions (evenly spaced clockwise from North)
+        - Furthest distance walked (metres)
+
+    Output:
+        - Horizon angles (radians, directions x rows x columns float32
+          array)
+    '''
+    elevation = np.asarray(elevation, dtype=np.float64)
+    y_limit, x_limit = elevation.shape
+
+    max_cells = int(math.ceil(max_distance / resolution))
+    horizon = np.zeros((azimuths, y_limit, x_limit), dtype=np.float32)
+
+    for n in range(azimuths):
+        theta = 2 * np.pi * n / azimuths
+        step_x, step_y = np.sin(theta), -np.cos(theta)
+        tangent = np.full(elevation.shape, -np.inf)
+        offsets = set()
+
+        for k in range(1, max_cells + 1):
+            dy, dx = int(round(k * step_y)), int(round(k * step_x))
+            if (dy, dx) in offsets:
+                continue
+            if abs(dy) >= y_limit or abs(dx) >= x_limit:
+                break
+            offsets.add((dy, dx))
+
+            # Cells seen, and the cells they are seen from.
+            seen = elevation[max(dy, 0):y_limit + min(dy, 0),
+                             max(dx, 0):x_limit + min(dx, 0)]
+            rows = slice(max(-dy, 0), y_limit + min(-dy, 0))
+            cols = slice(max(-dx, 0), x_limit + min(-dx, 0))
+
+            # NaN (NoData cells seen) is ignored by fmax.
+            rise = (seen - elevation[rows, cols]) \
+                   / (math.hypot(dy, dx) * resolution)
+            tangent[rows, cols] = np.fmax(tangent[rows, cols], rise)
+
+        horizon[n] = np.arctan(np.maximum(tangent, 0))
+
+    return horizon
+
+
+def insolation(slope, aspect, elevation, resolution, lat, days,
+               shadows=True, step_minutes=STEP_MINUTES):
+    '''
+    Use this function to calculate the clear sky insolation of every cell
+    over a range of days.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Surface slope array (radians)
+        - Surface aspect array (radians, clockwise from North)
+        - Elevation map data array (NaN for NoData)
+        - Resolution / cell size
+        - Latitude (degrees)
+        - List of days of the year
+        - Terrain shadows indicator (True / False)
+        - Minutes between time steps
+
+    Output:
+        - Insolation array (kWh per square metre, NaN for NoData cells)
+    '''
+    slope = np.asarray(slope, dtype=np.float64)
+    aspect = np.asarray(aspect, dtype=np.float64)
+    altitude, azimuth, beam = sun_positions(lat, days, step_minutes)
+
+    if shadows:
+        horizon = horizon_angles(elevation, resolution)
+        sector = 2 * np.pi / len(horizon)
+
+    # Part of the sky seen by the slope, for diffuse radiation.
+    sky_view = (1 + np.cos(slope)) / 2
+    energy = np.zeros(slope.shape)
+    chunk = max(1, CHUNK_CELLS // slope.size)
+
+    for start in range(0, altitude.size, chunk):
+        alt = altitude[start:start + chunk, None, None]
+        azi = azimuth[start:start + chunk, None, None]
+        direct = beam[start:start + chunk, None, None]
+
+        incidence = np.cos(slope) * np.sin(alt) \
+                    + np.sin(slope) * np.cos(alt) * np.cos(azi - aspect)
+        direct = direct * np.maximum(incidence, 0)
+
+        if shadows:
+            # Horizon towards the sun, between the 2 nearest directions.
+            position = azimuth[start:start + chunk] / sector
+            low = np.floor(position).astype(np.int64) % len(horizon)
+            high = (low + 1) % len(horizon)
+            t = (position - np.floor(position))[:, None, None]
+            towards = horizon[low] * (1 - t) + horizon[high] * t
+            direct = np.where(alt > towards, direct, 0)
+
+        diffuse = DIFFUSE_FRACTION * SOLAR_CONSTANT \
+                  * (1 - TRANSMITTANCE ** (1 / np.sin(alt))) * np.sin(alt) \
+                  * sky_view
+
+        energy += (direct + diffuse).sum(axis=0)
+
+    # Watt time steps to kWh.
+    energy *= step_minutes / 60 / 1000
+    energy[np.isnan(elevation)] = np.nan
+
+    return energy
@@ -0,0 +1,861 @@
+'''
+Virtual Mosaic Data Object
+Can be imported or started from the command line
+
+Purpose:
+    - Indexes a set of adjacent raster tiles (e.g. NN22.asc and the tiles
+      around it) by their geo-referenced header data, without reading the
+      cell data of every tile into one grid
+    - Serves each tile with a 1 cell halo from the tiles around it, so
+      the Neighbourhood of cells along a tile border is the same as if the
+      tiles had been joined, instead of being treated as an edge
+    - Calculates the slope and aspect of every tile (in parallel if
+      required), writes the map data files of each tile and resolves D8
+      ties across tile borders
+
+Developer Note:
+    - The mosaic is the rectangle covering all of the tiles.  Cells not
+      covered by any tile are NoData.  Only the outside of the rectangle
+      is treated as an edge.
+    - The tile boundaries split the mosaic into a grid.  Each grid
+      rectangle covered by a tile is indexed by its first row and column,
+      so the tile covering a cell is found by position (bisect) rather
+      than by searching the tiles.
+    - Halo cells are always on the border of another tile, so the first
+      and last row and column of every tile (border strips) are read once,
+      and each halo is built from them.  A tiled binary raster
+      (tiledraster.py) border strip is read as a window, without reading
+      the rest of the tile.
+    - tothemaxmain.py works through the terrain row by row, setting NoData
+      cells to NaN as it goes, so a NoData neighbour is NaN if it comes
+      before the processing cell and the NoData value if it comes after.
+      Halo cells are set to NaN in the same order, so the results match
+      processing the joined tiles.
+    - Tie resolution (neighbourhood.resolve_tie) follows flat areas across
+      tile borders, so it is done once all of the tiles have been
+      calculated.  Each tile's map data files are written as soon as the
+      tile is calculated, and only its tied cells and the aspect of its
+      border cells and of the cells next to its ties are kept.  Once the
+      ties are resolved, the tied cells whose aspect has changed are
+      patched in the aspect map data files.
+
+Filename:
+    - mosaic.py
+
+Classes:
+    - Mosaic
+    - MosaicGradient
+    - GradientRow
+
+Methods:
+    - tile_at
+    - tile_borders
+    - tile_cells
+    - value
+    - window
+    - calculate
+
+Functions:
+    - index_tiles
+    - find_tile
+    - read_borders
+    - process_tile
+    - calculate_window
+    - known_cells
+    - resolve_ties
+    - write_maps
+    - patch_map
+
+Input:
+    - Raster tile dataset URLs (with ncols, nrows, xllcorner / xllcenter,
+      yllcorner / yllcenter and cellsize header data)
+
+Output:
+    - Instance of Mosaic class
+    - Files
+        - <tile>_slope_map_perc.txt, <tile>_slope_map_deg.txt,
+          <tile>_aspect_map.txt for each tile
+'''
+
+import os
+import sys
+import csv
+import math
+import bisect
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from types import SimpleNamespace
+import neighbourhood as nbh
+import surface
+import tiledraster as trs
+
+
+MAP_NAMES = ('slope_map_perc', 'slope_map_deg', 'aspect_map')
+
+# Rows read at a time when reading the border strips of a tile.
+BORDER_ROWS = 256
+
+
+def index_tiles(tiles):
+    '''
+    Use this function to index the tiles by the grid their boundaries
+    split the mosaic into.
+
+    Triggered by:
+        - Mosaic
+        - any python program
+
+    Input:
+        - Tiles (first row, first column, rows, columns, ...)
+
+    Output:
+        - Tile index (row boundaries, column boundaries and
+          {(first row, first column) of a grid rectangle: tile number})
+    '''
+    rows = sorted({tile[0] for tile in tiles}
+                  | {tile[0] + tile[2] for tile in tiles})
+    cols = sorted({tile[1] for tile in tiles}
+                  | {tile[1] + tile[3] for tile in tiles})
+    index = {}
+
+    for i, (first_row, first_col, nrows, ncols) in \
+            enumerate(tile[:4] for tile in tiles):
+        for y in rows[bisect.bisect_left(rows, first_row):
+                      bisect.bisect_left(rows, first_row + nrows)]:
+            for x in cols[bisect.bisect_left(cols, first_col):
+                          bisect.bisect_left(cols, first_col + ncols)]:
+                index[(y, x)] = i
+
+    return rows, cols, index
+
+
+def find_tile(tile_index, y, x):
+    '''
+    Use this function to find the tile covering a mosaic cell.
+
+    Triggered by:
+        - Mosaic.tile_at
+        - Mosaic.calculate
+
+    Input:
+        - Tile index (see index_tiles)
+        - Mosaic row number
+        - Mosaic column number
+
+    Output:
+        - Tile number (None if not covered by a tile)
+    '''
+    rows, cols, index = tile_index
+    m = bisect.bisect_right(rows, y) - 1
+    n = bisect.bisect_right(cols, x) - 1
+
+    if m < 0 or n < 0:
+        return None
+
+    return index.get((rows[m], cols[n]))
+
+
+def read_borders(dataset, nodata_value, mosaic_nodata):
+    '''
+    Use this function to read the first and last row and column of a
+    tile (border strips).
+
+    Triggered by:
+        - Mosaic.tile_borders
+        - Mosaic.calculate (one process per tile if in parallel)
+
+    Input:
+        - Tile dataset URL
+        - Tile NoData value
+        - Mosaic NoData value
+
+    Output:
+        - First row, last row, first column and last column (lists of
+          Python floats, mosaic NoData value)
+        - Validation exceptions (corruption, if any) of the tile
+    '''
+    if trs.is_tiled(dataset):
+        tiled = trs.TiledRaster(dataset)
+        nrows, ncols = tiled.nrows, tiled.ncols
+        strips = [tiled.window(0, 0, 1, ncols)[0],
+                  tiled.window(nrows - 1, 0, 1, ncols)[0],
+                  tiled.window(0, 0, nrows, 1)[:, 0],
+                  tiled.window(0, ncols - 1, nrows, 1)[:, 0]]
+        tiled.close()
+        strips = [strip.tolist() for strip in strips]
+
+    else:
+        raster = surface.SurfaceRaster(dataset)
+        first, last, left, right = None, None, [], []
+
+        for block in raster.read_blocks(BORDER_ROWS):
+            for row in block:
+                if first is None:
+                    first = row
+                last = row
+                left.append(row[0])
+                right.append(row[-1])
+
+        raster.close_raster()
+        strips = [first, last, left, right]
+
+    return [[mosaic_nodata if cell == nodata_value else cell
+             for cell in strip] for strip in strips]
+
+
+def process_tile(mosaic, i, resolution, d8_dict, fill_sinks=False,
+                 prefix=None):
+    '''
+    Use this function to calculate the slope and aspect of every cell of
+    one tile and write its map data files.
+
+    Triggered by:
+        - Mosaic.calculate (one process per tile if in parallel)
+
+    Input:
+        - Mosaic instance
+        - Tile number
+        - Terrain resolution / cell size
+        - D8 dictionary
+        - Fill sinks indicator (True / False)
+        - Map data file name prefix
+
+    Output:
+        - Tile number
+        - Tied cells {(mosaic row, mosaic column): (aspect, D8 directions)}
+        - Aspect of the cells tie resolution may need (see known_cells)
+        - Files (see write_maps)
+    '''
+    window, top_halo, left_halo = mosaic.window(i)
+    tile = mosaic.tiles[i][:4]
+    slope_perc, slope_deg, aspect, ties = calculate_window(
+                    window, top_halo, left_halo, tile, resolution, d8_dict,
+                    mosaic.nodata_value, fill_sinks)
+
+    write_maps(prefix, slope_perc, slope_deg, aspect)
+
+    return i, ties, known_cells(tile, aspect, ties)
+
+
+def calculate_window(window, top_halo, left_halo, tile, resolution, d8_dict,
+                     nodata_value, fill_sinks=False):
+    '''
+    Use this function to calculate the slope and aspect of every cell of
+    a tile with a halo, as tothemaxmain.py does.  Ties are noted but not
+    resolved.
+
+    Triggered by:
+        - process_tile
+        - shard.py (work)
+
+    Input:
+        - Tile cell data with halo (rows of values, changed in place)
+        - No. of halo rows above the tile (0 or 1)
+        - No. of halo columns left of the tile (0 or 1)
+        - Tile (first row, first column, rows, columns) in the mosaic
+        - Terrain resolution / cell size
+        - D8 dictionary
+        - Geo-referenced NoData value
+        - Fill sinks indicator (True / False)
+
+    Output:
+        - Slope map data as a percentage, in degrees and aspect map data
+          (rows of values)
+        - Tied cells {(mosaic row, mosaic column): (aspect, D8 directions)}
+    '''
+    first_row, first_col, nrows, ncols = tile
+    slope_perc, slope_deg, aspect = [], [], []
+    ties = {}
+
+    # The row above the tile comes before all of the tile.
+    if top_halo:
+        window[0] = [math.nan if cell == nodata_value else cell
+                     for cell in window[0]]
+
+    for y in range(top_halo, top_halo + nrows):
+
+        # Halo cells West of this row and East of the row above now come
+        # before the processing cells.
+        if left_halo and window[y][0] == nodata_value:
+            window[y][0] = math.nan
+        if y > 0 and len(window[y - 1]) > left_halo + ncols \
+                and window[y - 1][-1] == nodata_value:
+            window[y - 1][-1] = math.nan
+
+        perc_row, deg_row, aspect_row = [], [], []
+
+        for x in range(left_halo, left_halo + ncols):
+
+            cell = nbh.Neighbourhood(window, resolution, y, x)
+
+            # Handle NoData cell.
+            if cell.centre == nodata_value:
+                window[y][x] = math.nan
+
+            cell.slope_aspect(d8_dict, nodata_value)
+
+            if fill_sinks and cell.slope == -math.inf:
+                cell.sink_fill(d8_dict)
+
+            if len(cell.d8) > 1:
+                ties[(first_row + y - top_halo, first_col + x - left_halo)] \
+                    = (cell.aspect, cell.d8)
+
+            perc_row.append(cell.slope_perc)
+            deg_row.append(cell.slope_deg)
+            aspect_row.append(cell.aspect)
+
+        slope_perc.append(perc_row)
+        slope_deg.append(deg_row)
+        aspect.append(aspect_row)
+
+    return slope_perc, slope_deg, aspect, ties
+
+
+def known_cells(tile, aspect, ties):
+    '''
+    Use this function to get the aspect of the cells of a tile that tie
+    resolution may look at: its border cells (next to other tiles) and the
+    cells next to its tied cells.
+
+    Triggered by:
+        - process_tile
+        - shard.py (work_shard)
+        - any python program
+
+    Input:
+        - Tile (first row, first column, rows, columns) in the mosaic
+        - Aspect map data of the tile (rows of values)
+        - Tied cells of the tile {(mosaic row, mosaic column): ...}
+
+    Output:
+        - Aspect {(mosaic row, mosaic column): aspect}
+    '''
+    first_row, first_col, nrows, ncols = tile
+    cells = set()
+
+    for y in (0, nrows - 1):
+        cells.update((y, x) for x in range(ncols))
+    for x in (0, ncols - 1):
+        cells.update((y, x) for y in range(nrows))
+
+    for r, c in ties:
+        for dy, dx in nbh.D8_OFFSETS:
+            y, x = r - first_row + dy, c - first_col + dx
+            if 0 <= y < nrows and 0 <= x < ncols:
+                cells.add((y, x))
+
+    return {(first_row + y, first_col + x): aspect[y][x] for y, x in cells}
+
+
+def resolve_ties(nrows, ncols, known, ties, d8_dict):
+    '''
+    Use this function to resolve the D8 ties of every tile, row by row
+    through the whole mosaic, until no more can be resolved.
+
+    Triggered by:
+        - Mosaic.calculate
+        - shard.py (merge)
+        - timeseries.py
+
+    Input:
+        - No. of mosaic rows
+        - No. of mosaic columns
+        - Aspect of the cells next to the tied cells (see known_cells)
+        - Tied cells {(mosaic row, mosaic column): (aspect, D8 directions)}
+        - D8 dictionary
+
+    Output:
+        - Aspect of the tied cells {(mosaic row, mosaic column): aspect}
+    '''
+    gradient = MosaicGradient(nrows, ncols, known, ties)
+    cells = sorted(gradient.ties)
+    keep_looping = True
+
+    while keep_looping:
+        keep_looping = False
+
+        for r, c in cells:
+            if len(gradient.ties[(r, c)].d8) > 1 \
+                    and nbh.resolve_tie(gradient, r, c, d8_dict):
+                keep_looping = True
+
+    return {cell: tie.aspect for cell, tie in gradient.ties.items()}
+
+
+def write_maps(prefix, slope_perc, slope_deg, aspect):
+    '''
+    Use this function to write the slope and aspect map data files of a
+    tile, as tothemaxmain.py does.
+
+    Triggered by:
+        - process_tile
+        - shard.py (work_shard)
+
+    Input:
+        - File name prefix (e.g. the tile file name without extension)
+        - Slope map data as a percentage, in degrees and aspect map data
+          (rows of values)
+
+    Output:
+        - Files
+            - <prefix>_slope_map_perc.txt, <prefix>_slope_map_deg.txt,
+              <prefix>_aspect_map.txt
+    '''
+    for name, grid in zip(MAP_NAMES, (slope_perc, slope_deg, aspect)):
+        f = open(prefix + '_' + name + '.txt', 'w', newline='')
+        output = csv.writer(f, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+
+        for row in grid:
+            if name == 'aspect_map':
+                output.writerow(row)
+            else:
+                output.writerow([round(cell, 1) for cell in row])
+
+        f.close()
+
+
+def patch_map(file_name, cells):
+    '''
+    Use this function to change cells of a map data file, a row at a
+    time.  Only the changed values are rewritten (as csv writes them),
+    the rest of the file is copied as it is.
+
+    Triggered by:
+        - Mosaic.calculate
+        - shard.py (merge)
+
+    Input:
+        - Map data file name
+        - Changed cells {(row, column) in the file: value}
+
+    Output:
+        - File (replaced)
+    '''
+    rows = {}
+    for (y, x), value in cells.items():
+        rows.setdefault(y, {})[x] = value
+
+    with open(file_name, newline='') as f, \
+            open(file_name + '.tmp', 'w', newline='') as new:
+
+        for y, line in enumerate(f):
+            if y in rows:
+                row = line.rstrip('\r\n')
+                fields = row.split(' ')
+                for x, value in rows[y].items():
+                    fields[x] = repr(value)
+                line = ' '.join(fields) + line[len(row):]
+            new.write(line)
+
+    os.replace(file_name + '.tmp', file_name)
+
+
+#----------------------------------------------------------
+# Mosaic Class
+#----------------------------------------------------------
+class Mosaic():
+    '''
+    Set of adjacent raster tiles indexed by their header data.
+    '''
+
+    def __init__(self, datasets, tiles_kept=1):
+        '''
+        Reads the header data of every tile and works out where each tile
+        is in the mosaic.
+
+        Initialises data object instance.
+
+        Triggered by:
+            - any python program
+
+        Input:
+            - Raster tile dataset URLs
+            - No. of tiles read to be kept
+
+        Output:
+            - Mosaic data instance
+            - Validation exceptions (header data missing, different cell
+              sizes, tiles not on the same cell grid or overlapping)
+        '''
+        self.datasets = list(datasets)
+        self.tiles_kept = tiles_kept
+        self.tiles_read = OrderedDict()
+        self.borders = {}
+        headers = []
+        for dataset in self.datasets:
+            raster = surface.SurfaceRaster(dataset)
+            raster.read_header()
+            raster.close_raster()
+
+            if raster.nrows == 0 or raster.ncols == 0 \
+                    or raster.cellsize == 0:
+                sys.exit('No ncols, nrows or cellsize header data in '
+                         + dataset + '.')
+
+            headers.append(raster)
+
+        self.cellsize = headers[0].cellsize
+        self.nodata_value = headers[0].nodata_value
+
+        if any(raster.cellsize != self.cellsize for raster in headers):
+            sys.exit('Tiles have different cell sizes.')
+
+        # Mosaic rectangle (cells), from the lower left corner.
+        self.xllcorner = min(raster.xllcorner for raster in headers)
+        self.yllcorner = min(raster.yllcorner for raster in headers)
+        right = max(raster.xllcorner + raster.ncols * self.cellsize
+                    for raster in headers)
+        top = max(raster.yllcorner + raster.nrows * self.cellsize
+                  for raster in headers)
+        self.ncols = (right - self.xllcorner) // self.cellsize
+        self.nrows = (top - self.yllcorner) // self.cellsize
+
+        # Tiles as (first row, first column, rows, columns, NoData value).
+        self.tiles = []
+
+        for dataset, raster in zip(self.datasets, headers):
+            if (raster.xllcorner - self.xllcorner) % self.cellsize \
+                    or (top - raster.yllcorner) % self.cellsize:
+                sys.exit(dataset + ' is not on the cell grid of the mosaic.')
+
+            self.tiles.append(
+                ((top - raster.yllcorner) // self.cellsize - raster.nrows,
+                 (raster.xllcorner - self.xllcorner) // self.cellsize,
+                 raster.nrows, raster.ncols, raster.nodata_value))
+
+        for i, (r1, c1, h1, w1, _) in enumerate(self.tiles):
+            for j, (r2, c2, h2, w2, _) in enumerate(self.tiles[:i]):
+                if r1 < r2 + h2 and r2 < r1 + h1 \
+                        and c1 < c2 + w2 and c2 < c1 + w1:
+                    sys.exit(self.datasets[i] + ' overlaps '
+                             + self.datasets[j] + '.')
+
+        self.tile_index = index_tiles(self.tiles)
+
+
+    def __getstate__(self):
+        '''
+        Get the instance data to copy to another process, without the
+        tiles read (border strips are kept).
+        '''
+        state = self.__dict__.copy()
+        state['tiles_read'] = OrderedDict()
+        return state
+
+
+    def tile_at(self, y, x):
+        '''
+        Use this method to find the tile covering a mosaic cell.
+
+        Triggered by:
+            - value
+            - MosaicGradient
+            - any python program
+
+        Input:
+            - Mosaic row number
+            - Mosaic column number
+
+        Output:
+            - Tile number (None if not covered by a tile)
+        '''
+        return find_tile(self.tile_index, y, x)
+
+
+    def tile_borders(self, i):
+        '''
+        Use this method to get the border strips of a tile, read once.
+
+        Triggered by:
+            - value
+            - any python program
+
+        Input:
+            - Tile number
+
+        Output:
+            - First row, last row, first column and last column (lists of
+              Python floats, mosaic NoData value)
+        '''
+        if i not in self.borders:
+            self.borders[i] = read_borders(self.datasets[i], self.tiles[i][4],
+                                           self.nodata_value)
+
+        return self.borders[i]
+
+
+    def tile_cells(self, i):
+        '''
+        Use this method to get the cell data of a tile.  The most recently
+        used tiles are kept.
+
+        Triggered by:
+            - value
+            - window
+            - any python program
+
+        Input:
+            - Tile number
+
+        Output:
+            - Tile cell data (rows of Python floats, mosaic NoData value)
+            - Validation exceptions (corruption, if any) of the tile
+        '''
+        if i in self.tiles_read:
+            self.tiles_read.move_to_end(i)
+        else:
+            raster = surface.SurfaceRaster(self.datasets[i])
+            raster.read_raster()
+            raster.close_raster()
+
+            nodata_value = self.tiles[i][4]
+            if nodata_value != self.nodata_value:
+                for row in raster.cells:
+                    row[:] = [self.nodata_value if cell == nodata_value
+                              else cell for cell in row]
+
+            self.tiles_read[i] = raster.cells
+            if len(self.tiles_read) > self.tiles_kept:
+                self.tiles_read.popitem(last=False)
+
+        return self.tiles_read[i]
+
+
+    def value(self, y, x):
+        '''
+        Use this method to get the value of one mosaic cell.  Cells on
+        the border of a tile (such as halo cells) are taken from its
+        border strips.
+
+        Triggered by:
+            - window
+            - any python program
+
+        Input:
+            - Mosaic row number
+            - Mosaic column number
+
+        Output:
+            - Cell value (NoData value if not covered by a tile)
+        '''
+        i = self.tile_at(y, x)
+        if i is None:
+            return self.nodata_value
+
+        first_row, first_col, nrows, ncols = self.tiles[i][:4]
+        first, last, left, right = self.tile_borders(i)
+
+        if y == first_row:
+            return first[x - first_col]
+        if y == first_row + nrows - 1:
+            return last[x - first_col]
+        if x == first_col:
+            return left[y - first_row]
+        if x == first_col + ncols - 1:
+            return right[y - first_row]
+
+        return self.tile_cells(i)[y - first_row][x - first_col]
+
+
+    def window(self, i):
+        '''
+        Use this method to get the cell data of a tile with a 1 cell halo
+        from the tiles around it.  There is no halo along the outside of
+        the mosaic, so the Neighbourhood edges are the mosaic edges.
+
+        Triggered by:
+            - process_tile
+            - any python program
+
+        Input:
+            - Tile number
+
+        Output:
+            - Tile cell data with halo (rows of Python floats, copied)
+            - No. of halo rows above the tile (0 or 1)
+            - No. of halo columns left of the tile (0 or 1)
+        '''
+        first_row, first_col, nrows, ncols = self.tiles[i][:4]
+        top = max(first_row - 1, 0)
+        bottom = min(first_row + nrows + 1, self.nrows)
+        left = max(first_col - 1, 0)
+        right = min(first_col + ncols + 1, self.ncols)
+
+        cells = self.tile_cells(i)
+        window = []
+
+        for y in range(top, bottom):
+            if first_row <= y < first_row + nrows:
+                row = [self.value(y, x) for x in range(left, first_col)] \
+                      + cells[y - first_row] \
+                      + [self.value(y, x)
+                         for x in range(first_col + ncols, right)]
+            else:
+                row = [self.value(y, x) for x in range(left, right)]
+
+            window.append(row)
+
+        return window, first_row - top, first_col - left
+
+
+    def calculate(self, resolution, d8_dict, fill_sinks=False, workers=1,
+                  directory='.'):
+        '''
+        Use this method to calculate the slope and aspect of every tile,
+        write the map data files of each tile as it is calculated, and
+        resolve the D8 ties across the whole mosaic.
+
+        Triggered by:
+            - any python program
+
+        Input:
+            - Terrain resolution / cell size
+            - D8 dictionary
+            - Fill sinks indicator (True / False)
+            - No. of processes calculating tiles at the same time
+            - Output directory
+
+        Output:
+            - Files (see write_maps), prefixed with each tile file name
+            - List of (slope map as a percentage, slope map in degrees,
+              aspect map) file names for each tile
+        '''
+        prefixes = [os.path.join(directory, os.path.splitext(
+                        os.path.basename(dataset))[0])
+                    for dataset in self.datasets]
+        borders = (read_borders, self.datasets,
+                   [tile[4] for tile in self.tiles], repeat(self.nodata_value))
+        args = (repeat(self), range(len(self.tiles)), repeat(resolution),
+                repeat(d8_dict), repeat(fill_sinks), prefixes)
+
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                self.borders = dict(enumerate(executor.map(*borders)))
+                results = list(executor.map(process_tile, *args))
+        else:
+            self.borders = dict(enumerate(map(*borders)))
+            results = list(map(process_tile, *args))
+
+        ties, known = {}, {}
+        for _, tile_ties, tile_known in results:
+            ties.update(tile_ties)
+            known.update(tile_known)
+
+        resolved = resolve_ties(self.nrows, self.ncols, known, ties, d8_dict)
+
+        # Patch the tied cells whose aspect has changed.
+        changed = {}
+        for (r, c), aspect in resolved.items():
+            if aspect != ties[(r, c)][0]:
+                i = self.tile_at(r, c)
+                changed.setdefault(i, {})[(r - self.tiles[i][0],
+                                           c - self.tiles[i][1])] = aspect
+
+        for i, cells in changed.items():
+            patch_map(prefixes[i] + '_aspect_map.txt', cells)
+
+        return [tuple(prefix + '_' + name + '.txt' for name in MAP_NAMES)
+                for prefix in prefixes]
+
+
+#----------------------------------------------------------
+# MosaicGradient Class
+#----------------------------------------------------------
+class MosaicGradient():
+    '''
+    Aspect and D8 directions of the mosaic cells tie resolution looks at,
+    indexed as rows of cells (gradient[row][column]) for
+    neighbourhood.resolve_tie.
+    '''
+
+    def __init__(self, nrows, ncols, known, ties):
+        '''
+        Initialises data object instance.
+
+        Triggered by:
+            - resolve_ties
+
+        Input:
+            - No. of mosaic rows
+            - No. of mosaic columns
+            - Aspect of the cells next to the tied cells (see known_cells)
+            - Tied cells {(mosaic row, mosaic column): (aspect, D8 directions)}
+
+        Output:
+            - Mosaic gradient instance
+        '''
+        self.nrows = nrows
+        self.ncols = ncols
+        self.known = known
+        self.ties = {cell: SimpleNamespace(aspect=aspect, d8=list(d8))
+                     for cell, (aspect, d8) in ties.items()}
+
+
+    def __len__(self):
+        return self.nrows
+
+
+    def __getitem__(self, y):
+        return GradientRow(self, y)
+
+
+    def cell(self, y, x):
+        '''
+        Get the aspect and D8 directions of a mosaic cell (tied cells can
+        be changed, other cells are a copy, NaN if not known or not
+        covered by a tile).
+        '''
+        if (y, x) in self.ties:
+            return self.ties[(y, x)]
+
+        return SimpleNamespace(aspect=self.known.get((y, x), math.nan),
+                               d8=[])
+
+
+#----------------------------------------------------------
+# GradientRow Class
+#----------------------------------------------------------
+class GradientRow():
+    '''
+    One row of a MosaicGradient.
+    '''
+
+    def __init__(self, gradient, y):
+        self.gradient = gradient
+        self.y = y
+
+
+    def __len__(self):
+        return self.gradient.ncols
+
+
+    def __getitem__(self, x):
+        return self.gradient.cell(self.y, x)
+
+
+#----------------------------------------------------------
+# Command line: calculate a mosaic and write the map data
+# files of each tile.
+#----------------------------------------------------------
+if __name__ == '__main__':
+
+    DICT_ASPECT = {1:90, 2:135, 4:180, 8:225, 16:270, 32:315, 64:0, 128:45}
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filenames', dest='file_names', nargs='+',
+                        required=True, help='Raster tile file names')
+    parser.add_argument('--resolution', dest='resolution', type=int,
+                        default=0, help='Resolution / cell size (metres, '
+                        + 'integer, default tile header cellsize)')
+    parser.add_argument('--fillsinks', dest='fill_sinks', default='Y',
+                        help='Fill in sinks / holes (Y/N)')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+                        help='Tiles calculated at the same time (integer)')
+    args = parser.parse_args()
+
+    tiles = Mosaic(args.file_names)
+    tiles.calculate(args.resolution or tiles.cellsize, DICT_ASPECT,
+                    args.fill_sinks.upper() == 'Y', args.workers)
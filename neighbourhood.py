@@ -25,10 +25,69 @@ Methods:
     - sink_fill
     - get<var name> (multiple) 
     - Set<var name> (multiple).
+
+Functions:
+    - neighbour_stack - the 3 x 3 Neighbourhood of every terrain cell 
+        at once, as arrays
+    - resolve_tie - resolve a cell with more than one D8 direction
 '''
 
 
 import math
+import numpy as np
+
+
+# Row and column offsets of the 8 neighbours, starting with the East
+# neighbour and working clockwise (same order as Neighbourhood.neighbours).
+D8_OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1), 
+              (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+
+#----------------------------------------------------------
+# Vectorised Neighbourhood
+#----------------------------------------------------------
+def neighbour_stack(terrain, nodata_value=None):
+    '''
+    Use this function to build the 3 x 3 Neighbourhood of every terrain 
+    cell in one vectorised pass, instead of one Neighbourhood instance
+    per cell.
+
+    Neighbours outside of the terrain boundaries take the value of the
+    processing cell, as they do in a Neighbourhood instance.  NoData 
+    neighbours (NoData value or NaN) are treated the same way, and NoData
+    processing cells are returned as NaN.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Terrain Raster data (excluding headers)
+        - Geo-referenced NoData value (optional)
+
+    Output:
+        - Processing cell array (rows x columns)
+        - Neighbour array (8 x rows x columns), starting with the East
+          neighbour and working clockwise
+    '''
+    centre = np.array(terrain, dtype=np.float64)
+
+    if nodata_value is not None:
+        centre[centre == nodata_value] = np.nan
+
+    y_limit, x_limit = centre.shape
+    padded = np.pad(centre, 1, mode='constant', constant_values=np.nan)
+
+    neighbours = np.empty((8,) + centre.shape)
+    for n, (dy, dx) in enumerate(D8_OFFSETS):
+        neighbours[n] = padded[1 + dy:1 + dy + y_limit, 
+                               1 + dx:1 + dx + x_limit]
+
+    # Outside of the boundaries or NoData - use the processing cell.
+    missing = np.isnan(neighbours)
+    neighbours[missing] = np.broadcast_to(centre, neighbours.shape)[missing]
+
+    return centre, neighbours
 
 
 #----------------------------------------------------------
@@ -75,7 +134,21 @@ class Neighbourhood():
         # Construct 3 x 3 Neighbourhood grid.
         # Identify, if applicable, direction of adjacent edge.
         #---------------------------------------------------------
-        if y == 0 and x == 0:
+        # Single row or column terrain - neighbours outside of the
+        # boundaries are infinitely high, so they are never downhill, and
+        # the edge names every side that is outside (e.g. 'NS' or 'NSW'
+        # for a single row).
+        if self.y_boundary == 0 or self.x_boundary == 0:
+            self.neighbourhood = [
+                    [terrain[y+dy][x+dx] if 0 <= y + dy <= self.y_boundary
+                     and 0 <= x + dx <= self.x_boundary else math.inf
+                     for dx in (-1, 0, 1)] for dy in (-1, 0, 1)]
+            self.edge = ('N' if y == 0 else '') \
+                        + ('S' if y == self.y_boundary else '') \
+                        + ('E' if x == self.x_boundary else '') \
+                        + ('W' if x == 0 else '')
+
+        elif y == 0 and x == 0:
             self.neighbourhood = [
                     [terrain[y][x]] * 3,
                     [terrain[y][x], terrain[y][x], terrain[y][x+1]],
@@ -354,4 +427,111 @@ class Neighbourhood():
         '''Set the cell aspect value'''
         self._aspect = val
             
- 
\ No newline at end of file
+ 
+
+
+#----------------------------------------------------------
+# D8 tie resolution
+#----------------------------------------------------------
+def resolve_tie(gradient, r, c, d8_dict):
+    '''
+    Use this function to resolve a processing cell with a list of 
+    neighbours with the same maximum downhill gradient.
+
+    From this list and in turn, get the apsect of the neighbourhood in the
+    opposite direction.  If a match, then use this aspect for the current
+    Neighbourhood and ignore the remainder of the list.  At the edges, 
+    where there is insufficient data, use that choice.
+
+    Triggered by:
+        - tothemaxmain.py
+        - incremental.py
+
+    Input:
+        - Gradient (rows of Neighbourhood instances)
+        - Processing cell row number
+        - Processing cell column number
+        - D8 dictionary
+
+    Output:
+        - Aspect and D8 direction of the processing cell (if resolved)
+        - Resolved indicator (True / False)
+    '''
+    y_limit = len(gradient)
+    x_limit = len(gradient[0])
+
+    # n = 0 (D8 East)  n = 1 (D8 South-East) 
+    # n = 2 (D8 South) n = 3 (D8 South-West) 
+    # n = 4 (D8 West)  n = 5 (D8 North-West) 
+    # n = 6 (D8 North) n = 7 (D8 North-East)
+    for n in gradient[r][c].d8:
+
+        # Edges - Insufficient data - Use the first choice.
+        if (n in (1, 2, 3) and r == 0) \
+           or (n in (5, 6, 7) and r == y_limit - 1) \
+           or (n in (0, 1, 7) and c == 0) \
+           or (n in (3, 4, 5) and c == x_limit - 1):
+            gradient[r][c].d8 = [n]
+
+        # East cell.
+        # Compare with 3x3 neighbourhood one cell West.
+        elif n == 0:
+            if d8_dict[2**n] == gradient[r][c-1].aspect:
+                gradient[r][c].aspect = gradient[r][c-1].aspect
+                gradient[r][c].d8 = [n]
+
+        # Sout-East cell.
+        # Compare with 3x3 neighbourhood one cell North-West.
+        elif n == 1:
+            if d8_dict[2**n] == gradient[r-1][c-1].aspect:
+                gradient[r][c].aspect = gradient[r-1][c-1].aspect
+                gradient[r][c].d8 = [n]
+
+        # South cell.
+        # Compare with 3x3 neighbourhood one cell North.
+        elif n == 2:
+            if d8_dict[2**n] == gradient[r-1][c].aspect:
+                gradient[r][c].aspect = gradient[r-1][c].aspect
+                gradient[r][c].d8 = [n]
+
+        # South-West cell.
+        # Compare with 3x3 neighbourhood one cell North-East.
+        elif n == 3:
+            if d8_dict[2**n] == gradient[r-1][c+1].aspect:
+                gradient[r][c].aspect = gradient[r-1][c+1].aspect
+                gradient[r][c].d8 = [n]
+
+        # West cell.
+        # Compare with 3x3 neighbourhood one cell East.
+        elif n == 4:
+            if d8_dict[2**n] == gradient[r][c+1].aspect:
+                gradient[r][c].aspect = gradient[r][c+1].aspect
+                gradient[r][c].d8 = [n]
+
+        # North-West cell.
+        # Compare with 3x3 neighbourhood one cell South-East.
+        elif n == 5:
+            if d8_dict[2**n] == gradient[r+1][c+1].aspect:
+                gradient[r][c].aspect = gradient[r+1][c+1].aspect
+                gradient[r][c].d8 = [n]
+
+        # North cell.
+        # Compare with 3x3 neighbourhood one cell South.
+        elif n == 6:
+            if d8_dict[2**n] == gradient[r+1][c].aspect:
+                gradient[r][c].aspect = gradient[r+1][c].aspect
+                gradient[r][c].d8 = [n]
+
+        # North-East cell.
+        # Compare with 3x3 neighbourhood one cell South-West.
+        else:
+            if d8_dict[2**n] == gradient[r+1][c-1].aspect:
+                gradient[r][c].aspect = gradient[r+1][c-1].aspect
+                gradient[r][c].d8 = [n]
+
+        # If the cell has been resolved, don't need to check
+        # any remaining options for this cell.
+        if len(gradient[r][c].d8) == 1:
+            return True
+
+    return False
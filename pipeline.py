@@ -0,0 +1,353 @@
+'''
+Pipelined Slope and Aspect Processing
+
+Purpose:
+    - Overlaps reading the terrain, calculating slope and aspect and
+      writing the output files, instead of running them one after another
+    - A reader thread parses blocks of rows, the calculation works on each
+      block as soon as the next block (the row below) has arrived, and a
+      writer thread formats and writes the finished rows
+    - The stages are connected by bounded queues, so a fast reader waits
+      for the calculation rather than reading the whole terrain ahead
+
+Developer Note:
+    - A Neighbourhood only needs the rows above and below its processing
+      cell, so each block is calculated with a 1 row halo from the blocks
+      either side.  Halo rows are the same row objects as in the blocks,
+      so NoData cells set to NaN are seen by the next block, exactly as
+      tothemaxmain.py does for the whole terrain.
+    - Slope rows are written as each block is finished.  D8 ties are
+      resolved from the aspect of neighbouring cells, which may be in any
+      later block, so the aspect map is written once the last block has
+      been calculated and the tied cells resolved.
+    - Python threads share one processor for Python code, so the gain is
+      from reading and writing files while calculating, not from
+      calculating in parallel.
+    - Instead of the map files, one map can be streamed (e.g. to standard
+      output) as an ASCII grid, so the pipeline can be part of a chain of
+      commands with no files written.  If the input has no nrows header
+      data, the map is held until the last row, as the grid header needs
+      the number of rows.
+
+Filename:
+    - pipeline.py
+
+Functions:
+    - read_stage
+    - write_stage
+    - stream_stage
+    - run
+
+Input:
+    - Terrain surface data instance (SurfaceRaster, not yet read)
+    - Terrain resolution / cell size
+    - D8 dictionary
+    - Fill sinks indicator
+    - Slope map and aspect map selections
+
+Output:
+    - Gradient (rows of Neighbourhood instances)
+    - Files
+        - slope_map_perc.txt, slope_map_deg.txt, aspect_map.txt
+    - or one map streamed as an ASCII grid
+'''
+
+import os
+import csv
+import math
+import queue
+import threading
+import neighbourhood as nbh
+
+
+# No. of rows per block and no. of blocks each queue can hold.
+BLOCK_ROWS = 64
+QUEUE_BLOCKS = 4
+
+
+def read_stage(terrain, block_rows, blocks):
+    '''
+    Use this function to read the terrain a block of rows at a time and
+    pass the blocks on.  Reading stops when the queue is full, until the
+    calculation takes a block.
+
+    Triggered by:
+        - run (reader thread)
+
+    Input:
+        - Terrain surface data instance (SurfaceRaster)
+        - No. of rows per block
+        - Queue of blocks
+
+    Output:
+        - Blocks of rows, then None (or the exception that stopped reading)
+    '''
+    try:
+        for block in terrain.read_blocks(block_rows):
+            blocks.put(block)
+        blocks.put(None)
+
+    except BaseException as error:
+        blocks.put(error)
+
+
+def write_stage(maps, slope_map, aspect_map, errors):
+    '''
+    Use this function to format and write the slope and aspect map files as
+    rows are finished.  If writing fails, the rest of the queue is still
+    taken, so the calculation is never left waiting.
+
+    Triggered by:
+        - run (writer thread)
+
+    Input:
+        - Queue of finished rows (map name, rows), then None
+        - Slope map selection (P/D/B)
+        - Aspect map selection (Y/N)
+        - List to hold the exception that stopped writing (if any)
+
+    Output:
+        - Files
+            - slope_map_perc.txt, slope_map_deg.txt, aspect_map.txt
+    '''
+    files = {'perc': open('slope_map_perc.txt', 'w', newline=''),
+             'deg': open('slope_map_deg.txt', 'w', newline=''),
+             'aspect': open('aspect_map.txt', 'w', newline='')}
+    output = {name: csv.writer(f, delimiter=' ',
+                               quoting=csv.QUOTE_NONNUMERIC)
+              for name, f in files.items()}
+    selected = {'perc': slope_map in ['P', 'B'],
+                'deg': slope_map in ['D', 'B'],
+                'aspect': aspect_map == 'Y'}
+
+    while True:
+        item = maps.get()
+        if item is None:
+            break
+
+        name, rows = item
+        if errors or not selected.get(name):
+            continue
+
+        try:
+            if name == 'aspect':
+                output[name].writerows(rows)
+            else:
+                output[name].writerows([round(cell, 1) for cell in row]
+                                       for row in rows)
+        except BaseException as error:
+            errors.append(error)
+
+    for f in files.values():
+        f.close()
+
+
+def stream_stage(maps, stream, stream_map, errors):
+    '''
+    Use this function to format and write one map as an ASCII grid (header
+    data, then rows of cells) as rows are finished.  NaN cells are written
+    as the NoData value.  If writing fails, the rest of the queue is still
+    taken, so the calculation is never left waiting.  If the command
+    reading the stream stops early (e.g. head), the rest of the map is
+    not needed, so this is not an error.
+
+    Triggered by:
+        - run (writer thread)
+
+    Input:
+        - Queue of header data ('header', dictionary) and finished rows
+          (map name, rows), then None
+        - Stream (text file object, e.g. standard output)
+        - Map streamed (perc, deg or aspect)
+        - List to hold the exception that stopped writing (if any)
+
+    Output:
+        - ASCII grid of the map
+    '''
+    header = None
+    held = []
+    closed = False
+
+    while True:
+        item = maps.get()
+        if item is None:
+            break
+
+        name, rows = item
+        if errors or closed or name not in ('header', stream_map):
+            continue
+
+        try:
+            if name == 'header':
+                header = rows
+                if header['nrows'] > 0:
+                    stream.writelines(key + ' ' + str(value) + '\n'
+                                      for key, value in header.items())
+                continue
+
+            nodata = str(header['NODATA_value'])
+            lines = [' '.join(nodata if math.isnan(cell)
+                              else str(cell) if name == 'aspect'
+                              else str(round(cell, 1)) for cell in row)
+                     + '\n' for row in rows]
+
+            if header['nrows'] > 0:
+                stream.writelines(lines)
+            else:
+                held.extend(lines)
+
+        except BrokenPipeError:
+            closed = True
+        except BaseException as error:
+            errors.append(error)
+
+    try:
+        # No nrows header data - the map was held until the last row.
+        if header is not None and header['nrows'] == 0 \
+                and not (errors or closed):
+            header['nrows'] = len(held)
+            stream.writelines(key + ' ' + str(value) + '\n'
+                              for key, value in header.items())
+            stream.writelines(held)
+
+        stream.flush()
+
+    except BrokenPipeError:
+        closed = True
+
+    # Anything still buffered can not be written, so is discarded.
+    if closed:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+
+
+def run(terrain, resolution, d8_dict, fill_sinks=False, slope_map='D',
+        aspect_map='Y', block_rows=BLOCK_ROWS, queue_blocks=QUEUE_BLOCKS,
+        stream=None, stream_map=None):
+    '''
+    Use this function to read the terrain, calculate the D8 slope and
+    aspect of every cell and write the map files, with the three stages
+    overlapped.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Terrain surface data instance (SurfaceRaster, not yet read)
+        - Terrain resolution / cell size
+        - D8 dictionary
+        - Fill sinks indicator (True / False)
+        - Slope map selection (P/D/B)
+        - Aspect map selection (Y/N)
+        - No. of rows per block
+        - No. of blocks each queue can hold
+        - Stream for one map instead of the map files (optional)
+        - Map streamed (perc, deg or aspect)
+
+    Output:
+        - Gradient (rows of Neighbourhood instances, ties resolved)
+        - Terrain cells (rows of Python floats) kept in the terrain instance
+        - Files
+            - slope_map_perc.txt, slope_map_deg.txt, aspect_map.txt
+        - or one map streamed as an ASCII grid
+    '''
+    blocks = queue.Queue(maxsize=queue_blocks)
+    maps = queue.Queue(maxsize=queue_blocks)
+    errors = []
+
+    reader = threading.Thread(target=read_stage,
+                              args=(terrain, block_rows, blocks), daemon=True)
+    if stream is None:
+        writer = threading.Thread(target=write_stage,
+                                  args=(maps, slope_map, aspect_map, errors))
+    else:
+        writer = threading.Thread(target=stream_stage,
+                                  args=(maps, stream, stream_map, errors))
+    reader.start()
+    writer.start()
+
+    gradient = []
+    ties = []
+    above = []
+    block = None
+
+    try:
+        while True:
+            below = blocks.get()
+            if isinstance(below, BaseException):
+                raise below
+
+            # Header data has been read before the first block.
+            if block is None and below is not None:
+                terrain.corner_reference()
+                maps.put(('header', {'ncols': len(below[0]),
+                                     'nrows': terrain.nrows,
+                                     'xllcorner': terrain.xllcorner,
+                                     'yllcorner': terrain.yllcorner,
+                                     'cellsize': terrain.cellsize
+                                                 or resolution,
+                                     'NODATA_value': terrain.nodata_value}))
+
+            # Calculate the block before, now the row below it is known.
+            if block is not None:
+                halo = below[:1] if below is not None else []
+                window = above + block + halo
+                top = len(gradient)
+
+                for y in range(len(above), len(above) + len(block)):
+                    row = []
+
+                    for x in range(len(window[y])):
+                        # Create 3 x 3 neighbourhood instance.
+                        cell = nbh.Neighbourhood(window, resolution, y, x)
+
+                        # Handle NoData cell.
+                        if cell.centre == terrain.nodata_value:
+                            window[y][x] = math.nan
+
+                        cell.slope_aspect(d8_dict, terrain.nodata_value)
+
+                        if fill_sinks and cell.slope == -math.inf:
+                            cell.sink_fill(d8_dict)
+
+                        if len(cell.d8) > 1:
+                            ties.append((top + y - len(above), x))
+
+                        row.append(cell)
+
+                    gradient.append(row)
+
+                maps.put(('perc', [[cell.slope_perc for cell in row]
+                                   for row in gradient[top:]]))
+                maps.put(('deg', [[cell.slope_deg for cell in row]
+                                  for row in gradient[top:]]))
+
+                terrain.cells.extend(block)
+                above = block[-1:]
+
+            if below is None:
+                break
+            block = below
+
+        # Resolve the ties, row by row, until no more can be resolved.
+        keep_looping = True
+
+        while keep_looping:
+            keep_looping = False
+
+            for r, c in ties:
+                if len(gradient[r][c].d8) > 1 \
+                        and nbh.resolve_tie(gradient, r, c, d8_dict):
+                    keep_looping = True
+
+        maps.put(('aspect', [[cell.aspect for cell in row]
+                             for row in gradient]))
+
+    finally:
+        maps.put(None)
+        writer.join()
+
+    if errors:
+        raise errors[0]
+
+    return gradient
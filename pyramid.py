@@ -0,0 +1,251 @@
+'''
+Overview Pyramid Data Object
+
+Purpose:
+    - Holds a map and cached reduced resolution copies of it
+      (2x, 4x and 8x decimation)
+    - Displays the copy that best matches the size of a Matplotlib sub plot,
+      switching to finer copies of the visible area when zooming in
+
+Developer Note:
+    - Elevation and slope are reduced using the mean of each block of cells.
+      D8 aspect is a set of 8 directions, so the most common direction
+      (mode) is used.  A continuous aspect (D-infinity) is reduced using
+      the circular mean, so that 350 and 10 degrees average to North.
+
+Filename:
+    - pyramid.py
+
+Classes:
+    - Pyramid
+
+Methods:
+    - level
+    - level_for
+    - show
+    - refresh
+
+Functions:
+    - decimate
+
+Input:
+    - Map data (array or nested list, NaN for NoData)
+    - Reduction method (mean, mode or circular)
+
+Output:
+    - Instance of Pyramid class
+'''
+
+import math
+import warnings
+import numpy as np
+
+
+def decimate(grid, factor, method='mean'):
+    '''
+    Use this function to reduce the resolution of a map by combining each
+    factor x factor block of cells into one.  NoData (NaN) cells are
+    ignored, and blocks with no data are NaN.
+
+    Triggered by:
+        - Pyramid.level
+        - any python program
+
+    Input:
+        - Map data array
+        - Reduction factor (cells)
+        - Reduction method (mean, mode or circular)
+
+    Output:
+        - Reduced map data array
+    '''
+    y_limit, x_limit = grid.shape
+    y_blocks = -(-y_limit // factor)
+    x_blocks = -(-x_limit // factor)
+
+    padded = np.full((y_blocks * factor, x_blocks * factor), np.nan)
+    padded[:y_limit, :x_limit] = grid
+    blocks = padded.reshape(y_blocks, factor, x_blocks, factor) \
+                   .swapaxes(1, 2).reshape(y_blocks, x_blocks, factor ** 2)
+    empty = np.all(np.isnan(blocks), axis=2)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        if method == 'mode':
+            values = np.unique(blocks[~np.isnan(blocks)])
+            if values.size == 0:
+                return np.full(empty.shape, np.nan)
+            counts = np.stack([np.sum(blocks == value, axis=2)
+                               for value in values])
+            reduced = values[np.argmax(counts, axis=0)]
+
+        elif method == 'circular':
+            angle = np.radians(blocks)
+            reduced = np.mod(np.degrees(np.arctan2(
+                                np.nanmean(np.sin(angle), axis=2),
+                                np.nanmean(np.cos(angle), axis=2))), 360)
+
+        else:
+            reduced = np.nanmean(blocks, axis=2)
+
+    reduced[empty] = np.nan
+
+    return reduced
+
+
+#----------------------------------------------------------
+# Pyramid Class
+#----------------------------------------------------------
+class Pyramid():
+    '''
+    Map data with cached reduced resolution copies.
+    '''
+
+    def __init__(self, grid, method='mean', levels=3):
+        '''
+        Initialises data object instance.  Reduced copies are only
+        calculated when first needed, then kept.
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+
+        Input:
+            - Map data (array or nested list, NaN for NoData)
+            - Reduction method (mean, mode or circular)
+            - Number of reduced levels (level n = 2**n decimation)
+
+        Output:
+            - Pyramid data instance
+        '''
+        self.method = method
+        self.levels = levels
+        self.cache = {0: np.asarray(grid, dtype=np.float64)}
+        self.y_limit, self.x_limit = self.cache[0].shape
+        self.image = None
+        self.refreshing = False
+
+
+    def level(self, n):
+        '''
+        Use this method to get a level of the pyramid.
+
+        Triggered by:
+            - show
+            - any python program
+
+        Input:
+            - Level (0 = full resolution, n = 2**n decimation)
+
+        Output:
+            - Map data array for the level
+        '''
+        if n not in self.cache:
+            self.cache[n] = decimate(self.cache[0], 2 ** n, self.method)
+
+        return self.cache[n]
+
+
+    def level_for(self, cells, pixels):
+        '''
+        Use this method to choose the coarsest level that still has at least
+        one cell for every screen pixel.
+
+        Triggered by:
+            - show
+            - any python program
+
+        Input:
+            - Number of full resolution cells to be displayed (across)
+            - Number of screen pixels available (across)
+
+        Output:
+            - Level
+        '''
+        n = 0
+        while n < self.levels and cells / 2 ** (n + 1) >= pixels:
+            n += 1
+
+        return n
+
+
+    def show(self, ax, **kwargs):
+        '''
+        Use this method to display the map on a Matplotlib sub plot, at the
+        level matching the sub plot size.  Zooming in redisplays the
+        visible area from a finer level.
+
+        Axes coordinates are full resolution cells whichever level is
+        displayed, so ticks and extents are not affected.
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+
+        Input:
+            - Matplotlib sub plot (Axes)
+            - Matplotlib imshow arguments
+
+        Output:
+            - Matplotlib image
+        '''
+        # Colours are set from the full resolution data.
+        base = self.cache[0]
+        if 'vmin' not in kwargs and 'vmax' not in kwargs \
+                and not np.all(np.isnan(base)):
+            kwargs['vmin'] = np.nanmin(base)
+            kwargs['vmax'] = np.nanmax(base)
+
+        self.image = ax.imshow(base[:1, :1], **kwargs)
+        ax.set_xlim(-0.5, self.x_limit - 0.5)
+        ax.set_ylim(self.y_limit - 0.5, -0.5)
+        self.refresh(ax)
+
+        ax.callbacks.connect('xlim_changed', self.refresh)
+        ax.callbacks.connect('ylim_changed', self.refresh)
+
+        return self.image
+
+
+    def refresh(self, ax):
+        '''
+        Use this method to redisplay the visible area of the map from the
+        level matching the current zoom.
+
+        Triggered by:
+            - show
+            - Matplotlib zoom / pan (axes limits changed)
+
+        Input:
+            - Matplotlib sub plot (Axes)
+
+        Output:
+            - Updated Matplotlib image
+        '''
+        if self.refreshing:
+            return
+        self.refreshing = True
+
+        (x_min, x_max), (y_max, y_min) = ax.get_xlim(), ax.get_ylim()
+        pixels = max(ax.get_window_extent().width, 1)
+        n = self.level_for(abs(x_max - x_min), pixels)
+        factor = 2 ** n
+        grid = self.level(n)
+
+        # Visible area in level cells, with a 1 cell margin.
+        top = max(int(math.floor((min(y_min, y_max) + 0.5) / factor)) - 1, 0)
+        bottom = int(math.ceil((max(y_min, y_max) + 0.5) / factor)) + 1
+        left = max(int(math.floor((min(x_min, x_max) + 0.5) / factor)) - 1, 0)
+        right = int(math.ceil((max(x_min, x_max) + 0.5) / factor)) + 1
+        window = grid[top:bottom, left:right]
+
+        self.image.set_data(window)
+        self.image.set_extent((left * factor - 0.5,
+                               (left + window.shape[1]) * factor - 0.5,
+                               (top + window.shape[0]) * factor - 0.5,
+                               top * factor - 0.5))
+        ax.set_xlim(x_min, x_max)
+        ax.set_ylim(y_max, y_min)
+
+        self.refreshing = False
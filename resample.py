@@ -0,0 +1,155 @@
+'''
+Resampling Calculations
+
+Purpose:
+    - Resamples terrain cell data to a different cell size before slope and
+      aspect are calculated, e.g. a 5 m DEM analysed at 50 m, without
+      writing an intermediate file:
+        - mean, min, max: each block of cells (target cell size a whole
+          multiple of the cell size) combined into one cell
+        - bilinear, nearest: the cell data at the centre of each target
+          cell (any target cell size, coarser or finer)
+
+Developer Note:
+    - Whole target cells are laid out from the lower left corner, so the
+      corner reference is the same after resampling.  Cells left over at
+      the top and East edges are dropped.
+    - NoData (NaN) cells are ignored by mean, min and max (a block of only
+      NoData is NoData).  Bilinear is NoData if any of the 4 cells around
+      the target centre is NoData.
+
+Filename:
+    - resample.py
+
+Functions:
+    - block_aggregate
+    - interpolate
+    - resample
+
+Input:
+    - Cell data array (NaN for NoData)
+    - Cell size and target cell size
+    - Resampling method
+
+Output:
+    - Resampled cell data array (NaN for NoData)
+'''
+
+import sys
+import warnings
+import numpy as np
+
+
+METHODS = ('MEAN', 'MIN', 'MAX', 'BILINEAR', 'NEAREST')
+BLOCK_METHODS = {'MEAN': np.nanmean, 'MIN': np.nanmin, 'MAX': np.nanmax}
+
+
+def block_aggregate(grid, factor, method='MEAN'):
+    '''
+    Use this function to combine each factor x factor block of cells into
+    one, working up from the bottom left cell.
+
+    Triggered by:
+        - resample
+
+    Input:
+        - Cell data array (NaN for NoData)
+        - Block size (cells)
+        - Method (MEAN, MIN or MAX)
+
+    Output:
+        - Resampled cell data array
+    '''
+    y_limit, x_limit = grid.shape
+    y_blocks, x_blocks = y_limit // factor, x_limit // factor
+
+    blocks = grid[y_limit - y_blocks * factor:, :x_blocks * factor] \
+                 .reshape(y_blocks, factor, x_blocks, factor)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        return BLOCK_METHODS[method](blocks, axis=(1, 3))
+
+
+def interpolate(grid, ratio, y_cells, x_cells, method='BILINEAR'):
+    '''
+    Use this function to find the cell data at the centre of each target
+    cell.  Centres beyond the outer cell centres take the outer cells.
+
+    Triggered by:
+        - resample
+
+    Input:
+        - Cell data array (NaN for NoData)
+        - Target cell size / cell size
+        - No. of target rows and columns
+        - Method (BILINEAR or NEAREST)
+
+    Output:
+        - Resampled cell data array
+    '''
+    y_limit, x_limit = grid.shape
+
+    # Target centres in cells, rows counted up from the bottom row.
+    x = np.clip((np.arange(x_cells) + 0.5) * ratio - 0.5, 0, x_limit - 1)
+    y = np.clip((np.arange(y_cells)[::-1] + 0.5) * ratio - 0.5, 0,
+                y_limit - 1)
+    y = y_limit - 1 - y
+
+    if method == 'NEAREST':
+        rows = np.floor(y + 0.5).astype(np.int64)
+        cols = np.floor(x + 0.5).astype(np.int64)
+        return grid[np.ix_(rows, cols)]
+
+    top = np.clip(np.floor(y).astype(np.int64), 0, max(y_limit - 2, 0))
+    left = np.clip(np.floor(x).astype(np.int64), 0, max(x_limit - 2, 0))
+    bottom = np.minimum(top + 1, y_limit - 1)
+    right = np.minimum(left + 1, x_limit - 1)
+    dy = (y - top)[:, np.newaxis]
+    dx = (x - left)[np.newaxis, :]
+
+    upper = grid[np.ix_(top, left)] * (1 - dx) + grid[np.ix_(top, right)] * dx
+    lower = grid[np.ix_(bottom, left)] * (1 - dx) \
+            + grid[np.ix_(bottom, right)] * dx
+
+    return upper * (1 - dy) + lower * dy
+
+
+def resample(grid, cellsize, target_cellsize, method='MEAN'):
+    '''
+    Use this function to resample cell data to the target cell size.
+
+    Triggered by:
+        - surface.SurfaceRaster.resample
+        - any python program
+
+    Input:
+        - Cell data array (NaN for NoData)
+        - Cell size
+        - Target cell size
+        - Method (MEAN, MIN, MAX, BILINEAR or NEAREST)
+
+    Output:
+        - Resampled cell data array
+        - Validation exceptions (target cell size not a whole multiple for
+          MEAN, MIN or MAX, or larger than the terrain)
+    '''
+    grid = np.asarray(grid, dtype=np.float64)
+    y_cells = grid.shape[0] * cellsize // target_cellsize
+    x_cells = grid.shape[1] * cellsize // target_cellsize
+
+    if y_cells == 0 or x_cells == 0:
+        sys.exit('Resampled cell size ' + str(target_cellsize)
+                 + ' is larger than the terrain.')
+
+    if method in BLOCK_METHODS:
+        if target_cellsize % cellsize != 0:
+            sys.exit('Resampled cell size ' + str(target_cellsize)
+                     + ' must be a multiple of the cell size '
+                     + str(cellsize) + ' for ' + method + '.')
+
+        return block_aggregate(grid, target_cellsize // cellsize, method)
+
+    return interpolate(grid, target_cellsize / cellsize, y_cells, x_cells,
+                       method)
@@ -0,0 +1,390 @@
+'''
+Distributed Shard Processing
+Started from the command line
+
+Purpose:
+    - Spreads the slope and aspect calculation of a large terrain over
+      several worker processes or hosts sharing a directory:
+        - plan:  splits the terrain into shards, each with a 1 cell halo
+                 from the shards around it, and writes a manifest
+        - work:  calculates the slope, aspect and D8 ties of shards not yet
+                 done (any number of workers can run at the same time),
+                 writing the map data files of each shard
+        - merge: resolves the D8 ties across shard borders and assembles
+                 the output files
+
+Developer Note:
+    - Shards are calculated the same way as the tiles of a mosaic
+      (mosaic.calculate_window and mosaic.resolve_ties), so the merged
+      output files are the same as from tothemaxmain.py.
+    - A worker claims a shard by creating its .lock file, which only one
+      worker can do.  If a worker is stopped part way through a shard,
+      delete the shard's .lock file so another worker can take it.
+    - Each shard's map data files are kept apart from its tie state (its
+      tied cells and the aspect of its border cells and the cells next to
+      its ties, see mosaic.known_cells).  merge resolves the ties from the
+      tie state of every shard, patches the tied cells whose aspect has
+      changed, then copies each band of shards into the output files a
+      row at a time, so the whole terrain is never held in memory.
+    - The tie state is written last, to a new file which then replaces
+      the old one, so merge never reads a part written result.
+
+Filename:
+    - shard.py
+
+Functions:
+    - shard_columns
+    - plan
+    - work_shard
+    - work
+    - merge
+
+Input:
+    - plan:  raster dataset URL, shard directory, shard size (rows and
+             columns), resolution, fill sinks indicator
+    - work:  shard directory, shard number (optional)
+    - merge: shard directory
+
+Output:
+    - plan:  shard_<n>.asc for each shard, manifest.json
+    - work:  shard_<n>_slope_map_perc.txt, shard_<n>_slope_map_deg.txt,
+             shard_<n>_aspect_map.txt and shard_<n>.pkl (tie state) for
+             each shard calculated
+    - merge: slope_map_perc.txt, slope_map_deg.txt, aspect_map.txt
+'''
+
+import os
+import sys
+import csv
+import json
+import pickle
+import argparse
+import mosaic
+import surface
+
+
+DICT_ASPECT = {1:90, 2:135, 4:180, 8:225, 16:270, 32:315, 64:0, 128:45}
+MANIFEST = 'manifest.json'
+
+
+def shard_columns(ncols, shard_cols):
+    '''
+    Use this function to split the columns of the terrain into shards.
+    A 1 column shard at the East edge is joined to the shard before it,
+    as with a halo column it would look like a 2 field header row.
+
+    Triggered by:
+        - plan
+
+    Input:
+        - No. of terrain columns
+        - No. of columns per shard
+
+    Output:
+        - List of (first column, no. of columns)
+    '''
+    columns = [(c, min(shard_cols, ncols - c))
+               for c in range(0, ncols, shard_cols)]
+
+    if len(columns) > 1 and columns[-1][1] == 1:
+        columns[-2:] = [(columns[-2][0], columns[-2][1] + 1)]
+
+    return columns
+
+
+def plan(dataset, directory, shard_rows, shard_cols, resolution,
+         fill_sinks):
+    '''
+    Use this function to split a terrain into shards with a halo.  The
+    terrain is read a block of rows at a time, and only the shards of the
+    current rows are open.
+
+    Triggered by:
+        - Command line (plan)
+
+    Input:
+        - Dataset URL
+        - Shard directory
+        - No. of rows per shard
+        - No. of columns per shard
+        - Terrain resolution / cell size
+        - Fill sinks indicator (Y/N)
+
+    Output:
+        - Files
+            - shard_<n>.asc for each shard
+            - manifest.json
+    '''
+    os.makedirs(directory, exist_ok=True)
+    raster = surface.SurfaceRaster(dataset)
+    shards = []
+    band = []       # Open shards of the current band (file, writer, shard)
+    above = None    # Last row, the top halo of the next band
+    r = 0
+
+    for block in raster.read_blocks(shard_rows):
+        for row in block:
+
+            # First row of a band - close the band above (with this row as
+            # its bottom halo) and open the shards of this band.
+            if r % shard_rows == 0:
+                if r == 0:
+                    columns = shard_columns(len(row), shard_cols)
+
+                for f, output, shard in band:
+                    output.writerow(row[max(shard['first_col'] - 1, 0):
+                                        shard['first_col'] + shard['ncols']
+                                        + 1])
+                    f.close()
+
+                band = []
+                for first_col, ncols in columns:
+                    shard = {'name': 'shard_' + str(len(shards)),
+                             'first_row': r, 'first_col': first_col,
+                             'nrows': 0, 'ncols': ncols,
+                             'top_halo': 1 if r > 0 else 0,
+                             'left_halo': 1 if first_col > 0 else 0}
+                    shards.append(shard)
+
+                    f = open(os.path.join(directory, shard['name'] + '.asc'),
+                             'w', newline='')
+                    output = csv.writer(f, delimiter=' ')
+                    left = first_col - shard['left_halo']
+                    right = min(first_col + ncols + 1, len(row))
+                    output.writerow(['ncols', right - left])
+                    output.writerow(['NODATA_value', raster.nodata_value])
+                    if above is not None:
+                        output.writerow(above[left:right])
+                    band.append((f, output, shard))
+
+            for f, output, shard in band:
+                output.writerow(row[shard['first_col'] - shard['left_halo']:
+                                    shard['first_col'] + shard['ncols'] + 1])
+                shard['nrows'] += 1
+
+            above = row
+            r += 1
+
+    for f, output, shard in band:
+        f.close()
+
+    raster.close_raster()
+
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump({'dataset': dataset, 'nrows': r, 'ncols': len(above),
+                   'nodata_value': raster.nodata_value,
+                   'resolution': resolution, 'fill_sinks': fill_sinks,
+                   'shards': shards}, f, indent=1)
+
+    return shards
+
+
+def work_shard(directory, manifest, shard):
+    '''
+    Use this function to calculate the slope, aspect and D8 ties of one
+    shard.
+
+    Triggered by:
+        - work
+
+    Input:
+        - Shard directory
+        - Manifest
+        - Shard (from the manifest)
+
+    Output:
+        - Files
+            - shard_<n>_slope_map_perc.txt, shard_<n>_slope_map_deg.txt,
+              shard_<n>_aspect_map.txt (see mosaic.write_maps)
+            - shard_<n>.pkl (tied cells and aspect of the cells next to
+              them, see mosaic.known_cells)
+    '''
+    raster = surface.SurfaceRaster(os.path.join(directory,
+                                                shard['name'] + '.asc'))
+    raster.read_raster()
+    raster.close_raster()
+
+    tile = (shard['first_row'], shard['first_col'], shard['nrows'],
+            shard['ncols'])
+    slope_perc, slope_deg, aspect, ties = mosaic.calculate_window(
+                    raster.cells, shard['top_halo'], shard['left_halo'], tile,
+                    manifest['resolution'], DICT_ASPECT,
+                    manifest['nodata_value'], manifest['fill_sinks'] == 'Y')
+
+    mosaic.write_maps(os.path.join(directory, shard['name']), slope_perc,
+                      slope_deg, aspect)
+
+    result_file = os.path.join(directory, shard['name'] + '.pkl')
+    with open(result_file + '.tmp', 'wb') as f:
+        pickle.dump((ties, mosaic.known_cells(tile, aspect, ties)), f)
+
+    os.replace(result_file + '.tmp', result_file)
+
+
+def work(directory, shard_no=None):
+    '''
+    Use this function to calculate shards not yet done or claimed by
+    another worker (or one shard, if a shard number is given).
+
+    Triggered by:
+        - Command line (work)
+
+    Input:
+        - Shard directory
+        - Shard number (optional)
+
+    Output:
+        - No. of shards calculated
+    '''
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    if shard_no is None:
+        shards = manifest['shards']
+    else:
+        shards = [manifest['shards'][shard_no]]
+
+    done = 0
+
+    for shard in shards:
+        name = os.path.join(directory, shard['name'])
+
+        if os.path.exists(name + '.pkl'):
+            continue
+
+        # Claim the shard.
+        try:
+            os.close(os.open(name + '.lock', os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            continue
+
+        work_shard(directory, manifest, shard)
+        done += 1
+
+    return done
+
+
+def merge(directory):
+    '''
+    Use this function to resolve the D8 ties across shard borders and
+    write the output files.
+
+    Triggered by:
+        - Command line (merge)
+
+    Input:
+        - Shard directory
+
+    Output:
+        - Files
+            - slope_map_perc.txt, slope_map_deg.txt, aspect_map.txt
+        - Validation exceptions (shards not calculated)
+    '''
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    shards = manifest['shards']
+    missing = [shard['name'] for shard in shards
+               if not os.path.exists(os.path.join(directory,
+                                                  shard['name'] + '.pkl'))]
+    if missing:
+        sys.exit('Shards not calculated: ' + ', '.join(missing))
+
+    ties, known = {}, {}
+    for shard in shards:
+        with open(os.path.join(directory, shard['name'] + '.pkl'), 'rb') as f:
+            shard_ties, shard_known = pickle.load(f)
+        ties.update(shard_ties)
+        known.update(shard_known)
+
+    resolved = mosaic.resolve_ties(manifest['nrows'], manifest['ncols'],
+                                   known, ties, DICT_ASPECT)
+
+    # Patch the tied cells whose aspect has changed.
+    tiles = [(shard['first_row'], shard['first_col'],
+              shard['nrows'], shard['ncols']) for shard in shards]
+    tile_index = mosaic.index_tiles(tiles)
+    changed = {}
+    for (r, c), aspect in resolved.items():
+        if aspect != ties[(r, c)][0]:
+            i = mosaic.find_tile(tile_index, r, c)
+            changed.setdefault(i, {})[(r - tiles[i][0],
+                                       c - tiles[i][1])] = aspect
+
+    for i, cells in changed.items():
+        mosaic.patch_map(os.path.join(directory, shards[i]['name']
+                                      + '_aspect_map.txt'), cells)
+
+    # Shards of the same band are next to each other in the manifest.
+    bands = {}
+    for shard in shards:
+        bands.setdefault(shard['first_row'], []).append(shard['name'])
+
+    for name in mosaic.MAP_NAMES:
+        output = open(name + '.txt', 'w', newline='')
+
+        for first_row in sorted(bands):
+            files = [open(os.path.join(directory, shard_name + '_' + name
+                                       + '.txt'), newline='')
+                     for shard_name in bands[first_row]]
+
+            for lines in zip(*files):
+                output.write(' '.join(line.rstrip('\r\n') for line in lines)
+                             + '\r\n')
+
+            for f in files:
+                f.close()
+
+        output.close()
+
+
+#----------------------------------------------------------
+# Command line: plan, work or merge.
+#----------------------------------------------------------
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan_args = commands.add_parser('plan', help='Split a raster into shards')
+    plan_args.add_argument('--filename', dest='file_name', required=True,
+                           help='Raster input file name')
+    plan_args.add_argument('--dir', dest='directory', required=True,
+                           help='Shard directory')
+    plan_args.add_argument('--shardrows', dest='shard_rows', type=int,
+                           default=500, help='Rows per shard (integer)')
+    plan_args.add_argument('--shardcols', dest='shard_cols', type=int,
+                           default=500, help='Columns per shard (integer)')
+    plan_args.add_argument('--resolution', dest='resolution', type=int,
+                           default=50, help='Resolution / cell size '
+                           + '(metres, integer)')
+    plan_args.add_argument('--fillsinks', dest='fill_sinks', default='Y',
+                           help='Fill in sinks / holes (Y/N)')
+
+    work_args = commands.add_parser('work', help='Calculate shards')
+    work_args.add_argument('--dir', dest='directory', required=True,
+                           help='Shard directory')
+    work_args.add_argument('--shard', dest='shard_no', type=int,
+                           default=None, help='Shard number (default all '
+                           + 'shards not yet claimed)')
+
+    merge_args = commands.add_parser('merge', help='Merge shard results')
+    merge_args.add_argument('--dir', dest='directory', required=True,
+                            help='Shard directory')
+
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        if args.shard_rows < 1 or args.shard_cols < 2 or args.resolution < 1:
+            parser.exit(1, 'Shard rows and resolution must be positive, '
+                        + 'shard columns at least 2 - aborting\n')
+        shards = plan(args.file_name, args.directory, args.shard_rows,
+                      args.shard_cols, args.resolution,
+                      args.fill_sinks.upper())
+        print(len(shards), 'shards planned')
+
+    elif args.command == 'work':
+        print(work(args.directory, args.shard_no), 'shards calculated')
+
+    else:
+        merge(args.directory)
@@ -0,0 +1,191 @@
+'''
+Slope Class Calculations
+
+Purpose:
+    - Reclassifies slope (degrees) into slope classes using class breaks,
+      e.g. < 30, 30 - 35, 35 - 45 and >= 45 degrees for avalanche terrain
+    - Totals the area of each slope class facing each aspect octant
+      (N, NE, E, SE, S, SW, W, NW)
+
+Developer Note:
+    - The area table is built from one histogram (numpy bincount) of
+      combined class and octant numbers, using the slope and aspect map
+      data already calculated, so the text output files do not need to
+      be read back in by another program.
+
+Filename:
+    - slopeclass.py
+
+Functions:
+    - parse_breaks
+    - classify
+    - octant
+    - class_area_table
+    - class_labels
+    - area_report
+
+Input:
+    - Slope map data (degrees, NaN for NoData)
+    - Aspect map data (degrees clockwise from North, NaN for NoData)
+    - Class breaks (degrees)
+    - Terrain resolution / cell size
+
+Output:
+    - Slope class array (uint8, NODATA_CLASS for NoData)
+    - Area table (slope class x aspect octant)
+'''
+
+import numpy as np
+
+
+DEFAULT_BREAKS = (30, 35, 45)
+OCTANTS = ('N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW')
+NODATA_CLASS = 255
+
+
+def parse_breaks(text):
+    '''
+    Use this function to convert comma separated class breaks to numbers.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Class breaks (e.g. '30,35,45', Y for DEFAULT_BREAKS)
+
+    Output:
+        - Class breaks (tuple of degrees), or None if not valid (not
+          numbers, not increasing, outside 0 - 90 degrees or too many)
+    '''
+    if text.upper() == 'Y':
+        return DEFAULT_BREAKS
+
+    try:
+        breaks = tuple(float(value) for value in text.split(','))
+    except ValueError:
+        return None
+
+    if len(breaks) >= NODATA_CLASS \
+            or any(value <= 0 or value >= 90 for value in breaks) \
+            or any(b1 >= b2 for b1, b2 in zip(breaks, breaks[1:])):
+        return None
+
+    return breaks
+
+
+def classify(slope_deg, breaks=DEFAULT_BREAKS):
+    '''
+    Use this function to reclassify slope into slope classes.  Class 0 is
+    below the first break, class n is from break n (inclusive).
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Slope map data (degrees, NaN for NoData)
+        - Class breaks (degrees)
+
+    Output:
+        - Slope class array (uint8, NODATA_CLASS for NoData)
+    '''
+    slope_deg = np.asarray(slope_deg, dtype=np.float64)
+    classes = np.digitize(slope_deg, breaks).astype(np.uint8)
+    classes[np.isnan(slope_deg)] = NODATA_CLASS
+
+    return classes
+
+
+def octant(aspect):
+    '''
+    Use this function to find the aspect octant of every cell (0 = N,
+    1 = NE ... 7 = NW, each 45 degrees wide centred on its direction).
+
+    Triggered by:
+        - class_area_table
+
+    Input:
+        - Aspect map data (degrees clockwise from North, NaN for NoData)
+
+    Output:
+        - Octant array (-1 for NoData)
+    '''
+    aspect = np.asarray(aspect, dtype=np.float64)
+    octants = np.full(aspect.shape, -1, dtype=np.int64)
+    valid = ~np.isnan(aspect)
+    octants[valid] = np.floor((aspect[valid] + 22.5) / 45).astype(np.int64) % 8
+
+    return octants
+
+
+def class_area_table(classes, aspect, class_count, resolution):
+    '''
+    Use this function to total the area of each slope class facing each
+    aspect octant.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Slope class array (from classify)
+        - Aspect map data (degrees clockwise from North, NaN for NoData)
+        - No. of slope classes (no. of breaks + 1)
+        - Terrain resolution / cell size (metres)
+
+    Output:
+        - Area array (slope classes x 8 octants, square metres)
+    '''
+    octants = octant(aspect)
+    valid = (classes != NODATA_CLASS) & (octants >= 0)
+    counts = np.bincount(classes[valid].astype(np.int64) * 8
+                         + octants[valid], minlength=class_count * 8)
+
+    return counts.reshape(class_count, 8) * float(resolution) ** 2
+
+
+def class_labels(breaks=DEFAULT_BREAKS):
+    '''
+    Use this function to name the slope classes.
+
+    Triggered by:
+        - area_report
+        - tothemaxmain.py
+
+    Input:
+        - Class breaks (degrees)
+
+    Output:
+        - List of class names (e.g. '<30', '30-35', '>=45')
+    '''
+    names = [f'{value:g}' for value in breaks]
+
+    return (['<' + names[0]]
+            + [low + '-' + high for low, high in zip(names, names[1:])]
+            + ['>=' + names[-1]])
+
+
+def area_report(table, breaks=DEFAULT_BREAKS):
+    '''
+    Use this function to lay out the area table for display and output.
+
+    Triggered by:
+        - tothemaxmain.py
+
+    Input:
+        - Area array (from class_area_table)
+        - Class breaks (degrees)
+
+    Output:
+        - Report rows (lists of strings, first row headings), areas in
+          hectares
+    '''
+    rows = [['Class'] + list(OCTANTS) + ['Total']]
+    hectares = table / 10000
+
+    for name, areas in zip(class_labels(breaks), hectares):
+        rows.append([name] + [f'{area:.2f}' for area in areas]
+                    + [f'{areas.sum():.2f}'])
+
+    rows.append(['Total'] + [f'{area:.2f}' for area in hectares.sum(axis=0)]
+                + [f'{hectares.sum():.2f}'])
+
+    return rows
@@ -8,28 +8,99 @@ Purpose:
     
 Developer Note:
     - This class can be used for extracting data from any raster DEM dataset.
+    - By default cell data is held as rows of Python floats.  For large
+      DEMs the cells can instead be stored as float32, or as int16 / int32
+      (optionally scaled by a number of decimal places), with NoData cells
+      held in a separate packed bit mask.  Stored integers convert back to
+      exactly the same float64 values as read from the dataset.
+    - float32 holds about 7 significant digits, so stored float32 values
+      are rounded to FLOAT32_DIGITS significant digits when converted
+      back.  Values of up to 7 significant digits (e.g. 1234.567) convert
+      back to exactly the same float64 values as read from the dataset;
+      longer values can not, and may change the maps.
+    - While reading, the cells that are not NoData are counted in blocks
+      of BLOCK_SIZE x BLOCK_SIZE cells (occupancy index), so blocks with
+      no data can be skipped when processing sparse (e.g. coastal or
+      clipped) DEMs.
+    - Large datasets can be read by several worker processes at once
+      (read_parallel).  The cell data after the header is split into byte
+      ranges that start and end on a new line.  The lines of each range
+      are counted first (without parsing), so the first row and line
+      number of every range are known, then each worker parses its ranges
+      straight into one shared memory array, given to the workers once
+      when they are started.
+    - A tiled binary raster (tiledraster.py) can be given instead of an
+      ASCII grid.  It is recognised by its signature, its header data is
+      known when opened, and its cell data is read a tile at a time.
 
 Filename: 
     - surface.py 
 
 Classes: 
     - SurfaceRaster
+    - ElevationGrid
+
+Functions:
+    - count_lines
+    - start_worker
+    - parse_lines
     
 Methods:
     - read_raster
+    - read_blocks
+    - read_strided
+    - read_parallel
+    - store_grid
+    - parse_row
+    - check_raster
+    - read_header
+    - corner_reference
+    - store_row
+    - index_row
+    - index_blocks
+    - resample
     - close_raster
+    - array (ElevationGrid)
+    - nodata (ElevationGrid)
+    - decode (ElevationGrid)
     
 Input:   
-    - Dataset URL
+    - Dataset URL (- for standard input), ASCII grid or tiled binary 
+      raster
     - CSV field separator
+    - Cell data storage type (optional)
+    - Decimal places kept by integer storage (optional)
         
 Output:
     - Instance of SurfaceRaster class
 '''
 
+import os
 import sys
 import csv
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import sharedctypes
+import numpy as np
+import resample as rsp
+import tiledraster as trs
+
+
+# Cell data storage types other than rows of Python floats.
+STORAGE_TYPES = ('float32', 'int16', 'int32')
+
+# Significant digits float32 values are rounded to when converted back.
+FLOAT32_DIGITS = 7
+
+# Rows and columns of cells per block of the occupancy index.
+BLOCK_SIZE = 32
+
+# Byte ranges per worker process when reading in parallel.
+RANGES_PER_WORKER = 4
+
+# Shared cell data array given to each worker process when started.
+worker_grid = None
 
 #----------------------------------------------------------
 # SurfaceRaster Class
@@ -39,7 +110,7 @@ class SurfaceRaster():
     Input raster dataset data object.
     '''
     
-    def __init__(self, dataset, separator=' '):
+    def __init__(self, dataset, separator=' ', storage=None, decimals=0):
         '''
         Opens input raster dataset.
 
@@ -49,16 +120,28 @@ class SurfaceRaster():
             - any python program
             
         Input:
-            - Dataset URL
+            - Dataset URL (- for standard input), ASCII grid or tiled 
+              binary raster
             - Dataset data cell seperator
+            - Cell data storage type (None for rows of Python floats,
+              or one of STORAGE_TYPES)
+            - Decimal places kept by int16 / int32 storage
             
         Output:
             - Terrain surface data instance
         '''
         
         # Raster file data variables
-        self.f1 = open(dataset, newline='')
+        self.tiled = None
+        if dataset == '-':
+            self.f1 = sys.stdin
+        elif trs.is_tiled(dataset):
+            self.tiled = trs.TiledRaster(dataset)
+            self.f1 = self.tiled.f
+        else:
+            self.f1 = open(dataset, newline='')
         self.reader = csv.reader(self.f1, delimiter=separator)
+        self.separator = separator
 
         # Raseter header data variables
         self.ncols = 0
@@ -73,6 +156,23 @@ class SurfaceRaster():
         # Raster cell data variables
         self.cells = []
         self.cell_count = 0     
+        self.step = 1
+        self.storage = storage
+        self.scale = 10 ** decimals
+        self.nodata_rows = []
+
+        # Occupancy index (cells that are not NoData in each block)
+        self.block_size = BLOCK_SIZE
+        self.occupancy = None
+        self.row_counts = []
+
+        # Tiled binary raster header data is known when opened.
+        if self.tiled is not None:
+            self.nrows, self.ncols = self.tiled.nrows, self.tiled.ncols
+            self.xllcorner = self.tiled.xllcorner
+            self.yllcorner = self.tiled.yllcorner
+            self.cellsize = self.tiled.cellsize
+            self.nodata_value = self.tiled.nodata_value
         
 
     def read_raster(self):
@@ -88,58 +188,395 @@ class SurfaceRaster():
             
         Output:
             - Elevation data from input dataset
+            - Occupancy index of the elevation data
             - Validation exceptions (corruption, if any) of input dataset
         '''
+        if self.tiled is not None:
+            self.store_grid(self.tiled.array())
+            return
+
         for row in self.reader: 
 
-            # Geo-referenced rows will only have two data cells
-            if len(row) == 2:
-                # Geo-referenced header data
-                if row[0].lower() == 'ncols':
-                    self.ncols = int(row[1])
-                elif row[0].lower() == 'nrows':
-                    self.nrows = int(row[1])
-                elif row[0].lower() == 'xllcorner':
-                    self.xllcorner = int(row[1])
-                elif row[0].lower() == 'xllcenter':
-                    self.xllcenter = int(row[1])
-                elif row[0].lower() == 'yllcorner':
-                    self.yllcorner = int(row[1])
-                elif row[0].lower() == 'yllcenter':
-                    self.yllcenter = int(row[1])
-                elif row[0].lower() == 'cellsize':
-                    self.cellsize = int(row[1])
-                elif row[0].lower() == 'nodata_value':
-                    self.nodata_value = int(row[1])
+            values = self.parse_row(row)
+
+            if values is not None:
+                self.index_row(values)
+                if self.storage is None:
+                    self.cells.append(values)
                 else:
-                    pass
-            else:
-                # Cell data
-                if row[0] == '':
-                    row.pop(0)
-                if row[-1] == '':
-                    row.pop(-1)
-                
-                # Keep a running count of cells input
-                self.cell_count += len(row)
- 
-                # Validate cell data is numeric
+                    self.store_row(values)
+
+        self.check_raster(len(self.cells[0]))
+        self.index_blocks()
+
+        # Replace the stored rows with a single grid.
+        if self.storage is not None:
+            self.cells = ElevationGrid(np.vstack(self.cells), 
+                                       np.vstack(self.nodata_rows),
+                                       self.scale, self.nodata_value)
+            self.nodata_rows = []
+
+
+    def read_blocks(self, block_rows):
+        '''
+        Use this method to input a surface raster dataset a block of rows
+        at a time, so that rows can be processed while the rest of the
+        dataset is still being read.  Header data is kept as read_raster 
+        does, but cell data is not kept (cells stays empty).
+
+        Triggered by:
+            - pipeline.py
+            - any python program
+            
+        Input:
+            - No. of rows per block
+            
+        Output:
+            - Blocks (lists of rows) of elevation data from input dataset
+            - Validation exceptions (corruption, if any) of input dataset,
+              after the last block
+        '''
+        if self.tiled is not None:
+            for top in range(0, self.nrows, block_rows):
+                yield self.tiled.window(top, 0, block_rows, 
+                                        self.ncols).tolist()
+            self.corner_reference()
+            return
+
+        block = []
+        row_length = 0
+
+        for row in self.reader: 
+
+            values = self.parse_row(row)
+
+            if values is not None:
+                row_length = row_length or len(values)
+                block.append(values)
+
+                if len(block) == block_rows:
+                    yield block
+                    block = []
+
+        if block:
+            yield block
+
+        self.check_raster(row_length)
+
+
+    def read_strided(self, max_size=200):
+        '''
+        Use this method to input a sample of a surface raster dataset for a
+        quick look: every k-th row and column of cell data, with k chosen
+        so that no more than max_size rows and columns are kept.  Rows in
+        between are skipped without being split into cells.  Header data
+        is kept as read_raster does.
+
+        Triggered by:
+            - tothemaxhome.py
+            - any python program
+            
+        Input:
+            - Maximum no. of rows and columns kept
+            
+        Output:
+            - Sampled elevation data (rows of values, NoData value for
+              NoData cells)
+            - Step between the rows and columns kept (k)
+            - Validation exceptions (non-numeric cell data)
+        '''
+        if self.tiled is not None:
+            self.step = max(1, -(-max(self.nrows, self.ncols) // max_size))
+            self.cells = [self.tiled.window(y, 0, 1, self.ncols)[0, 
+                                                      ::self.step].tolist()
+                          for y in range(0, self.nrows, self.step)]
+            return
+
+        separator = None if self.separator == ' ' else self.separator
+        y = 0
+
+        for line_num, line in enumerate(self.f1, 1):
+
+            # Header data (before the first row of cell data).
+            if y == 0:
+                fields = line.split(separator)
+                if len(fields) == 2:
+                    self.parse_row(fields)
+                    continue
+
+                # Step from the header data, or the first row of cell
+                # data and the size of the dataset.
+                nrows, ncols = self.nrows, self.ncols or len(fields)
+                if nrows == 0 and self.f1 is not sys.stdin:
+                    nrows = os.fstat(self.f1.fileno()).st_size // len(line)
+                self.step = max(1, -(-max(nrows, ncols) // max_size))
+
+            if y % self.step == 0:
                 try:
-                    self.cells.append(
-                            list(map(lambda row_elem: float(row_elem), row)))
-                except:
+                    self.cells.append([float(field) for field in 
+                                       line.split(separator)[::self.step]])
+                except ValueError:
                     sys.exit('Invalid data encountered in row #'  
-                             + str(self.reader.line_num) + ' in raster file.')
+                             + str(line_num) + ' in raster file.')
+            y += 1
+
+        if y == 0:
+            sys.exit('Inconsistent no. of cells per row in raster file.')
+
+        self.corner_reference()
+
+
+    def read_parallel(self, workers):
+        '''
+        Use this method to input a surface raster dataset with several
+        worker processes, each parsing a range of the cell data into a
+        shared memory array.  The result is the same as read_raster.
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+            
+        Input:
+            - No. of worker processes
+            
+        Output:
+            - Elevation data from input dataset
+            - Occupancy index of the elevation data
+            - Validation exceptions (corruption, if any) of input dataset,
+              with the line number of the first bad row
+        '''
+        # Nothing to parse in a tiled binary raster.
+        if self.tiled is not None:
+            self.read_raster()
+            return
+
+        separator = None if self.separator == ' ' \
+                    else self.separator.encode()
+
+        #---------------------------------------------------------
+        # Header data, up to the first row of cell data, and the
+        # byte ranges of the cell data, each moved on to the start
+        # of a line.
+        #---------------------------------------------------------
+        with open(self.f1.name, 'rb') as f:
+            header_lines = 0
+
+            for line in iter(f.readline, b''):
+                row = next(csv.reader([line.decode().rstrip('\r\n')], 
+                                      delimiter=self.separator), [])
+                if len(row) != 2:
+                    break
+                self.parse_row(row)
+                header_lines += 1
+            else:
+                sys.exit('Inconsistent no. of cells per row in raster file.')
+
+            header_end = f.tell() - len(line)
+            ncols = len(line.split(separator))
+            if ncols == 0:
+                sys.exit('Invalid data encountered in row #' 
+                         + str(header_lines + 1) + ' in raster file.')
+            file_size = f.seek(0, os.SEEK_END)
+
+            size = max(1, -(-(file_size - header_end) 
+                            // (workers * RANGES_PER_WORKER)))
+            starts = [header_end]
+
+            for start in range(header_end + size, file_size, size):
+                if start > starts[-1]:
+                    f.seek(start - 1)
+                    f.readline()
+                    if f.tell() < file_size:
+                        starts.append(f.tell())
+
+        ends = starts[1:] + [file_size]
+        n = len(starts)
+
+        # First row of each range.
+        counts = [count_lines(self.f1.name, start, end) 
+                  for start, end in zip(starts, ends)]
+        first_rows = np.cumsum([0] + counts[:-1]).tolist()
+        nrows = sum(counts)
 
+        # Parse each range into its rows of the shared array.
+        shared = sharedctypes.RawArray('d', nrows * ncols)
+
+        with ProcessPoolExecutor(workers, initializer=start_worker, 
+                                 initargs=(shared, (nrows, ncols))) \
+                as executor:
+            errors = [error for error in executor.map(
+                            parse_lines, [self.f1.name] * n, starts, ends, 
+                            [separator] * n, first_rows,
+                            [header_lines + 1 + first_row 
+                             for first_row in first_rows]) 
+                      if error is not None]
+
+        if errors:
+            sys.exit(min(errors)[1])
+
+        self.store_grid(np.frombuffer(shared).reshape(nrows, ncols), 
+                        header_lines + 1)
+
+
+    def store_grid(self, grid, first_line=1):
+        '''
+        Use this method to keep cell data already read into an array, as
+        read_raster keeps the rows it reads.
+
+        Triggered by:
+            - read_raster (tiled binary raster)
+            - read_parallel
+            
+        Input:
+            - Cell data array (NoData value for NoData cells)
+            - Line number of the first row
+            
+        Output:
+            - Elevation data
+            - Occupancy index of the elevation data
+            - Validation exceptions (corruption, if any) of input dataset
+        '''
+        for n, row in enumerate(grid):
+            self.index_row(row)
+            if self.storage is None:
+                self.cells.append(row.tolist())
+            else:
+                self.store_row(row, first_line + n)
+
+        self.cell_count = grid.size
+        self.check_raster(grid.shape[1])
+        self.index_blocks()
+
+        if self.storage is not None:
+            self.cells = ElevationGrid(np.vstack(self.cells), 
+                                       np.vstack(self.nodata_rows),
+                                       self.scale, self.nodata_value)
+            self.nodata_rows = []
+
+
+    def parse_row(self, row):
+        '''
+        Use this method to separate a row of the dataset into header data 
+        or cell data.
+
+        Triggered by:
+            - read_raster
+            - read_blocks
+            
+        Input:
+            - Row of the dataset (list of fields)
+            
+        Output:
+            - Header data (None returned) or row of cell data values
+            - Validation exceptions (non-numeric cell data)
+        '''
+        # Geo-referenced rows will only have two data cells
+        if len(row) == 2:
+            # Geo-referenced header data
+            if row[0].lower() == 'ncols':
+                self.ncols = int(row[1])
+            elif row[0].lower() == 'nrows':
+                self.nrows = int(row[1])
+            elif row[0].lower() == 'xllcorner':
+                self.xllcorner = int(row[1])
+            elif row[0].lower() == 'xllcenter':
+                self.xllcenter = int(row[1])
+            elif row[0].lower() == 'yllcorner':
+                self.yllcorner = int(row[1])
+            elif row[0].lower() == 'yllcenter':
+                self.yllcenter = int(row[1])
+            elif row[0].lower() == 'cellsize':
+                self.cellsize = int(row[1])
+            elif row[0].lower() == 'nodata_value':
+                self.nodata_value = int(row[1])
+            else:
+                pass
+
+            return None
+
+        # Cell data
+        if row[0] == '':
+            row.pop(0)
+        if row[-1] == '':
+            row.pop(-1)
+        
+        # Keep a running count of cells input
+        self.cell_count += len(row)
+
+        # Validate cell data is numeric
+        try:
+            return list(map(lambda row_elem: float(row_elem), row))
+        except:
+            sys.exit('Invalid data encountered in row #'  
+                     + str(self.reader.line_num) + ' in raster file.')
+
+
+    def check_raster(self, row_length):
+        '''
+        Use this method to check the dataset once all rows have been read,
+        and complete the header data.
+
+        Triggered by:
+            - read_raster
+            - read_blocks
+            
+        Input:
+            - No. of cells in the first row of cell data
+            
+        Output:
+            - Validation exceptions (corruption, if any) of input dataset
+        '''
         # Check for dataset corruption
         if (self.nrows > 0 
                 and self.ncols > 0 
                 and self.nrows * self.ncols != self.cell_count) \
-            or (self.cell_count % len(self.cells[0]) != 0):
+            or row_length == 0 \
+            or (self.cell_count % row_length != 0):
                 sys.exit('Inconsistent no. of cells per row in raster file.')
 
-        # If required, calculate corner raster starting reference.
-        # Note: ...center and ...corner variables are mutually exclusive.
+        self.corner_reference()
+
+
+    def read_header(self):
+        '''
+        Use this method to input only the header data of a surface raster
+        dataset, stopping at the first row of cell data.
+
+        Triggered by:
+            - mosaic.py
+            - any python program
+            
+        Input:
+            - None
+            
+        Output:
+            - Header data from input dataset
+        '''
+        if self.tiled is None:
+            for row in self.reader: 
+                if self.parse_row(row) is not None:
+                    break
+
+        self.cell_count = 0
+        self.corner_reference()
+
+
+    def corner_reference(self):
+        '''
+        Use this method to calculate, if required, the corner raster 
+        starting reference.
+        Note: ...center and ...corner variables are mutually exclusive.
+
+        Triggered by:
+            - check_raster
+            - read_header
+            
+        Input:
+            - None
+            
+        Output:
+            - Lower left corner reference (x and y)
+        '''
         if self.xllcenter > 0:
             self.xllcorner = self.xllcenter - (self.xllcenter % self.cellsize)
             
@@ -147,6 +584,149 @@ class SurfaceRaster():
             self.yllcorner = self.yllcenter - (self.yllcenter % self.cellsize)
 
 
+    def store_row(self, values, line_num=None):
+        '''
+        Use this method to add a row of cell data to reduced precision
+        storage, with NoData cells recorded in a packed bit mask.
+
+        Triggered by:
+            - read_raster
+            - store_grid
+            
+        Input:
+            - Row of cell data values
+            - Line number of the row (default the line last read)
+            
+        Output:
+            - Stored row
+            - Validation exceptions (value can not be stored exactly)
+        '''
+        row = np.array(values, dtype=np.float64)
+        missing = row == self.nodata_value
+        if line_num is None:
+            line_num = self.reader.line_num
+        row[missing] = 0
+
+        if self.storage == 'float32':
+            self.cells.append(row.astype(np.float32))
+
+        else:
+            scaled = np.round(row * self.scale)
+            limits = np.iinfo(self.storage)
+
+            if np.any(scaled / self.scale != row):
+                sys.exit('Too many decimal places for ' + self.storage 
+                         + ' storage in row #' + str(line_num) 
+                         + ' in raster file.')
+
+            if np.any(scaled < limits.min) or np.any(scaled > limits.max):
+                sys.exit('Value out of range for ' + self.storage 
+                         + ' storage in row #' + str(line_num) 
+                         + ' in raster file.')
+
+            self.cells.append(scaled.astype(self.storage))
+
+        self.nodata_rows.append(np.packbits(missing))
+
+
+    def index_row(self, values):
+        '''
+        Use this method to count the cells of a row of cell data that are
+        not NoData, in each block of columns.
+
+        Triggered by:
+            - read_raster
+            - resample
+            
+        Input:
+            - Row of cell data values
+            
+        Output:
+            - Row counts (one per block of columns)
+        '''
+        valid = np.asarray(values) != self.nodata_value
+        self.row_counts.append(np.add.reduceat(
+                                    valid, 
+                                    np.arange(0, valid.size, self.block_size),
+                                    dtype=np.int64))
+
+
+    def index_blocks(self):
+        '''
+        Use this method to add up the row counts in each block of rows.
+
+        Triggered by:
+            - read_raster
+            - resample
+            
+        Input:
+            - None
+            
+        Output:
+            - Occupancy index (block rows x block columns array of cells 
+              that are not NoData)
+        '''
+        counts = np.vstack(self.row_counts)
+        self.occupancy = np.add.reduceat(
+                                counts, 
+                                np.arange(0, len(counts), self.block_size), 
+                                axis=0)
+        self.row_counts = []
+
+
+    def resample(self, target_cellsize, method='MEAN', cellsize=None):
+        '''
+        Use this method to resample the cell data to a different cell size,
+        keeping the storage type.  Integer storage is rounded to the 
+        decimal places kept.
+
+        Triggered by:
+            - tothemaxmain.py
+            - any python program
+            
+        Input:
+            - Target cell size
+            - Method (MEAN, MIN, MAX, BILINEAR or NEAREST)
+            - Cell size (if no cellsize header data)
+            
+        Output:
+            - Resampled cell data and occupancy index, with the header data
+              (rows, columns and cell size) updated.  The corner reference
+              is unchanged.
+            - Validation exceptions (see resample.resample)
+        '''
+        grid = np.asarray(self.cells, dtype=np.float64)
+        grid[grid == self.nodata_value] = np.nan
+
+        grid = rsp.resample(grid, self.cellsize or cellsize, target_cellsize,
+                            method)
+
+        self.nrows, self.ncols = grid.shape
+        self.cellsize = target_cellsize
+        self.xllcenter = self.yllcenter = 0
+        missing = np.isnan(grid)
+
+        for row in np.where(missing, self.nodata_value, grid):
+            self.index_row(row)
+        self.index_blocks()
+
+        if self.storage is None:
+            self.cells = np.where(missing, self.nodata_value, grid).tolist()
+            return
+
+        if self.storage != 'float32':
+            grid = np.round(grid * self.scale) / self.scale
+
+        self.cells = []
+        for row in np.where(missing, self.nodata_value, grid).tolist():
+            self.store_row(row)
+
+        self.cells = ElevationGrid(np.vstack(self.cells), 
+                                   np.vstack(self.nodata_rows),
+                                   self.scale, self.nodata_value)
+        self.nodata_rows = []
+
+
     def close_raster(self):
         '''
         Use this method to close an input raster dataset.
@@ -160,4 +740,245 @@ class SurfaceRaster():
         Output:
             - None
         '''
-        self.f1.close() 
+        if self.f1 is not sys.stdin:
+            self.f1.close() 
+
+
+#----------------------------------------------------------
+# Parallel reading (worker processes)
+#----------------------------------------------------------
+def count_lines(dataset, start, end):
+    '''
+    Use this function to count the rows of cell data in a byte range of a
+    dataset.
+
+    Triggered by:
+        - SurfaceRaster.read_parallel
+
+    Input:
+        - Dataset URL
+        - First byte of the range (start of a line)
+        - Byte after the range (start of a line or end of the dataset)
+
+    Output:
+        - No. of rows
+    '''
+    with open(dataset, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    return data.count(b'\n') + (not data.endswith(b'\n'))
+
+
+def start_worker(shared, shape):
+    '''
+    Keep the shared cell data array in a worker process.
+    '''
+    global worker_grid
+    worker_grid = np.frombuffer(shared).reshape(shape)
+
+
+def parse_lines(dataset, start, end, separator, first_row, first_line):
+    '''
+    Use this function to parse the rows of cell data in a byte range of a
+    dataset into the shared cell data array.
+
+    Triggered by:
+        - SurfaceRaster.read_parallel (worker process)
+
+    Input:
+        - Dataset URL
+        - First byte of the range (start of a line)
+        - Byte after the range (start of a line or end of the dataset)
+        - CSV field separator (bytes, None for spaces)
+        - Row of the array for the first row of the range
+        - Line number of the first row of the range in the dataset
+
+    Output:
+        - Rows of the shared array
+        - None, or the line number and validation exception of the first
+          bad row (non-numeric or wrong no. of cells)
+    '''
+    with open(dataset, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).split(b'\n')
+
+    if lines[-1] == b'':
+        lines.pop()
+
+    for n, line in enumerate(lines):
+        try:
+            values = [float(field) for field in line.split(separator)]
+        except ValueError:
+            return first_line + n, ('Invalid data encountered in row #'
+                                    + str(first_line + n) 
+                                    + ' in raster file.')
+
+        if len(values) != worker_grid.shape[1]:
+            return first_line + n, ('Inconsistent no. of cells in row #'
+                                    + str(first_line + n) 
+                                    + ' in raster file.')
+
+        worker_grid[first_row + n] = values
+
+    return None
+
+
+#----------------------------------------------------------
+# ElevationGrid Class
+#----------------------------------------------------------
+class ElevationGrid():
+    '''
+    Reduced precision raster cell data with a packed NoData bit mask.
+
+    Rows are read as lists of float64 values, the same as rows of a
+    SurfaceRaster held as Python floats, so a grid can be used by a
+    Neighbourhood.  The most recently used rows are kept, so values changed
+    in them (such as NoData cells set to NaN) are seen by the next cells 
+    processed, without changing the stored values.
+    '''
+
+    def __init__(self, values, nodata_rows, scale, nodata_value, 
+                 rows_kept=4):
+        '''
+        Initialises data object instance.
+
+        Triggered by:
+            - SurfaceRaster.read_raster
+            
+        Input:
+            - Stored cell data (rows x columns, float32 / int16 / int32)
+            - Packed NoData bit mask (one row of bytes per row of cells)
+            - Integer scale (10 ** decimal places)
+            - Geo-referenced NoData value
+            - No. of rows read to be kept
+            
+        Output:
+            - Elevation grid instance
+        '''
+        self.values = values
+        self.nodata_rows = nodata_rows
+        self.scale = scale
+        self.nodata_value = nodata_value
+        self.rows_kept = rows_kept
+        self.rows_read = OrderedDict()
+        self.nrows, self.ncols = values.shape
+
+
+    def __len__(self):
+        return self.nrows
+
+
+    def __getitem__(self, y):
+        '''
+        Get a row of cell data as float64 values (NoData value for NoData
+        cells).
+        '''
+        if y < 0:
+            y += self.nrows
+
+        if y in self.rows_read:
+            self.rows_read.move_to_end(y)
+        else:
+            row = self.decode(self.values[y])
+            row[self.nodata(y, y + 1)[0]] = self.nodata_value
+
+            self.rows_read[y] = row.tolist()
+            if len(self.rows_read) > self.rows_kept:
+                self.rows_read.popitem(last=False)
+
+        return self.rows_read[y]
+
+
+    def __iter__(self):
+        for y in range(self.nrows):
+            yield self[y]
+
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array()
+
+
+    def nodata(self, top=0, bottom=None):
+        '''
+        Use this method to unpack the NoData bit mask of a block of rows.
+
+        Triggered by:
+            - any python program
+            
+        Input:
+            - First row number
+            - Row number after the last row (default last row)
+            
+        Output:
+            - NoData mask array (True for NoData cells)
+        '''
+        return np.unpackbits(self.nodata_rows[top:bottom], axis=1, 
+                             count=self.ncols).astype(bool)
+
+
+    def array(self, top=0, bottom=None):
+        '''
+        Use this method to get a block of rows as a float64 array, with
+        NaN for NoData cells.
+
+        Triggered by:
+            - numpy (np.array / np.asarray of the grid)
+            - any python program
+            
+        Input:
+            - First row number
+            - Row number after the last row (default last row)
+            
+        Output:
+            - Cell data array
+        '''
+        block = self.decode(self.values[top:bottom])
+        block[self.nodata(top, bottom)] = np.nan
+
+        return block
+
+
+    def decode(self, stored):
+        '''
+        Use this method to convert stored cell data back to float64
+        values.  Integers are divided by the scale, and float32 values are
+        rounded to FLOAT32_DIGITS significant digits, so the decimal
+        values read from the dataset are recovered.
+
+        Triggered by:
+            - __getitem__
+            - array
+            
+        Input:
+            - Stored cell data (row or block of rows)
+            
+        Output:
+            - Cell data array (float64)
+        '''
+        values = stored.astype(np.float64)
+
+        if np.issubdtype(self.values.dtype, np.integer):
+            return values / self.scale
+
+        # Power of 10 of the last significant digit (0 stays 0).
+        magnitude = np.abs(values)
+        power = np.floor(np.log10(np.where(magnitude > 0, magnitude, 1)))
+        power = power + 1 - FLOAT32_DIGITS
+
+        # Dividing or multiplying by an exact power of 10 gives the same
+        # float64 as the decimal value read from the dataset.
+        rounded = np.where(power < 0, 
+                           np.round(values * 10 ** -np.minimum(power, 0)) 
+                           / 10 ** -np.minimum(power, 0),
+                           np.round(values / 10 ** np.maximum(power, 0)) 
+                           * 10 ** np.maximum(power, 0))
+
+        # Only where the rounded value is stored as the same float32.
+        return np.where(rounded.astype(np.float32) == stored, rounded, values)
+
+
+    @property
+    def nbytes(self):
+        '''Get the memory used by the stored cell data and mask'''
+        return self.values.nbytes + self.nodata_rows.nbytes
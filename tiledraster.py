@@ -0,0 +1,374 @@
+'''
+Tiled Binary Raster
+
+Purpose:
+    - Reads and writes terrain cell data as a tiled binary raster, so that
+      a window of cells, a single cell (point query) or one band of rows
+      can be read with a few seeks instead of reading the whole dataset
+      front to back
+    - Converts an ESRI ASCII grid (.asc) to a tiled binary raster
+
+Developer Note:
+    - File layout (little endian):
+        - Signature (8 bytes, TTMTILE1)
+        - Header: rows, columns, tile rows, tile columns, xllcorner,
+          yllcorner, cellsize, NoData value (8 byte integers), cell data
+          type (4 bytes, numpy type string), compressed indicator
+          (1 byte), 3 bytes padding
+        - Tile index: offset and length (bytes) of each tile, 8 byte
+          integers, tiles in row order
+        - Tiles: cell data of each tile, rows in order, optionally zlib
+          compressed.  Tiles on the bottom and East edges hold only the
+          cells inside the terrain.
+    - NoData cells are held as the NoData value, as in an ASCII grid.
+    - The most recently read tiles are kept, so reading a band of rows at
+      a time reads each tile once.
+    - surface.py reads a tiled binary raster wherever an ASCII grid can be
+      given (it is recognised by its signature).
+
+Filename:
+    - tiledraster.py
+
+Classes:
+    - TiledRaster
+
+Methods:
+    - tile
+    - window
+    - value
+    - array
+    - close
+
+Functions:
+    - is_tiled
+    - write_tiled
+    - convert
+
+Input:
+    - Tiled binary raster, or cell data array and header data
+    - Tile size (rows and columns), compression indicator
+
+Output:
+    - Cell data (array, NoData value for NoData)
+    - Tiled binary raster file
+'''
+
+import sys
+import zlib
+import struct
+import argparse
+from collections import OrderedDict
+import numpy as np
+import surface
+
+
+SIGNATURE = b'TTMTILE1'
+HEADER = struct.Struct('<8q4sB3x')
+TILE_SIZE = 256
+
+
+#----------------------------------------------------------
+# TiledRaster Class
+#----------------------------------------------------------
+class TiledRaster():
+    '''
+    Tiled binary raster opened for reading.
+    '''
+
+    def __init__(self, file_name):
+        '''
+        Opens a tiled binary raster and reads its header data and tile
+        index.
+
+        Triggered by:
+            - surface.SurfaceRaster
+            - any python program
+
+        Input:
+            - Tiled binary raster file name
+
+        Output:
+            - Tiled raster instance
+            - Validation exceptions (not a tiled binary raster)
+        '''
+        self.f = open(file_name, 'rb')
+
+        if self.f.read(len(SIGNATURE)) != SIGNATURE:
+            self.f.close()
+            sys.exit(file_name + ' is not a tiled binary raster.')
+
+        (self.nrows, self.ncols, self.tile_rows, self.tile_cols,
+         self.xllcorner, self.yllcorner, self.cellsize, self.nodata_value,
+         dtype, compressed) = HEADER.unpack(self.f.read(HEADER.size))
+
+        self.dtype = np.dtype(dtype.decode().strip())
+        self.compressed = bool(compressed)
+        self.tiles_down = -(-self.nrows // self.tile_rows)
+        self.tiles_across = -(-self.ncols // self.tile_cols)
+
+        n = self.tiles_down * self.tiles_across
+        self.index = np.frombuffer(self.f.read(n * 16), dtype='<u8') \
+                       .reshape(n, 2)
+
+        # Most recently read tiles (one band of tiles).
+        self.tiles_kept = self.tiles_across + 1
+        self.tiles_read = OrderedDict()
+
+
+    def tile(self, ty, tx):
+        '''
+        Use this method to read one tile.
+
+        Triggered by:
+            - window
+            - any python program
+
+        Input:
+            - Tile row and column
+
+        Output:
+            - Tile cell data (array)
+        '''
+        if (ty, tx) in self.tiles_read:
+            self.tiles_read.move_to_end((ty, tx))
+            return self.tiles_read[(ty, tx)]
+
+        offset, length = self.index[ty * self.tiles_across + tx].tolist()
+        self.f.seek(offset)
+        data = self.f.read(length)
+
+        if self.compressed:
+            data = zlib.decompress(data)
+
+        rows = min(self.tile_rows, self.nrows - ty * self.tile_rows)
+        cols = min(self.tile_cols, self.ncols - tx * self.tile_cols)
+        cells = np.frombuffer(data, dtype=self.dtype).reshape(rows, cols)
+
+        self.tiles_read[(ty, tx)] = cells
+        if len(self.tiles_read) > self.tiles_kept:
+            self.tiles_read.popitem(last=False)
+
+        return cells
+
+
+    def window(self, top, left, nrows, ncols):
+        '''
+        Use this method to read a window of cells, from only the tiles it
+        covers.
+
+        Triggered by:
+            - value
+            - array
+            - surface.SurfaceRaster
+            - any python program
+
+        Input:
+            - First row and column of the window
+            - No. of rows and columns of the window
+
+        Output:
+            - Window cell data (float64 array, NoData value for NoData)
+        '''
+        bottom = min(top + nrows, self.nrows)
+        right = min(left + ncols, self.ncols)
+        cells = np.empty((bottom - top, right - left), dtype=np.float64)
+
+        for ty in range(top // self.tile_rows,
+                        -(-bottom // self.tile_rows)):
+            for tx in range(left // self.tile_cols,
+                            -(-right // self.tile_cols)):
+                y0, x0 = ty * self.tile_rows, tx * self.tile_cols
+                r0, r1 = max(top, y0), min(bottom, y0 + self.tile_rows)
+                c0, c1 = max(left, x0), min(right, x0 + self.tile_cols)
+
+                cells[r0 - top:r1 - top, c0 - left:c1 - left] = \
+                    self.tile(ty, tx)[r0 - y0:r1 - y0, c0 - x0:c1 - x0]
+
+        return cells
+
+
+    def value(self, r, c):
+        '''
+        Use this method to read a single cell (point query).
+
+        Triggered by:
+            - any python program
+
+        Input:
+            - Row and column
+
+        Output:
+            - Cell value (NoData value for NoData)
+        '''
+        return float(self.window(r, c, 1, 1)[0, 0])
+
+
+    def array(self):
+        '''
+        Use this method to read all of the cells.
+
+        Triggered by:
+            - surface.SurfaceRaster
+            - any python program
+
+        Input:
+            - None
+
+        Output:
+            - Cell data (float64 array, NoData value for NoData)
+        '''
+        return self.window(0, 0, self.nrows, self.ncols)
+
+
+    def close(self):
+        '''
+        Use this method to close the tiled binary raster.
+        '''
+        self.f.close()
+
+
+def is_tiled(file_name):
+    '''
+    Use this function to check for a tiled binary raster signature.
+
+    Triggered by:
+        - surface.SurfaceRaster
+        - any python program
+
+    Input:
+        - File name
+
+    Output:
+        - Tiled binary raster indicator (True / False)
+    '''
+    try:
+        with open(file_name, 'rb') as f:
+            return f.read(len(SIGNATURE)) == SIGNATURE
+    except OSError:
+        return False
+
+
+def write_tiled(file_name, grid, nodata_value=-9999, xllcorner=0,
+                yllcorner=0, cellsize=0, tile_size=TILE_SIZE, compress=True,
+                dtype='<f8'):
+    '''
+    Use this function to write cell data as a tiled binary raster.
+
+    Triggered by:
+        - convert
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - File name
+        - Cell data (array or nested list, NaN or NoData value for NoData)
+        - NoData value
+        - Lower left corner map reference (x, y) and cell size
+        - Tile size (rows and columns)
+        - Compress tiles indicator (True / False)
+        - Cell data type (numpy type string)
+
+    Output:
+        - Tiled binary raster file
+    '''
+    grid = np.array(grid, dtype=np.float64, ndmin=2)
+    grid[np.isnan(grid)] = nodata_value
+    grid = grid.astype(dtype)
+    nrows, ncols = grid.shape
+    tiles = [(y, x) for y in range(0, nrows, tile_size)
+             for x in range(0, ncols, tile_size)]
+
+    with open(file_name, 'wb') as f:
+        f.write(SIGNATURE)
+        f.write(HEADER.pack(nrows, ncols, tile_size, tile_size,
+                            int(xllcorner), int(yllcorner), int(cellsize),
+                            int(nodata_value),
+                            np.dtype(dtype).str.encode().ljust(4),
+                            compress))
+
+        # Tile index, written once the tiles are.
+        index = np.zeros((len(tiles), 2), dtype='<u8')
+        index_offset = f.tell()
+        f.write(index.tobytes())
+
+        for n, (y, x) in enumerate(tiles):
+            data = grid[y:y + tile_size, x:x + tile_size].tobytes()
+            if compress:
+                data = zlib.compress(data)
+            index[n] = f.tell(), len(data)
+            f.write(data)
+
+        f.seek(index_offset)
+        f.write(index.tobytes())
+
+
+def convert(dataset, file_name, tile_size=TILE_SIZE, compress=True):
+    '''
+    Use this function to convert an ASCII grid to a tiled binary raster.
+
+    Triggered by:
+        - Command line
+        - any python program
+
+    Input:
+        - Dataset URL (ASCII grid)
+        - Tiled binary raster file name
+        - Tile size (rows and columns)
+        - Compress tiles indicator (True / False)
+
+    Output:
+        - Tiled binary raster file
+        - Validation exceptions (see surface.SurfaceRaster.read_raster)
+    '''
+    terrain = surface.SurfaceRaster(dataset)
+    terrain.read_raster()
+    terrain.close_raster()
+
+    write_tiled(file_name, terrain.cells, terrain.nodata_value,
+                terrain.xllcorner, terrain.yllcorner, terrain.cellsize,
+                tile_size, compress)
+
+
+#----------------------------------------------------------
+# Command line: convert an ASCII grid, or query a cell of a
+# tiled binary raster.
+#----------------------------------------------------------
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filename', dest='file_name', required=True,
+                        help='ASCII grid to convert, or tiled binary raster '
+                        + 'to query')
+    parser.add_argument('--output', dest='output', default='',
+                        help='Tiled binary raster written')
+    parser.add_argument('--tilesize', dest='tile_size', type=int,
+                        default=TILE_SIZE, help='Tile rows and columns '
+                        + '(integer)')
+    parser.add_argument('--compress', dest='compress', default='Y',
+                        help='Compress each tile (Y/N)')
+    parser.add_argument('--point', dest='point', type=float, nargs=2,
+                        metavar=('X', 'Y'), help='Cell value at map '
+                        + 'coordinates x y of a tiled binary raster')
+    args = parser.parse_args()
+
+    if args.tile_size < 1:
+        parser.exit(1, '--tilesize : Must be a positive integer\n')
+
+    if args.output:
+        convert(args.file_name, args.output, args.tile_size,
+                args.compress.upper() == 'Y')
+
+    if args.point:
+        raster = TiledRaster(args.output or args.file_name)
+        x, y = args.point
+        cellsize = raster.cellsize or 1
+        r = raster.nrows - 1 - int(np.floor((y - raster.yllcorner)
+                                            / cellsize))
+        c = int(np.floor((x - raster.xllcorner) / cellsize))
+
+        if not (0 <= r < raster.nrows and 0 <= c < raster.ncols):
+            raster.close()
+            sys.exit('Point ' + f'{x:g} {y:g}' + ' is outside the terrain.')
+
+        print(f'{raster.value(r, c):g}')
+        raster.close()
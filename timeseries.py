@@ -0,0 +1,342 @@
+'''
+Time Series Processing
+Can be imported or started from the command line
+
+Purpose:
+    - Processes an ordered list of rasters of the same area (e.g. a daily
+      snow surface in snow.slope format), checking once that they all
+      cover the same grid
+    - Calculates the slope and aspect of each date (epoch), in parallel if
+      required, and the change from one epoch to the next:
+        - Elevation change
+        - Slope change (degrees)
+        - Aspect change (degrees, -180 to 180, clockwise positive)
+    - Summarises each change (mean, minimum, maximum, net volume, ...)
+
+Developer Note:
+    - Each epoch is calculated the same way as a single tile mosaic
+      (mosaic.calculate_window and mosaic.resolve_ties), so the slope and
+      aspect of every epoch are the same as from tothemaxmain.py.
+    - Epochs are handed out to the worker processes in order, with no more
+      than one epoch per worker waiting, and only the previous epoch is
+      kept once its change has been worked out.  So with 1 or 2 workers,
+      only 2 or 3 epochs are held in memory at a time.
+
+Filename:
+    - timeseries.py
+
+Functions:
+    - check_headers
+    - epoch_maps
+    - change_maps
+    - change_summary
+    - series
+    - write_grid
+
+Input:
+    - Ordered list of raster dataset URLs
+    - Terrain resolution / cell size
+    - D8 dictionary
+    - Fill sinks indicator
+    - No. of worker processes
+
+Output:
+    - Change map data and summary of each step between epochs
+    - Files (command line)
+        - change_<n>_elevation.txt, change_<n>_slope.txt,
+          change_<n>_aspect.txt for each step n (1 = first to second epoch)
+        - timeseries_summary.txt
+'''
+
+import sys
+import csv
+import math
+import argparse
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import mosaic
+import surface
+
+
+SUMMARY_NAMES = ('step', 'from', 'to', 'cells', 'mean_dz', 'min_dz',
+                 'max_dz', 'volume', 'gain', 'loss', 'mean_abs_dslope',
+                 'max_abs_dslope', 'aspect_changed_perc')
+
+
+def check_headers(datasets):
+    '''
+    Use this function to check that all of the rasters have the same header
+    data (cell size, corner reference, rows, columns and NoData value).
+    Rasters without header data are checked when they are read.
+
+    Triggered by:
+        - series
+
+    Input:
+        - Ordered list of raster dataset URLs
+
+    Output:
+        - Header data of the first raster (SurfaceRaster)
+        - Validation exceptions (header data does not match)
+    '''
+    first = None
+
+    for dataset in datasets:
+        raster = surface.SurfaceRaster(dataset)
+        raster.read_header()
+        raster.close_raster()
+
+        header = (raster.ncols, raster.nrows, raster.xllcorner,
+                  raster.yllcorner, raster.cellsize, raster.nodata_value)
+
+        if first is None:
+            first, first_header = raster, header
+        elif header != first_header:
+            sys.exit('Header data of ' + dataset + ' does not match '
+                     + datasets[0] + '.')
+
+    return first
+
+
+def epoch_maps(dataset, resolution, d8_dict, fill_sinks=False):
+    '''
+    Use this function to calculate the slope and aspect of one epoch.
+
+    Triggered by:
+        - series (one process per epoch if in parallel)
+
+    Input:
+        - Raster dataset URL
+        - Terrain resolution / cell size
+        - D8 dictionary
+        - Fill sinks indicator (True / False)
+
+    Output:
+        - Elevation, slope (degrees) and aspect arrays (NaN for NoData)
+    '''
+    raster = surface.SurfaceRaster(dataset)
+    raster.read_raster()
+    raster.close_raster()
+
+    nrows, ncols = len(raster.cells), len(raster.cells[0])
+    elevation = np.array(raster.cells, dtype=np.float64)
+    elevation[elevation == raster.nodata_value] = np.nan
+
+    slope_perc, slope_deg, aspect, ties = mosaic.calculate_window(
+                                    raster.cells, 0, 0, (0, 0, nrows, ncols),
+                                    resolution, d8_dict, raster.nodata_value,
+                                    fill_sinks)
+    tile = (0, 0, nrows, ncols)
+    resolved = mosaic.resolve_ties(nrows, ncols,
+                                   mosaic.known_cells(tile, aspect, ties),
+                                   ties, d8_dict)
+    for (r, c), cell_aspect in resolved.items():
+        aspect[r][c] = cell_aspect
+
+    return (elevation, np.array(slope_deg, dtype=np.float64),
+            np.array(aspect, dtype=np.float64))
+
+
+def change_maps(before, after):
+    '''
+    Use this function to work out the change from one epoch to the next.
+
+    Triggered by:
+        - series
+
+    Input:
+        - Elevation, slope and aspect arrays of the earlier epoch
+        - Elevation, slope and aspect arrays of the later epoch
+
+    Output:
+        - Elevation, slope and aspect change arrays (NaN if either epoch
+          is NoData)
+    '''
+    elevation = after[0] - before[0]
+    slope = after[1] - before[1]
+    aspect = np.mod(after[2] - before[2] + 180, 360) - 180
+
+    return elevation, slope, aspect
+
+
+def change_summary(elevation, slope, aspect, cell_area):
+    '''
+    Use this function to summarise the change from one epoch to the next.
+
+    Triggered by:
+        - series
+
+    Input:
+        - Elevation, slope and aspect change arrays
+        - Cell area (square metres)
+
+    Output:
+        - Summary (dictionary, names as SUMMARY_NAMES)
+    '''
+    valid = ~np.isnan(elevation)
+    dz = elevation[valid]
+    dslope = np.abs(slope[~np.isnan(slope)])
+    daspect = aspect[~np.isnan(aspect)]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        return {'cells': int(valid.sum()),
+                'mean_dz': float(np.mean(dz)) if dz.size else math.nan,
+                'min_dz': float(np.min(dz)) if dz.size else math.nan,
+                'max_dz': float(np.max(dz)) if dz.size else math.nan,
+                'volume': float(np.sum(dz)) * cell_area,
+                'gain': float(np.sum(dz[dz > 0])) * cell_area,
+                'loss': float(np.sum(dz[dz < 0])) * cell_area,
+                'mean_abs_dslope': float(np.mean(dslope))
+                                   if dslope.size else math.nan,
+                'max_abs_dslope': float(np.max(dslope))
+                                  if dslope.size else math.nan,
+                'aspect_changed_perc': 100 * float(np.mean(daspect != 0))
+                                       if daspect.size else math.nan}
+
+
+def series(datasets, resolution, d8_dict, fill_sinks=False, workers=1):
+    '''
+    Use this function to process an ordered list of rasters, one step
+    (pair of epochs) at a time.
+
+    Triggered by:
+        - Command line
+        - any python program
+
+    Input:
+        - Ordered list of raster dataset URLs
+        - Terrain resolution / cell size
+        - D8 dictionary
+        - Fill sinks indicator (True / False)
+        - No. of worker processes
+
+    Output:
+        - Each step in turn (generator) as (summary, elevation change,
+          slope change, aspect change)
+        - Validation exceptions (grids do not match)
+    '''
+    check_headers(datasets)
+    cell_area = float(resolution) ** 2
+    args = (resolution, d8_dict, fill_sinks)
+
+    if workers > 1:
+        executor = ProcessPoolExecutor(workers)
+        submit = lambda dataset: executor.submit(epoch_maps, dataset, *args)
+        result = lambda future: future.result()
+    else:
+        executor = None
+        submit = lambda dataset: dataset
+        result = lambda dataset: epoch_maps(dataset, *args)
+
+    try:
+        pending = deque()
+        previous = None
+        step = 0
+
+        for k, dataset in enumerate(datasets):
+            pending.append((k, submit(dataset)))
+
+            # Wait for the oldest epoch once every worker has one.
+            while pending and (len(pending) > max(workers - 1, 0)
+                               or k == len(datasets) - 1):
+                k_done, job = pending.popleft()
+                current = result(job)
+
+                if previous is not None:
+                    if current[0].shape != previous[0].shape:
+                        sys.exit(datasets[k_done] + ' is not the same grid as '
+                                 + datasets[0] + '.')
+
+                    step += 1
+                    changes = change_maps(previous, current)
+                    summary = {'step': step, 'from': datasets[k_done - 1],
+                               'to': datasets[k_done]}
+                    summary.update(change_summary(*changes, cell_area))
+                    yield (summary,) + changes
+
+                previous = current
+
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def write_grid(file_name, grid, decimals=1):
+    '''
+    Use this function to write an array of change map data to a space
+    separated output file, as tothemaxmain.py writes map data.
+
+    Triggered by:
+        - Command line
+
+    Input:
+        - Output file name
+        - Array of map data (NaN for NoData)
+        - Decimal places to round to
+
+    Output:
+        - Output file
+    '''
+    f = open(file_name, 'w', newline='')
+    output = csv.writer(f, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+
+    for row in grid.tolist():
+        output.writerow([round(cell, decimals) for cell in row])
+
+    f.close()
+
+
+#----------------------------------------------------------
+# Command line: process a time series and write the change
+# maps and summary.
+#----------------------------------------------------------
+if __name__ == '__main__':
+
+    DICT_ASPECT = {1:90, 2:135, 4:180, 8:225, 16:270, 32:315, 64:0, 128:45}
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filenames', dest='file_names', nargs='+',
+                        required=True, help='Raster file names, in date order')
+    parser.add_argument('--resolution', dest='resolution', type=int,
+                        default=50, help='Resolution / cell size (metres, '
+                        + 'integer)')
+    parser.add_argument('--fillsinks', dest='fill_sinks', default='Y',
+                        help='Fill in sinks / holes (Y/N)')
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+                        help='Epochs calculated at the same time (integer)')
+    args = parser.parse_args()
+
+    if len(args.file_names) < 2 or args.resolution < 1 or args.workers < 1:
+        parser.exit(1, 'At least 2 file names, a positive resolution and '
+                    + 'workers required - aborting\n')
+
+    f = open('timeseries_summary.txt', 'w', newline='')
+    output = csv.writer(f, delimiter=' ')
+    output.writerow(SUMMARY_NAMES)
+
+    for summary, elevation, slope, aspect in series(
+                    args.file_names, args.resolution, DICT_ASPECT,
+                    args.fill_sinks.upper() == 'Y', args.workers):
+
+        prefix = 'change_' + str(summary['step']) + '_'
+        write_grid(prefix + 'elevation.txt', elevation, 2)
+        write_grid(prefix + 'slope.txt', slope)
+        write_grid(prefix + 'aspect.txt', aspect)
+
+        output.writerow([round(summary[name], 2)
+                         if isinstance(summary[name], float)
+                         else summary[name] for name in SUMMARY_NAMES])
+
+        print('Step ' + str(summary['step']) + ' (' + summary['from']
+              + ' to ' + summary['to'] + '): mean elevation change '
+              + f"{summary['mean_dz']:.2f}" + ' m, net volume '
+              + f"{summary['volume']:,.0f}" + ' m3, mean slope change '
+              + f"{summary['mean_abs_dslope']:.2f}" + ' degrees, aspect '
+              + 'changed ' + f"{summary['aspect_changed_perc']:.1f}"
+              + '% of cells')
+
+    f.close()
@@ -0,0 +1,475 @@
+'''
+To the Max core processing
+Can be imported by any python program (e.g. tothemaxmain.py)
+
+Purpose:
+    - Calculates slope and aspect (D8 or D-infinity) of a terrain held in
+      memory and returns them as arrays, without reading or writing files
+      or drawing maps
+    - The terrain can be a SurfaceRaster (already read) or an elevation
+      array / nested list
+
+Developer Note:
+    - D8 is calculated exactly as tothemaxmain.py always has: a
+      Neighbourhood for every cell, row by row, sinks filled if required,
+      then the D8 ties resolved row by row until no more can be resolved.
+    - Sink and flat cells are noted before sinks are filled and ties are
+      resolved, for the diagnostics report.  A function can be given to
+      report them as soon as they are known, before any time is spent
+      resolving the ties.
+    - A checkpoint (checkpoint.py) can be given, so long runs from the
+      command line save and resume their progress.
+    - Runs of NoData cells in blocks with no data (surface.py occupancy
+      index) are not given a Neighbourhood.  Their result is always the
+      same (no slope or aspect, or level and East if sinks are filled and
+      all their neighbours are NoData), so one shared cell is used for
+      them all.  Only the tied cells are visited when resolving ties, so
+      runtime follows the no. of cells with data rather than the whole
+      terrain.
+
+Filename:
+    - tothemaxcore.py
+
+Classes:
+    - SlopeAspect
+
+Functions:
+    - terrain_cells
+    - occupancy_index
+    - nodata_runs
+    - row_segments
+    - d8_codes
+    - calculate
+
+Input:
+    - Terrain (SurfaceRaster, or elevation array / nested list)
+    - Terrain resolution / cell size
+    - Fill sinks indicator
+    - Flow direction method (D8 or DINF)
+
+Output:
+    - Instance of SlopeAspect class (arrays, NaN for NoData)
+'''
+
+import math
+from types import SimpleNamespace
+import numpy as np
+import neighbourhood as nbh
+import dinfinity as dinf
+import surface
+
+
+DICT_ASPECT = {1:90, 2:135, 4:180, 8:225, 16:270, 32:315, 64:0, 128:45}
+
+
+#----------------------------------------------------------
+# SlopeAspect Class
+#----------------------------------------------------------
+class SlopeAspect():
+    '''
+    Slope and aspect of a terrain, as arrays.
+    '''
+
+    def __init__(self, elevation, slope_perc, slope_deg, aspect, d8, sinks,
+                 flats, gradient=None, stack=None, runs=None):
+        '''
+        Initialises data object instance.
+
+        Triggered by:
+            - calculate
+
+        Input:
+            - Elevation array (NaN for NoData)
+            - Slope as a percentage and in degrees arrays (NaN for no
+              downhill slope or NoData)
+            - Aspect array (degrees clockwise from North, NaN for none)
+            - D8 direction code array (1 = E, 2 = SE ... 128 = NE, 0 for
+              none, None for D-infinity)
+            - Sink and flat (D8 tie) cell arrays, before filling / resolving
+            - Gradient (rows of Neighbourhood instances, D8 only)
+            - Neighbourhood arrays (centre, neighbours) if calculated
+            - Runs of cells skipped in each row (D8 only), each run with
+              the same slope and aspect
+
+        Output:
+            - SlopeAspect data instance
+        '''
+        self.elevation = elevation
+        self.slope_perc = slope_perc
+        self.slope_deg = slope_deg
+        self.aspect = aspect
+        self.d8 = d8
+        self.sinks = sinks
+        self.flats = flats
+        self.gradient = gradient
+        self.stack = stack
+        self.runs = runs
+
+
+def terrain_cells(terrain, nodata_value=-9999):
+    '''
+    Use this function to get the terrain cells as rows that a Neighbourhood
+    can use, and their NoData value.
+
+    Triggered by:
+        - calculate
+
+    Input:
+        - Terrain (SurfaceRaster, or elevation array / nested list with
+          NaN or the NoData value for NoData)
+        - NoData value (array / nested list only)
+
+    Output:
+        - Terrain cells (rows)
+        - NoData value
+    '''
+    if hasattr(terrain, 'cells'):
+        return terrain.cells, terrain.nodata_value
+
+    grid = np.array(terrain, dtype=np.float64, ndmin=2)
+    grid[np.isnan(grid)] = nodata_value
+
+    return grid.tolist(), nodata_value
+
+
+def occupancy_index(terrain, cells, nodata_value):
+    '''
+    Use this function to get the occupancy index of the terrain (cells that
+    are not NoData in each block), counting them if not already read.
+
+    Triggered by:
+        - calculate
+
+    Input:
+        - Terrain (SurfaceRaster, or elevation array / nested list)
+        - Terrain cells (rows)
+        - NoData value
+
+    Output:
+        - Occupancy index (block rows x block columns array)
+        - Block size (rows and columns of cells)
+    '''
+    occupancy = getattr(terrain, 'occupancy', None)
+    if occupancy is not None:
+        return occupancy, terrain.block_size
+
+    block_size = surface.BLOCK_SIZE
+    grid = np.array(cells, dtype=np.float64, ndmin=2)
+    valid = (grid != nodata_value) & ~np.isnan(grid)
+    counts = np.add.reduceat(valid, np.arange(0, valid.shape[1], block_size),
+                             axis=1, dtype=np.int64)
+
+    return np.add.reduceat(counts, np.arange(0, len(counts), block_size),
+                           axis=0), block_size
+
+
+def nodata_runs(occupancy, block_size, y_limit, x_limit, fill_sinks):
+    '''
+    Use this function to find the runs of cells in each row that are in
+    blocks with no data, and so need not be calculated.
+
+    A NoData cell is given a slope when sinks are filled, which depends on
+    its neighbours, so then only cells with all their neighbours in blocks
+    with no data (and not on the terrain edge) are in a run.
+
+    Triggered by:
+        - calculate
+
+    Input:
+        - Occupancy index
+        - Block size (rows and columns of cells)
+        - No. of rows and columns
+        - Fill sinks indicator (True / False)
+
+    Output:
+        - Runs (first column, column after the last) of each row
+    '''
+    empty = occupancy == 0
+    runs = []
+
+    for r in range(y_limit):
+
+        if not fill_sinks:
+            row_empty = empty[r // block_size]
+        elif 0 < r < y_limit - 1:
+            row_empty = np.all(empty[(r - 1) // block_size:
+                                     (r + 1) // block_size + 1], axis=0)
+        else:
+            runs.append([])
+            continue
+
+        # First and after the last block of each run of empty blocks.
+        edges = np.flatnonzero(np.diff(np.concatenate(
+                                    ([False], row_empty, [False]))))
+
+        row_runs = []
+        for first, after in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            c0 = first * block_size
+            c1 = min(after * block_size, x_limit)
+
+            # Keep clear of blocks with data (and the terrain edge).
+            if fill_sinks:
+                c0, c1 = c0 + 1, c1 - 1
+
+            if c1 > c0:
+                row_runs.append((c0, c1))
+
+        runs.append(row_runs)
+
+    return runs
+
+
+def row_segments(row_runs, x_limit):
+    '''
+    Use this function to split a row into the runs of cells skipped and 
+    the cells between them.
+
+    Triggered by:
+        - calculate
+        - tothemaxmain.py
+
+    Input:
+        - Runs of the row (first column, column after the last)
+        - No. of columns
+
+    Output:
+        - Segments (first column, column after the last, skipped
+          indicator), in column order
+    '''
+    c = 0
+
+    for c0, c1 in row_runs:
+        if c0 > c:
+            yield c, c0, False
+        yield c0, c1, True
+        c = c1
+
+    if c < x_limit:
+        yield c, x_limit, False
+
+
+def d8_codes(aspect, d8_dict=DICT_ASPECT):
+    '''
+    Use this function to convert D8 aspect to D8 direction codes.
+
+    Triggered by:
+        - calculate
+
+    Input:
+        - Aspect array (NaN for none)
+        - D8 dictionary
+
+    Output:
+        - D8 direction code array (0 for none)
+    '''
+    codes = np.zeros(aspect.shape, dtype=np.uint8)
+
+    for code, degrees in d8_dict.items():
+        codes[aspect == degrees] = code
+
+    return codes
+
+
+def calculate(terrain, resolution=50, fill_sinks=True, flow_dir='D8',
+              nodata_value=-9999, d8_dict=DICT_ASPECT, checkpoint=None,
+              gradient=None, regions=None):
+    '''
+    Use this function to calculate the slope and aspect of every cell.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Terrain (SurfaceRaster after read_raster, or elevation array /
+          nested list).  SurfaceRaster NoData cells are set to NaN, as
+          tothemaxmain.py always has.
+        - Terrain resolution / cell size
+        - Fill sinks indicator (True / False)
+        - Flow direction method (D8 or DINF)
+        - NoData value (array / nested list only)
+        - D8 dictionary
+        - Checkpoint instance (optional, D8 only)
+        - Gradient already calculated, ties resolved (optional, D8 only,
+          e.g. from pipeline.py)
+        - Function called with the sink and flat cells (boolean arrays)
+          before the ties are resolved (optional, e.g. to report them)
+
+    Output:
+        - SlopeAspect instance
+    '''
+    cells, nodata_value = terrain_cells(terrain, nodata_value)
+    y_limit, x_limit = len(cells), len(cells[0])
+    stack = None
+
+    #------------------------------------------------------
+    # D-infinity: a continuous aspect for all cells at once.
+    # There are no ties to resolve.
+    #------------------------------------------------------
+    if flow_dir == 'DINF':
+        centre, neighbours = nbh.neighbour_stack(cells, nodata_value)
+        stack = (centre, neighbours)
+        dinf_slope, dinf_aspect = dinf.dinf_slope_aspect(
+                                        centre, neighbours, resolution,
+                                        fill_sinks)
+
+        elevation = np.array(cells, dtype=np.float64)
+        elevation[elevation == nodata_value] = np.nan
+        sinks = np.all(neighbours > centre, axis=0)
+        flats = np.zeros((y_limit, x_limit), dtype=bool)
+
+        if regions is not None:
+            regions(sinks, flats)
+
+        return SlopeAspect(elevation, dinf_slope * 100,
+                           np.degrees(np.arctan(dinf_slope)),
+                           np.array([[round(cell, 1) for cell in row]
+                                     for row in dinf_aspect.tolist()],
+                                    dtype=np.float64),
+                           None, sinks, flats, stack=stack)
+
+    #------------------------------------------------------
+    # D8: a Neighbourhood for every cell (unless already
+    # calculated), continuing from a checkpoint if resumed.
+    #------------------------------------------------------
+    sinks = [[False for c in range(x_limit)] for r in range(y_limit)]
+
+    # One cell for all NoData cells not calculated (see sink_fill).
+    if fill_sinks:
+        skipped = SimpleNamespace(slope=0.0, slope_perc=0.0, slope_deg=0.0,
+                                  aspect=d8_dict[1], d8=[0])
+    else:
+        skipped = SimpleNamespace(slope=-math.inf, slope_perc=math.nan,
+                                  slope_deg=math.nan, aspect=math.nan, d8=[])
+
+    if gradient is None:
+        runs = nodata_runs(*occupancy_index(terrain, cells, nodata_value),
+                           y_limit, x_limit, fill_sinks)
+        gradient = [[0 for c in range(x_limit)] for r in range(y_limit)]
+        start_row = 0
+
+        # Restore the rows calculated before the checkpoint, with their
+        # NoData cells set to NaN as they were.
+        if checkpoint is not None:
+            start_row = checkpoint.load_rows(gradient, sinks)
+
+            for r in range(start_row):
+                row = cells[r]
+                for c in range(x_limit):
+                    if row[c] == nodata_value:
+                        row[c] = math.nan
+
+        for r in range(start_row, y_limit):
+            row = cells[r]
+
+            for c0, c1, skip in row_segments(runs[r], x_limit):
+
+                # Run of NoData cells - set to NaN, in order, as they
+                # would have been one at a time.
+                if skip:
+                    row[c0:c1] = [math.nan] * (c1 - c0)
+                    gradient[r][c0:c1] = [skipped] * (c1 - c0)
+                    continue
+
+                for c in range(c0, c1):
+
+                    # Create 3 x 3 neighbourhood instance.
+                    cell = nbh.Neighbourhood(cells, resolution, r, c)
+
+                    # Handle NoData cell.
+                    if cell.centre == nodata_value:
+                        row[c] = math.nan
+
+                    # Calculate slope and aspect.
+                    cell.slope_aspect(d8_dict, nodata_value)
+
+                    # Note sinks before they are filled.
+                    if cell.slope == -math.inf \
+                            and cell.centre != nodata_value:
+                        sinks[r][c] = True
+
+                    # If required, deal with a cell where all its
+                    # immediate neighbours are all higher.
+                    if fill_sinks and cell.slope == -math.inf:
+                        cell.sink_fill(d8_dict)
+
+                    gradient[r][c] = cell
+
+            if checkpoint is not None \
+                    and (checkpoint.due() or r == y_limit - 1):
+                checkpoint.save_rows(gradient, sinks, r + 1)
+
+        keep_looping = True
+    else:
+        runs = [[] for r in range(y_limit)]
+        keep_looping = False
+
+    # Cells with ties still to be resolved (none in the runs skipped).
+    flats = np.zeros((y_limit, x_limit), dtype=bool)
+    for r, row in enumerate(gradient):
+        for c0, c1, skip in row_segments(runs[r], x_limit):
+            if not skip:
+                flats[r, c0:c1] = [len(cell.d8) > 1 for cell in row[c0:c1]]
+
+    sinks = np.array(sinks, dtype=bool).reshape(y_limit, x_limit)
+
+    # Report the sinks and flats before the ties are resolved.
+    if regions is not None:
+        regions(sinks, flats)
+
+    #------------------------------------------------------
+    # Resolve the D8 ties, row by row, until no more cells
+    # can be resolved.  Only the tied cells are visited, in
+    # the same order.  If required, the aspect and D8
+    # directions of the tied cells are saved at the end of a
+    # loop.
+    #------------------------------------------------------
+    tie_cells = [tuple(cell) for cell in np.argwhere(flats).tolist()]
+
+    if keep_looping and checkpoint is not None:
+
+        if checkpoint.state['ties'] is not None:
+            tie_cells = list(checkpoint.state['ties'])
+            keep_looping = checkpoint.state['keep_looping']
+
+            for (r, c), (tie_aspect, tie_d8) in \
+                    checkpoint.state['ties'].items():
+                gradient[r][c].aspect = tie_aspect
+                gradient[r][c].d8 = list(tie_d8)
+
+    while keep_looping:
+
+        keep_looping = False
+
+        for r, c in tie_cells:
+
+            # If the cell has been resolved, another full iteration
+            # will be required.
+            if len(gradient[r][c].d8) > 1 \
+                    and nbh.resolve_tie(gradient, r, c, d8_dict):
+                keep_looping = True
+
+        if checkpoint is not None and (checkpoint.due() or not keep_looping):
+            checkpoint.save_ties(gradient, tie_cells, keep_looping)
+
+    #------------------------------------------------------
+    # Collect the elevation, slope and aspect map data.
+    #------------------------------------------------------
+    elevation = np.array(cells, dtype=np.float64)
+    elevation[elevation == nodata_value] = np.nan
+    maps = np.empty((3, y_limit, x_limit), dtype=np.float64)
+    names = ('slope_perc', 'slope_deg', 'aspect')
+
+    for r, row in enumerate(gradient):
+        for c0, c1, skip in row_segments(runs[r], x_limit):
+            if skip:
+                for n, name in enumerate(names):
+                    maps[n, r, c0:c1] = getattr(skipped, name)
+            else:
+                for n, name in enumerate(names):
+                    maps[n, r, c0:c1] = [getattr(cell, name)
+                                         for cell in row[c0:c1]]
+
+    return SlopeAspect(elevation, maps[0], maps[1], maps[2],
+                       d8_codes(maps[2], d8_dict), sinks, flats, gradient,
+                       runs=runs)
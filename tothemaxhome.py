@@ -6,8 +6,9 @@ Filename:
 
 Contains: 
 - Classes: FrontEnd
-- Methods: browse, run, clear, helper, about, finish, sel_perc, sel_deg,  
-           sel_perc_and_deg, sel_northern, sel_southern and unchecked
+- Methods: browse, preview, run, clear, helper, about, finish, sel_perc, 
+           sel_deg, sel_perc_and_deg, sel_northern, sel_southern and 
+           unchecked
 
 Inputs:
 - URL of input dataset
@@ -19,8 +20,11 @@ Inputs:
 - Lower left corner Cartesian map reference (y axis)
 - Hemisphere of x,y Cartesian map reference
 - Display Parameter Data
+- Preview slope indicator
 
 Outputs:
+- Quick look preview of input dataset (elevation, and coarse slope if 
+  selected), from every k-th row and column, shown as soon as it is selected
 - Data string parsed to tothemaxmain.py containing any entered input arguments
 - Run information and data validation exceptions returned from tothemaxmain.py
 '''
@@ -28,7 +32,16 @@ Outputs:
 import tkinter as tk
 from tkinter import filedialog
 import subprocess
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import surface
+import neighbourhood as nbh
+import hillshade as hs
+
+
+# Maximum no. of rows and columns read for the preview.
+PREVIEW_SIZE = 200
 
 class FrontEnd():
     '''
@@ -55,6 +68,8 @@ class FrontEnd():
             (optional, translated to single byte text, default=off)
         - Display Parameter Data
             (optional, translated to single byte text, default=off)
+        - Preview slope
+            (optional, coarse slope added to the preview, default=off)
 
     Input Radio Buttons
         - Create slope map - as a percentage, in degrees or both
@@ -76,6 +91,10 @@ class FrontEnd():
             (Displays any information (help, validation errosr etc) returned
              from modelmain.py or the command prompt)
 
+    Preview
+        - Elevation (and coarse slope if selected) of the selected dataset
+            (every k-th row and column, shown after browse)
+
     Menu bar 
         - File > Run 
             (Transfers control to tothemaxmain.py with data entry fiels as
@@ -95,10 +114,11 @@ class FrontEnd():
             - Variables
             - 3 x Entry field
             - 2 x Set Radio buttons
-            - 3 x Check buttons
+            - 4 x Check buttons
             - 4 x Buttons
             - 1 x Updateable label field
             - 1 x Text field (read only)
+            - 1 x Preview (matplotlib figure)
             - Menu bar (with cascading items)
         '''
         #-------------------------------------------------
@@ -121,11 +141,13 @@ class FrontEnd():
         self.aspect_map = tk.StringVar()
         self.hemisphere = tk.StringVar()
         self.disp_params = tk.StringVar()
+        self.preview_slope = tk.StringVar()
+        self.terrain = None
         
         # Other general field before we start contructing the layout
         self.menu_bar = tk.Menu(self.home)
         self.home.config(menu=self.menu_bar)
-        self.home.geometry('950x850')
+        self.home.geometry('1250x850')
         self.home.wm_title('To the Max! - Student 201388212')
         
         #-------------------------------------------------
@@ -163,6 +185,10 @@ class FrontEnd():
         #-------------------------------------------------
         frame0 = tk.Frame(self.home)
         frame0.pack(fill=tk.X, expand=False, padx=30, pady=20)
+
+        # Preview down the right hand side, beside frames 1 to 9.
+        frame10 = tk.Frame(self.home)
+        frame10.pack(side=tk.RIGHT, fill=tk.Y, expand=False, padx=30)
         
         frame1 = tk.Frame(self.home)
         frame1.pack(fill=tk.X, expand=False, padx=30, pady=20)
@@ -195,10 +221,11 @@ class FrontEnd():
         # Set up screen fields.  There are:
         # 3 x Entry fieds
         # 2 x Radio button sets (2 option and 3 option)
-        # 3 x Check buttons
+        # 4 x Check buttons
         # 4 x Buttons
         # 1 x Updatable label
         # 1 x Scrollable text box (This will be protected) 
+        # 1 x Preview figure
         #-------------------------------------------------
         
         # Frame 0
@@ -325,6 +352,16 @@ class FrontEnd():
         self.t1 = tk.Text(frame9, width=600, fg='red', state=tk.DISABLED,
                           yscrollcommand=self.sb1.set)
         self.t1.pack(side = tk.LEFT, expand=False)
+
+        # Frame 10
+        self.cb5 = tk.Checkbutton(frame10, offvalue=tk.N, onvalue=tk.Y, 
+                                  variable=self.preview_slope, 
+                                  text='Preview slope', command=self.preview)
+        self.cb5.pack(side=tk.TOP, expand=False)
+
+        self.figure = Figure(figsize=(3.5, 6.5), dpi=80, layout='constrained')
+        self.canvas = FigureCanvasTkAgg(self.figure, master=frame10)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, expand=False)
         
         #-------------------------------------------------
         # Initialise all input fields.
@@ -366,10 +403,13 @@ class FrontEnd():
             self.menu_item_1.entryconfigure(0, state=tk.NORMAL)
             self.terrain = surface.SurfaceRaster(self.file_name)
             
+            # Only every k-th row and column is read, for the preview.
             try:
-                self.terrain.read_raster()
+                self.terrain.read_strided(PREVIEW_SIZE)
             except:
                 self.terrain.close_raster()
+                self.terrain = None
+                self.preview()
                 return
 
             self.terrain.close_raster()
@@ -382,6 +422,59 @@ class FrontEnd():
 
             if self.terrain.yllcorner > 0:
                 self.e3.insert(0, self.terrain.yllcorner)
+
+            self.preview()
+
+
+    def preview(self, event=None):
+        '''
+        Display a quick look of the selected dataset, from the rows and 
+        columns read by browse.
+
+        Triggered by:
+            - Browse button.
+            - Preview slope check button.
+            - Reset button.
+            
+        Inputs:
+            - Sampled dataset (every k-th row and column).
+            - Resolution (entered, or 50 if not valid).
+            - Preview slope check button.
+            
+        Returns:
+            - Elevation preview, and coarse slope preview (degrees, 
+              calculated at k times the resolution) if selected.
+        '''
+        self.figure.clear()
+
+        if self.terrain is not None and self.terrain.cells:
+            elevation = np.array(self.terrain.cells, dtype=np.float64)
+            elevation[elevation == self.terrain.nodata_value] = np.nan
+            step = self.terrain.step
+            maps = [(elevation, 'terrain', 'Elevation (m)')]
+
+            if self.preview_slope.get() == tk.Y:
+                try:
+                    resolution = int(self.e1.get())
+                except ValueError:
+                    resolution = 50
+
+                centre, neighbours = nbh.neighbour_stack(elevation)
+                slope = hs.surface_slope_aspect(centre, neighbours, 
+                                                resolution * step)[0]
+                maps.append((np.degrees(slope), 'winter_r', 
+                             'Slope (Degrees)'))
+
+            for n, (grid, cmap, label) in enumerate(maps, 1):
+                ax = self.figure.add_subplot(len(maps), 1, n)
+                image = ax.imshow(grid, cmap=cmap)
+                ax.set_axis_off()
+                self.figure.colorbar(image, ax=ax).set_label(label)
+
+            self.figure.suptitle('Preview (1 in ' + str(step) 
+                                 + ' rows and columns)', fontsize=9)
+
+        self.canvas.draw()
         
 
     def run(self, event=None):
@@ -459,6 +552,8 @@ class FrontEnd():
         self.t1.delete(1.0, tk.END)
         self.t1.configure(state=tk.DISABLED)
         self.unchecked()
+        self.terrain = None
+        self.preview()
         self.b2.configure(state=tk.DISABLED)
         self.menu_item_1.entryconfigure(0, state=tk.DISABLED)
     
@@ -562,6 +657,7 @@ class FrontEnd():
         self.fill_sinks.set(tk.N)
         self.aspect_map.set(tk.N)
         self.disp_params.set(tk.N)
+        self.preview_slope.set(tk.N)
             
             
 #-------------------------------------------------
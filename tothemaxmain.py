@@ -3,7 +3,8 @@ To the Max main processing
 Can start from this module or initiated from tothemaxhome.py
 
 Purpose:
-    - Calculates slope and aspect values from input dataset data
+    - Calculates slope and aspect values from input dataset data, using
+      tothemaxcore.py (importable, returns arrays)
     - Generates maps (up to 4) using Matplotlib 
     - Creates .txt output files (3) 
 
@@ -16,8 +17,9 @@ Triggered by:
     - Developement IDE
 
 Input:   
-    - 9 optional arguments - able to be passed in in any order:
-        - --filename <URL of input dataset>
+    - 39 optional arguments - able to be passed in in any order:
+        - --filename <URL of input dataset (ASCII grid or tiled binary
+                      raster), - for standard input>
         - --resolution <Resolution / Cell size of the surface input dataset>
         - --fillsinks <Fill data cells when no downhill slope>
         - --slopemap <Slope map selection: as a percentage, in degrees or both>
@@ -26,12 +28,48 @@ Input:
         - --yref <Lower left corner Cartesian map reference (y axis)>
         - --hemisphere <Hemisphere of x,y Cartesian map reference>
         - --dispparams <Display parameter data>
+        - --hillshade <Hillshade map: none, single or multi-directional>
+        - --sunazimuth <Hillshade sun azimuth (degrees)>
+        - --sunaltitude <Hillshade sun altitude (degrees)>
+        - --shadebg <Use the hillshade as the elevation map background>
+        - --focalstats <Curvature and terrain roughness maps required>
+        - --tpiradius <Topographic Position Index window radius (cells)>
+        - --flowdir <Flow direction method: D8 or D-infinity>
+        - --diagnostics <Report sink and flat regions>
+        - --labelmaps <Sink and flat region label maps required>
+        - --storage <Elevation storage: Python floats, float32, int16, int32>
+        - --decimals <Decimal places kept by int16 / int32 storage>
+        - --pipeline <Overlap reading, calculating and writing files>
+        - --blockrows <Rows per block read and calculated by the pipeline>
+        - --checkpoint <Seconds between checkpoints of progress (0 = none)>
+        - --resume <Resume from the last checkpoint>
+        - --stdout <Map streamed to standard output instead of files>
+        - --slopeclasses <Slope class breaks (degrees) for class map / areas>
+        - --contours <Contour interval (metres, 0 = no contours)>
+        - --resample <Cell size resampled to before analysis (0 = none)>
+        - --resamplemethod <Resampling method: mean, min, max, bilinear 
+                            or nearest>
+        - --observers <File of viewshed observer points (map coordinates)>
+        - --observerheight <Viewshed observer height above the terrain>
+        - --workers <Processes used for reading and the viewshed>
+        - --tiledout <Slope and aspect maps also written as tiled binary
+                      rasters>
+        - --sources <File of cost distance source points (map coordinates)>
+        - --targets <File of least cost route target points (map 
+                     coordinates)>
+        - --maxslope <Steepest slope travelled over (degrees)>
+        - --insolation <Date range of clear sky insolation (month-day)>
+        - --latitude <Latitude of insolation (default from the y reference)>
+        - --shadows <Terrain shadows included in insolation>
       Note: All arguments but filename have a default value hard coded
       if not supplied.
 
     - Terrain raster file - URL suppied as a argument
             
 Output:
+    - Standard output (--stdout P, D or A) - slope as a percentage, slope
+      in degrees or aspect map as an ASCII grid, instead of the figure and
+      files below
     - Figure (with sub plots - 2 x 2)
         - Elevation map (1)
         - Gradient map (1 or 2)
@@ -39,9 +77,31 @@ Output:
     - Files
         - slope_map_perc.txt - Slope map data as a percentage
         - slope_map_deg.txt  - Slope map data in degrees
-        - aspect_map.txt     - Aspect map data
+        - aspect_map.txt     - Aspect map data (degrees to 1 decimal place
+                               for D-infinity)
+        - hillshade_map.txt  - Hillshade map data (0 - 255)
+        - plan_curv_map.txt  - Plan curvature map data
+        - prof_curv_map.txt  - Profile curvature map data
+        - tri_map.txt        - Terrain Ruggedness Index map data
+        - tpi_map.txt        - Topographic Position Index map data
+        - roughness_map.txt  - Roughness map data
+        - sink_label_map.txt - Sink region label map data
+        - flat_label_map.txt - Flat region label map data
+        - slope_class_map.txt  - Slope class map data (255 for NoData)
+        - slope_class_area.txt - Area (hectares) of each slope class by
+                                 aspect octant
+        - contours.geojson   - Contour lines (map coordinates)
+        - viewshed_map.txt   - No. of observers seeing each cell
+        - slope_map_perc.ttr, slope_map_deg.ttr, aspect_map.ttr - Slope
+                               and aspect map data as tiled binary 
+                               rasters (tiledraster.py)
+        - cost_distance_map.txt - Walking time (minutes) from the nearest
+                               source
+        - routes.geojson     - Least cost route to each target
+        - insolation_map.txt - Clear sky insolation (kWh per square metre)
 '''
 
+import sys
 import csv
 import math
 import numpy as np
@@ -49,7 +109,21 @@ import argparse
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import neighbourhood as nbh
+import hillshade as hs
+import focalstats as fs
+import diagnostics as diag
+import pyramid as pyr
+import pipeline as ppl
+import tothemaxcore as core
+import slopeclass as sc
+import contours as ctr
+import resample as rsp
+import viewshed as vws
+import costdistance as cdt
+import insolation as ins
+import checkpoint as ckp
 import surface
+import tiledraster as trs
 import warnings
 
 
@@ -72,6 +146,98 @@ def pos_int(num_str):
     
     except ValueError:
         return math.nan, False
+
+
+def write_map(file_name, grid, decimals=1):
+    '''
+    Write an array of map data to a space separated output file.
+
+    Input:
+        - Output file name.
+        - Array (or nested list) of map data, NaN for NoData.
+        - Decimal places to round to (None for whole numbers).
+
+    Output:
+        - Output file.
+    '''
+    f = open(file_name, 'w', newline='')
+    output = csv.writer(f, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+
+    for row in np.asarray(grid, dtype=np.float64).tolist():
+        if decimals is None:
+            output.writerow([int(round(cell)) if not math.isnan(cell) 
+                             else cell for cell in row])
+        else:
+            output.writerow([round(cell, decimals) for cell in row])
+
+    f.close()
+
+
+def label_regions(sinks, flats, report, cells):
+    '''
+    Label connected sink regions and flat regions (cells with ties before
+    they are resolved) and, if required, report on them.
+
+    Input:
+        - Sink and flat cells (boolean arrays).
+        - Report indicator (True / False).
+        - No. of cells in the terrain.
+
+    Output:
+        - Sink and flat region label arrays.
+    '''
+    sink_labels, sink_regions = diag.label_regions(sinks)
+    flat_labels, flat_regions = diag.label_regions(flats)
+
+    if report:
+        print(diag.region_report('Sink', sink_regions, cells))
+        print(diag.region_report('Flat', flat_regions, cells))
+
+    return sink_labels, flat_labels
+
+
+def map_row(row, row_runs, convert):
+    '''
+    Convert a row of map data for output.  Each run of cells skipped by
+    tothemaxcore.py has the same value, so is converted once.
+
+    Input:
+        - Row of map data (list).
+        - Runs of cells skipped (first column, column after the last).
+        - Conversion of a cell value for output.
+
+    Output:
+        - Converted row of map data.
+    '''
+    converted = []
+
+    for c0, c1, skip in core.row_segments(row_runs, len(row)):
+        if skip:
+            converted += [convert(row[c0])] * (c1 - c0)
+        else:
+            converted += [convert(cell) for cell in row[c0:c1]]
+
+    return converted
+
+
+def show_map(grid, method='mean', **kwargs):
+    '''
+    Display map data on the current sub plot.  Large maps are displayed
+    from an overview pyramid at the resolution the sub plot can show,
+    with finer levels fetched when zooming in.
+
+    Input:
+        - Array (or nested list) of map data, NaN for NoData.
+        - Pyramid reduction method (mean, mode or circular).
+        - Matplotlib imshow arguments.
+
+    Output:
+        - Matplotlib image (also made the current image).
+    '''
+    image = pyr.Pyramid(grid, method).show(plt.gca(), **kwargs)
+    plt.sci(image)
+
+    return image
     
 #----------------------------------------------------------
 # Initialise variables.
@@ -82,9 +248,22 @@ CYCLIC_ASPECT = mpl.colors.ListedColormap([
                     'deepskyblue', 'deepskyblue', 'cyan', 'cyan', 
                     'lime', 'lime', 'yellow', 'yellow', 'orange', 'orange', 
                     'red'])
+STORAGE_TYPE = {'F':None, 'F32':'float32', 'I16':'int16', 'I32':'int32'}
+STREAM_MAP = {'P':'perc', 'D':'deg', 'A':'aspect'}
 ARG_NAME = ['--filename', '--resolution', '--fillsinks', '--slopemap', 
-            '--aspectmap', '--xref', '--yref', '--hemisphere', '--dispparams']
-ARG_DFLT = ['', '50', 'Y', 'D', 'Y', '0', '0', 'N', 'Y']
+            '--aspectmap', '--xref', '--yref', '--hemisphere', '--dispparams',
+            '--hillshade', '--sunazimuth', '--sunaltitude', '--shadebg',
+            '--focalstats', '--tpiradius', '--flowdir', '--diagnostics',
+            '--labelmaps', '--storage', '--decimals', '--pipeline', 
+            '--blockrows', '--checkpoint', '--resume', '--stdout', 
+            '--slopeclasses', '--contours', '--resample', 
+            '--resamplemethod', '--observers', '--observerheight', 
+            '--workers', '--tiledout', '--sources', '--targets', 
+            '--maxslope', '--insolation', '--latitude', '--shadows']
+ARG_DFLT = ['', '50', 'Y', 'D', 'Y', '0', '0', 'N', 'Y', 'N', '315', '45', 'N',
+            'N', '1', 'D8', 'N', 'N', 'F', '0', 'N', str(ppl.BLOCK_ROWS), 
+            '0', 'N', 'N', 'N', '0', '0', 'MEAN', 'N', '2', '1', 'N', 'N', 'N', 
+            '45', 'N', '', 'Y']
 ARG_DEST = ['file_name', 
             'resolution',
             'fill_sinks',
@@ -93,7 +272,37 @@ ARG_DEST = ['file_name',
             'x_ref',
             'y_ref',
             'hemisphere',
-            'display_params']
+            'display_params',
+            'hill_shade',
+            'sun_azimuth',
+            'sun_altitude',
+            'shade_bg',
+            'focal_stats',
+            'tpi_radius',
+            'flow_dir',
+            'diagnostics',
+            'label_maps',
+            'storage',
+            'decimals',
+            'pipeline',
+            'block_rows',
+            'checkpoint',
+            'resume',
+            'std_out',
+            'slope_classes',
+            'contour_interval',
+            'resample',
+            'resample_method',
+            'observers',
+            'observer_height',
+            'workers',
+            'tiled_out',
+            'sources',
+            'targets',
+            'max_slope',
+            'insolation',
+            'latitude',
+            'shadows']
 ARG_HELP = ['Raster input file name',
             'Resolution / cell size (metres, integer)',
             'Fill in sinks / holes (Y/N)', 
@@ -102,7 +311,50 @@ ARG_HELP = ['Raster input file name',
             'Cartesian reference x coordinate (metres, integer)',
             'Cartesian reference y coordinate (metres, integer)',
             'Hemisphere Cartesian coordinaate referebce located in (N/S)',
-            'Display parameter data (Y/N)']
+            'Display parameter data (Y/N)',
+            'Output hillshade map, none, single or multi-directional (N/S/M)',
+            'Hillshade sun azimuth (degrees clockwise from North, 0-360)',
+            'Hillshade sun altitude (degrees above horizon, 1-90)',
+            'Use hillshade as the elevation map background (Y/N)',
+            'Output curvature, TRI, TPI and roughness maps (Y/N)',
+            'TPI window radius (cells, positive integer)',
+            'Flow direction method, D8 or D-infinity (D8/DINF)',
+            'Report sink and flat region counts, sizes and extents (Y/N)',
+            'Output sink and flat region label maps (Y/N)',
+            'Elevation storage, Python floats, float32, int16 or int32 '
+            + '(F/F32/I16/I32), F32 keeps 7 significant digits, longer '
+            + 'values can change the maps',
+            'Decimal places kept by I16 / I32 storage (integer, 0-6)',
+            'Overlap reading, calculating and writing files (Y/N)',
+            'Rows per pipeline block (positive integer)',
+            'Seconds between checkpoints of progress (integer, 0 = none)',
+            'Resume from the last checkpoint (Y/N)',
+            'Map streamed to standard output as an ASCII grid, none, slope '
+            + 'as a percentage, in degrees or aspect (N/P/D/A)',
+            'Slope class breaks, none, default (30,35,45) or comma '
+            + 'separated degrees (N/Y/list)',
+            'Contour interval (metres, 0 = no contours)',
+            'Cell size resampled to before analysis (metres, integer, '
+            + '0 = none)',
+            'Resampling method (MEAN/MIN/MAX/BILINEAR/NEAREST)',
+            'Viewshed observer points file, x y map coordinates per line '
+            + '(N = no viewshed)',
+            'Viewshed observer height above the terrain (metres)',
+            'Processes used for reading the file and the viewshed '
+            + '(positive integer)',
+            'Slope and aspect maps also written as tiled binary rasters '
+            + '(Y/N)',
+            'Cost distance source points file, x y map coordinates per line '
+            + '(N = no cost distance)',
+            'Least cost route target points file, x y map coordinates per '
+            + 'line (N = no routes)',
+            'Steepest slope travelled over by cost distance (degrees, '
+            + '0-90)',
+            'Clear sky insolation date range, first and last month-day '
+            + '(e.g. 03-01,04-30, N = no insolation)',
+            'Latitude of insolation (degrees, -90 to 90, default from the '
+            + 'y reference and hemisphere)',
+            'Terrain shadows included in insolation (Y/N)']
 terrain = []
 
 #----------------------------------------------------------
@@ -130,7 +382,37 @@ arg_value = [args.file_name.lower(),
              args.x_ref,
              args.y_ref,
              args.hemisphere.upper(),
-             args.display_params.upper()]
+             args.display_params.upper(),
+             args.hill_shade.upper(),
+             args.sun_azimuth,
+             args.sun_altitude,
+             args.shade_bg.upper(),
+             args.focal_stats.upper(),
+             args.tpi_radius,
+             args.flow_dir.upper(),
+             args.diagnostics.upper(),
+             args.label_maps.upper(),
+             args.storage.upper(),
+             args.decimals,
+             args.pipeline.upper(),
+             args.block_rows,
+             args.checkpoint,
+             args.resume.upper(),
+             args.std_out.upper(),
+             args.slope_classes.upper(),
+             args.contour_interval,
+             args.resample,
+             args.resample_method.upper(),
+             args.observers,
+             args.observer_height,
+             args.workers,
+             args.tiled_out.upper(),
+             args.sources,
+             args.targets,
+             args.max_slope,
+             args.insolation.upper(),
+             args.latitude,
+             args.shadows.upper()]
 
 arg_err_count = 0
 
@@ -165,6 +447,193 @@ if arg_value[7] not in ('N', 'S'):
     print(ARG_NAME[7], ': Must be N(orthern) or S(outhern)')
     arg_err_count += 1
 
+# Validate --tpiradius.
+int_val, pos_ind = pos_int(arg_value[14])
+
+if pos_ind is False:
+    print(ARG_NAME[14], ': Must be a positive integer')
+    arg_err_count += 1
+else:
+    arg_value[14] = int_val
+
+# Validate --flowdir.
+if arg_value[15] not in ('D8', 'DINF'):
+    print(ARG_NAME[15], ': Must be D8 or DINF')
+    arg_err_count += 1
+
+# Validate --storage, --decimals.
+if arg_value[18] not in ('F', 'F32', 'I16', 'I32'):
+    print(ARG_NAME[18], ': Must be F, F32, I16 or I32')
+    arg_err_count += 1
+
+int_val, pos_ind = pos_int(arg_value[19])
+
+if int_val is math.nan or int_val < 0 or int_val > 6:
+    print(ARG_NAME[19], ': Must be an integer from 0 to 6')
+    arg_err_count += 1
+else:
+    arg_value[19] = int_val
+
+# Validate --pipeline, --blockrows.
+if arg_value[20] == 'Y' and (arg_value[15] != 'D8' or arg_value[16] == 'Y'
+                             or arg_value[17] == 'Y' or arg_value[18] != 'F'):
+    print(ARG_NAME[20], ': Requires', ARG_NAME[15], 'D8,', ARG_NAME[18], 
+          'F and no', ARG_NAME[16], 'or', ARG_NAME[17])
+    arg_err_count += 1
+
+int_val, pos_ind = pos_int(arg_value[21])
+
+if pos_ind is False:
+    print(ARG_NAME[21], ': Must be a positive integer')
+    arg_err_count += 1
+else:
+    arg_value[21] = int_val
+
+# Validate --checkpoint, --resume.
+int_val, pos_ind = pos_int(arg_value[22])
+
+if int_val is math.nan or int_val < 0:
+    print(ARG_NAME[22], ': Must be 0 or a positive integer')
+    arg_err_count += 1
+else:
+    arg_value[22] = int_val
+
+if arg_value[20] == 'Y' and (arg_value[22] != 0 or arg_value[23] == 'Y'):
+    print(ARG_NAME[22], ARG_NAME[23], ': Not available with', ARG_NAME[20], 
+          'Y')
+    arg_err_count += 1
+
+if arg_value[0] == '-' and (arg_value[22] != 0 or arg_value[23] == 'Y'):
+    print(ARG_NAME[22], ARG_NAME[23], ': Not available with', ARG_NAME[0], 
+          '-')
+    arg_err_count += 1
+
+# Validate --stdout.
+if arg_value[24] not in ('N', 'P', 'D', 'A'):
+    print(ARG_NAME[24], ': Must be N(one), P(ercentage), D(egrees) or '
+          + 'A(spect)')
+    arg_err_count += 1
+elif arg_value[24] != 'N' and (arg_value[20] != 'Y' or arg_value[9] != 'N' 
+                               or arg_value[13] == 'Y' 
+                               or arg_value[25] != 'N'
+                               or arg_value[26] not in (0, '0')
+                               or arg_value[29].upper() != 'N'):
+    print(ARG_NAME[24], ': Requires', ARG_NAME[20], 'Y and no', 
+          ARG_NAME[9] + ',', ARG_NAME[13] + ',', ARG_NAME[25] + ',', 
+          ARG_NAME[26], 'or', ARG_NAME[29])
+    arg_err_count += 1
+
+# Validate --slopeclasses.
+if arg_value[25] != 'N':
+    class_breaks = sc.parse_breaks(arg_value[25])
+
+    if class_breaks is None:
+        print(ARG_NAME[25], ': Must be N, Y or increasing degrees between '
+              + '0 and 90, separated by commas')
+        arg_err_count += 1
+
+# Validate --contours.
+try:
+    arg_value[26] = float(arg_value[26])
+    if arg_value[26] < 0 or math.isinf(arg_value[26]):
+        raise ValueError
+except ValueError:
+    print(ARG_NAME[26], ': Must be 0 or a positive number')
+    arg_err_count += 1
+
+# Validate --resample, --resamplemethod.
+int_val, pos_ind = pos_int(arg_value[27])
+
+if int_val is math.nan or int_val < 0:
+    print(ARG_NAME[27], ': Must be 0 or a positive integer')
+    arg_err_count += 1
+else:
+    arg_value[27] = int_val
+
+if arg_value[28] not in rsp.METHODS:
+    print(ARG_NAME[28], ': Must be MEAN, MIN, MAX, BILINEAR or NEAREST')
+    arg_err_count += 1
+
+if arg_value[27] != 0 and arg_value[20] == 'Y':
+    print(ARG_NAME[27], ': Not available with', ARG_NAME[20], 'Y')
+    arg_err_count += 1
+
+# Validate --observers, --observerheight, --workers.
+if arg_value[29].upper() == 'N':
+    arg_value[29] = 'N'
+
+try:
+    arg_value[30] = float(arg_value[30])
+    if arg_value[30] < 0 or math.isinf(arg_value[30]):
+        raise ValueError
+except ValueError:
+    print(ARG_NAME[30], ': Must be 0 or a positive number')
+    arg_err_count += 1
+
+int_val, pos_ind = pos_int(arg_value[31])
+
+if pos_ind is False:
+    print(ARG_NAME[31], ': Must be a positive integer')
+    arg_err_count += 1
+else:
+    arg_value[31] = int_val
+
+# Validate --sources, --targets, --maxslope.
+for i in (33, 34):
+    if arg_value[i].upper() == 'N':
+        arg_value[i] = 'N'
+
+if arg_value[34] != 'N' and arg_value[33] == 'N':
+    print(ARG_NAME[34], ': Requires', ARG_NAME[33])
+    arg_err_count += 1
+
+try:
+    arg_value[35] = float(arg_value[35])
+    if not 0 <= arg_value[35] <= 90:
+        raise ValueError
+except ValueError:
+    print(ARG_NAME[35], ': Must be a number from 0 to 90')
+    arg_err_count += 1
+
+# Validate --insolation, --latitude.
+if arg_value[36] != 'N':
+    try:
+        ins.day_range(arg_value[36])
+    except SystemExit:
+        print(ARG_NAME[36], ': Must be N or month-day dates, e.g. 03-01,04-30')
+        arg_err_count += 1
+
+if arg_value[37] != '':
+    try:
+        arg_value[37] = float(arg_value[37])
+        if not -90 <= arg_value[37] <= 90:
+            raise ValueError
+    except ValueError:
+        print(ARG_NAME[37], ': Must be a number from -90 to 90')
+        arg_err_count += 1
+
+# Validate --hillshade.
+if arg_value[9] not in ('N', 'S', 'M'):
+    print(ARG_NAME[9], ': Must be N(one), S(ingle) or M(ulti-directional)')
+    arg_err_count += 1
+
+# Validate --sunazimuth, --sunaltitude.
+for i, low, high in ((10, 0, 360), (11, 1, 90)):
+
+    int_val, pos_ind = pos_int(arg_value[i])
+
+    if int_val is math.nan or int_val < low or int_val > high:
+        print(ARG_NAME[i], ': Must be an integer from', low, 'to', high)
+        arg_err_count += 1
+
+    else:
+        arg_value[i] = int_val
+
+# Validate --shadebg.
+if arg_value[12] == 'Y' and arg_value[9] == 'N':
+    print(ARG_NAME[12], ': Requires', ARG_NAME[9], 'S or M')
+    arg_err_count += 1
+
 # All others are Y/N and controlled by check buttons.
 # Note: If a string argument contain anything other than Y or N, then the 
 # logic will treat it as a N.
@@ -177,8 +646,21 @@ if arg_err_count > 0:
 # Reasign back.
 args.file_name, args.resolution, args.fill_sinks, args.slope_map, \
         args.aspect_map, args.x_ref, args.y_ref, args.hemisphere, \
-        args.display_params \
-        = arg_value
+        args.display_params, args.hill_shade, args.sun_azimuth, \
+        args.sun_altitude, args.shade_bg, args.focal_stats, args.tpi_radius, \
+        args.flow_dir, args.diagnostics, args.label_maps, args.storage, \
+        args.decimals, args.pipeline, args.block_rows, args.checkpoint, \
+        args.resume, args.std_out, args.slope_classes, \
+        args.contour_interval, args.resample, args.resample_method, \
+        args.observers, args.observer_height, args.workers, \
+        args.tiled_out, args.sources, args.targets, args.max_slope, \
+        args.insolation, args.latitude, args.shadows = arg_value
+
+# If a map is streamed to standard output, anything else printed goes to
+# standard error.
+if args.std_out != 'N':
+    map_stream = sys.stdout
+    sys.stdout = sys.stderr
 
 # Display back to the user (GUI or command line).
 if args.display_params == 'Y':
@@ -191,14 +673,99 @@ if args.display_params == 'Y':
           + ',\n - Starting x,y reference: ' + str(args.x_ref) 
           + ' ' + str(args.y_ref) 
           + ',\n - Hemisphere: ' + args.hemisphere 
+          + ',\n - Generate hillshade map: ' + args.hill_shade 
+          + ',\n - Sun azimuth, altitude (degrees): ' + str(args.sun_azimuth) 
+          + ' ' + str(args.sun_altitude) 
+          + ',\n - Hillshade elevation background: ' + args.shade_bg 
+          + ',\n - Generate focal statistics maps: ' + args.focal_stats 
+          + ',\n - TPI window radius (cells): ' + str(args.tpi_radius) 
+          + ',\n - Flow direction method: ' + args.flow_dir 
+          + ',\n - Report sinks and flats: ' + args.diagnostics 
+          + ',\n - Generate sink and flat label maps: ' + args.label_maps 
+          + ',\n - Elevation storage, decimals: ' + args.storage 
+          + ' ' + str(args.decimals) 
+          + ',\n - Pipelined processing, block rows: ' + args.pipeline 
+          + ' ' + str(args.block_rows) 
+          + ',\n - Checkpoint interval (seconds), resume: ' 
+          + str(args.checkpoint) + ' ' + args.resume 
+          + ',\n - Map streamed to standard output: ' + args.std_out 
+          + ',\n - Slope class breaks: ' + args.slope_classes 
+          + ',\n - Contour interval (metres): ' + f'{args.contour_interval:g}' 
+          + ',\n - Resampled cell size (metres), method: ' 
+          + str(args.resample) + ' ' + args.resample_method 
+          + ',\n - Viewshed observers, height (metres), workers: ' 
+          + args.observers + ' ' + f'{args.observer_height:g}' + ' ' 
+          + str(args.workers) 
+          + ',\n - Maps also written as tiled binary rasters: ' 
+          + args.tiled_out 
+          + ',\n - Cost distance sources, route targets, max slope: ' 
+          + args.sources + ' ' + args.targets + ' ' 
+          + f'{args.max_slope:g}' 
+          + ',\n - Insolation dates, latitude, shadows: ' 
+          + args.insolation + ' ' + str(args.latitude) + ' ' + args.shadows 
           + '.')
 
 
+#----------------------------------------------------------
+# If required, start checkpoints of progress, or restore
+# the last checkpoint, checking it is for the same input
+# file and the same arguments.
+#----------------------------------------------------------
+if args.checkpoint > 0 or args.resume == 'Y':
+    checkpoint = ckp.Checkpoint(args.file_name, 
+                                {'resolution': args.resolution, 
+                                 'fill_sinks': args.fill_sinks, 
+                                 'slope_map': args.slope_map, 
+                                 'aspect_map': args.aspect_map, 
+                                 'flow_dir': args.flow_dir, 
+                                 'storage': args.storage, 
+                                 'decimals': args.decimals, 
+                                 'resample': args.resample, 
+                                 'resample_method': args.resample_method}, 
+                                args.checkpoint)
+    if args.resume == 'Y':
+        checkpoint.load()
+else:
+    checkpoint = None
+
+
 #----------------------------------------------------------
 # Read in raster dataset and create terrain instance.
+# If pipelined, the D8 Gradient is calculated and the slope
+# and aspect files written while the dataset is read.
 #----------------------------------------------------------
-terrain = surface.SurfaceRaster(args.file_name)
-terrain.read_raster()
+terrain = surface.SurfaceRaster(args.file_name, 
+                                storage=STORAGE_TYPE[args.storage], 
+                                decimals=args.decimals)
+
+if args.std_out != 'N':
+    ppl.run(terrain, args.resolution, DICT_ASPECT, args.fill_sinks == 'Y', 
+            block_rows=args.block_rows, stream=map_stream, 
+            stream_map=STREAM_MAP[args.std_out])
+    terrain.close_raster()
+
+    # Streamed - no maps or files.
+    parser.exit()
+
+elif args.pipeline == 'Y':
+    gradient = ppl.run(terrain, args.resolution, DICT_ASPECT, 
+                       args.fill_sinks == 'Y', args.slope_map, 
+                       args.aspect_map, args.block_rows)
+else:
+    # Large files can be read by several processes at once.
+    if args.workers > 1 and args.file_name != '-':
+        terrain.read_parallel(args.workers)
+    else:
+        terrain.read_raster()
+    gradient = None
+
+    # If required, resample to the analysis cell size, which is then the
+    # resolution used for slope and mapping.
+    if args.resample > 0:
+        terrain.resample(args.resample, args.resample_method, 
+                         args.resolution)
+        args.resolution = args.resample
+
 terrain.close_raster()
     
 
@@ -216,8 +783,6 @@ if terrain.ncols == 0:
 else:
     x_limit = terrain.ncols
 
-gradient = [[0 for i in range(x_limit)] for j in range(y_limit)]
-
 # x,y reference point
 x_ext = [f'{args.x_ref:,}' + 'E ' + f'{args.y_ref:,}' + args.hemisphere + ' m', 
          f'{(args.x_ref + (args.resolution * x_limit)):,}' + 'E m']
@@ -229,134 +794,194 @@ elif args.hemisphere == 'S' and args.y_ref < args.resolution * y_limit:
 else:   
     y_ext = [f'{(args.y_ref - (args.resolution * y_limit)):,}' + 'S m', None]
 
+# Map coordinates of the lower left corner, from the header data or the
+# x,y reference.
+if terrain.cellsize:
+    x_origin, y_origin = terrain.xllcorner, terrain.yllcorner
+else:
+    x_origin, y_origin = args.x_ref, args.y_ref
+
 
 #----------------------------------------------------------
-# Create a Gradient instances of Neighbourhood objects
-# (3 x 3 cell objects).
+# Calculate slope and aspect (tothemaxcore.py):
+#  - D-infinity: a continuous aspect for all cells at once.
+#    There are no ties to resolve.
+#  - D8: create a Gradient instances of Neighbourhood 
+#    objects (3 x 3 cell objects), then resolve the cells 
+#    with more than one D8 direction.  If pipelined, the 
+#    Gradient has already been calculated.
+# If required, label connected sink regions and flat regions
+# and report on them as soon as they are known, before any 
+# time is spent resolving the ties.
 #----------------------------------------------------------
-for r, row in enumerate(terrain.cells): 
-    
-    for c, col in enumerate(row):
+region_labels = []
 
-        # Create 3 x 3 neighbourhood instance.
-        gradient[r][c] = nbh.Neighbourhood(
-                                terrain.cells, args.resolution, r, c)
-        
-        # Handle NoData cell.
-        if gradient[r][c].centre == terrain.nodata_value:
-            terrain.cells[r][c] = math.nan
+if args.diagnostics == 'Y' or args.label_maps == 'Y':
+    regions = lambda sinks, flats: region_labels.extend(
+                  label_regions(sinks, flats, args.diagnostics == 'Y', 
+                                y_limit * x_limit))
+else:
+    regions = None
 
-        # Calculate slope and aspect.
-        gradient[r][c].slope_aspect(DICT_ASPECT, terrain.nodata_value)
-        
-        # If required, deal with a cell where all its 
-        # immediate neighbours are all higher.
-        if args.fill_sinks == 'Y' and gradient[r][c].slope == -math.inf:
-            gradient[r][c].sink_fill(DICT_ASPECT)
+result = core.calculate(terrain, args.resolution, args.fill_sinks == 'Y', 
+                        args.flow_dir, d8_dict=DICT_ASPECT, 
+                        checkpoint=checkpoint, gradient=gradient, 
+                        regions=regions)
+
+elevation = result.elevation
+slope_perc = result.slope_perc
+slope_deg = result.slope_deg
+aspect = result.aspect
 
 
 #----------------------------------------------------------
-# Look for cells that have a list of neighbours with the 
-# same maximum downhill gradient.
-# 
-# From this list and in turn, get the apsect of the 
-# neighbourhood in the opposite direction.  If a match, 
-# then use this aspect for the current Neighbourhood and 
-# ignore the remainder of the list.
-#            
-# If no matches, take the aspect of the first neighbour
-# in the list.
-#
-# Loop until no more cells can be resolved this way.          
+# If required, get the 3 x 3 Neighbourhood of every cell as
+# arrays in one vectorised pass over the terrain already in
+# memory (already built for D-infinity).  The hillshade, 
+# focal statistics and insolation are calculated from this 
+# one set of arrays.
 #----------------------------------------------------------
-keep_looping = True
+if args.hill_shade != 'N' or args.focal_stats == 'Y' \
+        or args.insolation != 'N':
+    if result.stack is None:
+        centre, neighbours = nbh.neighbour_stack(terrain.cells, 
+                                                 terrain.nodata_value)
+    else:
+        centre, neighbours = result.stack
 
-while keep_looping:
 
-    keep_looping = False
-    
-    for r, row in enumerate(terrain.cells): 
+#----------------------------------------------------------
+# If required, calculate the surface slope and aspect (for
+# the hillshade and insolation), the hillshade and focal 
+# statistics from the Neighbourhood arrays.
+#----------------------------------------------------------
+if args.hill_shade != 'N' or args.insolation != 'N':
+    surface_slope, surface_aspect = hs.surface_slope_aspect(
+                                    centre, neighbours, args.resolution)
+
+if args.hill_shade != 'N':
+    if args.hill_shade == 'M':
+        shade = hs.multi_hillshade(surface_slope, surface_aspect, 
+                                   args.sun_altitude)
+    else:
+        shade = hs.hillshade(surface_slope, surface_aspect, 
+                             args.sun_azimuth, args.sun_altitude)
 
-        for c, col in enumerate(row):
+if args.focal_stats == 'Y':
+    plan_curv, prof_curv = fs.curvature(centre, neighbours, args.resolution)
+    tri, tpi, rough = fs.roughness(centre, neighbours)
 
-            # Do if 2 or more D8 downhill directions have been identified.
-            if len(gradient[r][c].d8) > 1:
-            
-                # n = 0 (D8 East)  n = 1 (D8 South-East) 
-                # n = 2 (D8 South) n = 3 (D8 South-West) 
-                # n = 4 (D8 West)  n = 5 (D8 North-West) 
-                # n = 6 (D8 North) n = 7 (D8 North-East)
-                for n in gradient[r][c].d8:
-    
-                    # Edges - Insufficient data - Use the first choice.
-                    if (n in (1, 2, 3) and r == 0) \
-                       or (n in (5, 6, 7) and r == y_limit - 1) \
-                       or (n in (0, 1, 7) and c == 0) \
-                       or (n in (3, 4, 5) and c == x_limit - 1):
-                        gradient[r][c].d8 = [n]
-                        
-                    # East cell.
-                    # Compare with 3x3 neighbourhood one cell West.
-                    elif n == 0:
-                        if DICT_ASPECT[2**n] == gradient[r][c-1].aspect:
-                            gradient[r][c].aspect = gradient[r][c-1].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # Sout-East cell.
-                    # Compare with 3x3 neighbourhood one cell North-West.
-                    elif n == 1:
-                        if DICT_ASPECT[2**n] == gradient[r-1][c-1].aspect:
-                            gradient[r][c].aspect = gradient[r-1][c-1].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # South cell.
-                    # Compare with 3x3 neighbourhood one cell North.
-                    elif n == 2:
-                        if DICT_ASPECT[2**n] == gradient[r-1][c].aspect:
-                            gradient[r][c].aspect = gradient[r-1][c].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # South-West cell.
-                    # Compare with 3x3 neighbourhood one cell North-East.
-                    elif n == 3:
-                        if DICT_ASPECT[2**n] == gradient[r-1][c+1].aspect:
-                            gradient[r][c].aspect = gradient[r-1][c+1].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # West cell.
-                    # Compare with 3x3 neighbourhood one cell East.
-                    elif n == 4:
-                        if DICT_ASPECT[2**n] == gradient[r][c+1].aspect:
-                            gradient[r][c].aspect = gradient[r][c+1].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # North-West cell.
-                    # Compare with 3x3 neighbourhood one cell South-East.
-                    elif n == 5:
-                        if DICT_ASPECT[2**n] == gradient[r+1][c+1].aspect:
-                            gradient[r][c].aspect = gradient[r+1][c+1].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # North cell.
-                    # Compare with 3x3 neighbourhood one cell South.
-                    elif n == 6:
-                        if DICT_ASPECT[2**n] == gradient[r+1][c].aspect:
-                            gradient[r][c].aspect = gradient[r+1][c].aspect
-                            gradient[r][c].d8 = [n]
-                        
-                    # North-East cell.
-                    # Compare with 3x3 neighbourhood one cell South-West.
-                    else:
-                        if DICT_ASPECT[2**n] == gradient[r+1][c-1].aspect:
-                            gradient[r][c].aspect = gradient[r+1][c-1].aspect
-                            gradient[r][c].d8 = [n]
-
-                    # If the cell has been resolved, another full iteration
-                    # will be required.
-                    if len(gradient[r][c].d8) == 1:
-                        keep_looping = True
-                        break # Don't need to check any remaining options
-                              # for this cell.
+    # Wider TPI windows from summed-area tables.
+    if args.tpi_radius > 1:
+        tpi = fs.window_tpi(centre, args.tpi_radius)
+
+
+#----------------------------------------------------------
+# If required, reclassify slope into slope classes and total
+# the area of each class facing each aspect octant.
+#----------------------------------------------------------
+if args.slope_classes != 'N':
+    slope_classes = sc.classify(slope_deg, class_breaks)
+    class_area = sc.class_area_table(slope_classes, aspect, 
+                                     len(class_breaks) + 1, args.resolution)
+    class_report = sc.area_report(class_area, class_breaks)
+
+    print('Slope class area (hectares) by aspect:')
+    for row in class_report:
+        print(' '.join(f'{cell:>9}' for cell in row))
+
+
+#----------------------------------------------------------
+# If required, count the observers that can see each cell.
+#----------------------------------------------------------
+if args.observers != 'N':
+    observers = vws.read_observers(args.observers)
+    view_count, view_cells = vws.cumulative_viewshed(
+                                    elevation, observers, 
+                                    args.observer_height, x_origin, y_origin, 
+                                    terrain.cellsize or args.resolution, 
+                                    workers=args.workers)
+
+    cell_area = (terrain.cellsize or args.resolution) ** 2
+    print('Viewshed (cells visible, hectares):')
+    for (x, y), cells in zip(observers, view_cells):
+        print(f' - Observer {x:g} {y:g}: {cells:,}, '
+              + f'{cells * cell_area / 10000:,.2f}')
+
+
+#----------------------------------------------------------
+# If required, accumulate the walking time from the sources
+# to every cell, and trace the least cost route to each 
+# target.
+#----------------------------------------------------------
+if args.sources != 'N':
+    cellsize = terrain.cellsize or args.resolution
+    sources = [cdt.point_cell(elevation, x, y, x_origin, y_origin, cellsize)
+               for x, y in cdt.read_points(args.sources)]
+    travel_cost, travel_back = cdt.cost_distance(elevation, slope_deg, 
+                                                 sources, args.resolution,
+                                                 args.max_slope)
+
+    if args.targets != 'N':
+        targets = cdt.read_points(args.targets)
+        routes, route_costs = [], []
+        print('Least cost routes (minutes, cells):')
+        for x, y in targets:
+            r, c = cdt.point_cell(elevation, x, y, x_origin, y_origin, 
+                                  cellsize)
+            route = cdt.least_cost_route(travel_cost, travel_back, r, c)
+            if route:
+                routes.append(route)
+                route_costs.append(float(travel_cost[r, c]))
+                print(f' - Target {x:g} {y:g}: {travel_cost[r, c]:,.1f}, '
+                      + f'{len(route):,}')
+            else:
+                print(f' - Target {x:g} {y:g}: not reachable')
+
+
+#----------------------------------------------------------
+# If required, total the clear sky insolation over the date
+# range, from the surface slope and aspect at the latitude
+# of the terrain.
+#----------------------------------------------------------
+if args.insolation != 'N':
+
+    # Latitude from the y reference (metres from the equator).  A header
+    # corner is not used, as it is usually from a projected grid (e.g.
+    # the British National Grid), which is not a distance from the
+    # equator.
+    if args.latitude == '':
+        args.latitude = ins.latitude(args.y_ref, args.hemisphere, 
+                                     args.resolution * y_limit)
+
+        if terrain.cellsize:
+            print('Warning:', ARG_NAME[37], 'not supplied, latitude',
+                  f'{args.latitude:.2f}', 'taken from', ARG_NAME[6], 
+                  '(metres from the equator), not the header corner of', 
+                  args.file_name, '- supply', ARG_NAME[37], 
+                  'if this is not the latitude of the terrain')
+        elif abs(args.latitude) == 90:
+            print('Warning:', ARG_NAME[6], args.y_ref, 'is not a distance',
+                  'from the equator, latitude', f'{args.latitude:.2f}', 
+                  'used - supply', ARG_NAME[37])
+
+    days = ins.day_range(args.insolation)
+    energy = ins.insolation(surface_slope, surface_aspect, elevation, 
+                            args.resolution, args.latitude, days, 
+                            args.shadows == 'Y')
+
+    print(f'Insolation (kWh per square metre) over {len(days)} days at '
+          + f'latitude {args.latitude:.2f}: mean {np.nanmean(energy):,.1f}, '
+          + f'minimum {np.nanmin(energy):,.1f}, '
+          + f'maximum {np.nanmax(energy):,.1f}')
+
+
+#----------------------------------------------------------
+# If required, trace the contour lines once, for every map
+# and zoom to draw.
+#----------------------------------------------------------
+if args.contour_interval > 0:
+    contours = ctr.Contours(elevation, args.contour_interval)
 
 
 #----------------------------------------------------------
@@ -381,52 +1006,62 @@ plt.fig.subplots_adjust(left=0.1, right=0.9, top=0.95, bottom=0.05)
 # Generate orginal Elevation map
 #----------------------------------------------------------
 plt.subplot(221).title.set_text('Elevation Map')
-plt.imshow(terrain.cells, cmap='gist_gray')
+if args.shade_bg == 'Y':
+    show_map(shade, cmap='gray')
+    show_map(elevation, cmap='terrain', alpha=0.4)
+else:
+    show_map(elevation, cmap='gist_gray')
 plt.colorbar().set_label('Elevation (m)')
+if args.contour_interval > 0:
+    contours.overlay(plt.gca())
 plt.xticks([0, x_limit], x_ext)
 plt.yticks([0, y_limit], y_ext)
 
     
 #----------------------------------------------------------
-# Generate Aspect map from Gradient instances
+# Generate Aspect map
 #----------------------------------------------------------
 if args.aspect_map == ('Y'):
     plt.subplot(222).title.set_text('Aspect Map')
-    colormap = plt.imshow([[cells.aspect for cells in gradient[r]] 
-                   for r in range(len(gradient))], cmap=CYCLIC_ASPECT)
+    colormap = show_map(aspect, 'circular' if args.flow_dir == 'DINF' 
+                        else 'mode', cmap=CYCLIC_ASPECT)
     plt.clim(0, 360)
     cbar = plt.colorbar(colormap, ticks=np.linspace(0, 360, 17)) 
     cbar.set_ticks(np.arange(0, 361, 45).tolist())
     cbar.set_ticklabels(['N', 'NW', 'W', 'SW', 'S', 'SE', 'E', 'NE', 'N'])
     cbar.set_label('Aspect')
+    if args.contour_interval > 0:
+        contours.overlay(plt.gca())
     plt.xticks([0, x_limit], x_ext)
     plt.yticks([0, y_limit], y_ext)
 
 
 #----------------------------------------------------------
-# Generate Slope map(s) from Gradient instances
+# Generate Slope map(s)
 #----------------------------------------------------------
 
 plt.subplot(223).title.set_text('Gradient Map (1)')
 
 if args.slope_map in ('B', 'D'):
-    plt.imshow([[cells.slope_deg for cells in gradient[r]] 
-                for r in range(len(gradient))], cmap='winter_r')
+    show_map(slope_deg, cmap='winter_r')
     plt.colorbar().set_label('Slope (Degrees)')
 else:
 
-    plt.imshow([[cells.slope_perc for cells in gradient[r]] 
-                for r in range(len(gradient))], cmap='winter_r')
+    show_map(slope_perc, cmap='winter_r')
     plt.colorbar().set_label('Slope (%)')
 
+if args.contour_interval > 0:
+    contours.overlay(plt.gca())
+
 plt.xticks([0, x_limit], x_ext)
 plt.yticks([0, y_limit], y_ext)
 
 if args.slope_map == 'B':
     plt.subplot(224).title.set_text('Gradient Map (2)')
-    plt.imshow([[cells.slope_perc for cells in gradient[r]] 
-                for r in range(len(gradient))], cmap='winter_r')
+    show_map(slope_perc, cmap='winter_r')
     plt.colorbar().set_label('Slope (%)')
+    if args.contour_interval > 0:
+        contours.overlay(plt.gca())
     plt.xticks([0, x_limit], x_ext)
     plt.yticks([0, y_limit], y_ext)
 
@@ -442,27 +1077,119 @@ plt.show()
 #  - slope_map_perc.txt Slope map data as a percentage
 #  - slope_map_deg.txt  Slope map data in degrees
 #  - aspect_map.txt     Aspect map data
+#  - hillshade_map.txt  Hillshade map data
+#  - plan_curv_map.txt, prof_curv_map.txt, tri_map.txt,
+#    tpi_map.txt, roughness_map.txt  Focal statistics data
+#  - sink_label_map.txt, flat_label_map.txt  Region label data
+#  - slope_class_map.txt, slope_class_area.txt  Slope class data
+#  - contours.geojson   Contour lines
+#  - viewshed_map.txt   Viewshed observer counts
+#  - slope_map_perc.ttr, slope_map_deg.ttr, aspect_map.ttr
+#                       Slope and aspect tiled binary rasters
+#  - cost_distance_map.txt Walking time from the sources
+#  - routes.geojson     Least cost routes to the targets
+#  - insolation_map.txt Clear sky insolation
+#  Note: if pipelined, the slope and aspect files have
+#  already been written.  If resumed, writing continues from
+#  the last row saved.
 #----------------------------------------------------------
-f2 = open('slope_map_perc.txt', 'w', newline='')
-f3 = open('slope_map_deg.txt', 'w', newline='')
-f4 = open('aspect_map.txt', 'w', newline='')
+if args.pipeline != 'Y':
+    if checkpoint is None:
+        f2 = open('slope_map_perc.txt', 'w', newline='')
+        f3 = open('slope_map_deg.txt', 'w', newline='')
+        f4 = open('aspect_map.txt', 'w', newline='')
+        start_row = 0
+    else:
+        (f2, f3, f4), start_row = checkpoint.open_outputs(
+                                        ['slope_map_perc.txt', 
+                                         'slope_map_deg.txt', 
+                                         'aspect_map.txt'])
+
+    # D8 aspect is written as whole degrees.
+    if args.flow_dir == 'D8':
+        aspect_cell = lambda cell: int(cell) if not math.isnan(cell) else cell
+    else:
+        aspect_cell = lambda cell: cell
+
+    slope_cell = lambda cell: round(cell, 1)
+    runs = result.runs or [[] for r in range(y_limit)]
+
+    output1 = csv.writer(f2, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+    output2 = csv.writer(f3, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+    output3 = csv.writer(f4, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+
+
+    for r in range(start_row, y_limit):  
+
+        if args.slope_map in ['P', 'B']:
+            output1.writerow(map_row(slope_perc[r].tolist(), runs[r], 
+                                     slope_cell))
+
+        if args.slope_map in ['D', 'B']:
+            output2.writerow(map_row(slope_deg[r].tolist(), runs[r], 
+                                     slope_cell))
+
+        if args.aspect_map == 'Y':
+            output3.writerow(map_row(aspect[r].tolist(), runs[r], 
+                                     aspect_cell))
+
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save_outputs((f2, f3, f4), r + 1)
+
+    f2.close() 
+    f3.close() 
+    f4.close()
+
+if args.hill_shade != 'N':
+    write_map('hillshade_map.txt', shade, None)
+
+if args.focal_stats == 'Y':
+    write_map('plan_curv_map.txt', plan_curv, 2)
+    write_map('prof_curv_map.txt', prof_curv, 2)
+    write_map('tri_map.txt', tri)
+    write_map('tpi_map.txt', tpi)
+    write_map('roughness_map.txt', rough)
+
+if args.label_maps == 'Y':
+    sink_labels, flat_labels = region_labels
+    write_map('sink_label_map.txt', sink_labels, None)
+    write_map('flat_label_map.txt', flat_labels, None)
+
+if args.slope_classes != 'N':
+    write_map('slope_class_map.txt', slope_classes, None)
+
+    f5 = open('slope_class_area.txt', 'w', newline='')
+    csv.writer(f5, delimiter=' ').writerows(class_report)
+    f5.close()
 
-output1 = csv.writer(f2, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
-output2 = csv.writer(f3, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
-output3 = csv.writer(f4, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC)
+if args.observers != 'N':
+    write_map('viewshed_map.txt', view_count, None)
 
+if args.sources != 'N':
+    write_map('cost_distance_map.txt', travel_cost)
 
-for r in range(len(gradient)):  
+    if args.targets != 'N':
+        cdt.write_routes('routes.geojson', routes, route_costs, y_limit, 
+                         x_origin, y_origin, 
+                         terrain.cellsize or args.resolution)
 
-    if args.slope_map in ['P', 'B']:
-        output1.writerow([round(cells.slope_perc,1) for cells in gradient[r]])
+if args.insolation != 'N':
+    write_map('insolation_map.txt', energy, 2)
 
-    if args.slope_map in ['D', 'B']:
-        output2.writerow([round(cells.slope_deg,1) for cells in gradient[r]])
+if args.contour_interval > 0:
+    contours.write_geojson('contours.geojson', x_origin, y_origin, 
+                           terrain.cellsize or args.resolution)
 
-    if args.aspect_map == 'Y':
-        output3.writerow([cells.aspect for cells in gradient[r]])
+if args.tiled_out == 'Y':
+    for name, grid, required in (
+            ('slope_map_perc', slope_perc, args.slope_map in ['P', 'B']),
+            ('slope_map_deg', slope_deg, args.slope_map in ['D', 'B']),
+            ('aspect_map', aspect, args.aspect_map == 'Y')):
+        if required:
+            trs.write_tiled(name + '.ttr', grid, terrain.nodata_value, 
+                            x_origin, y_origin, 
+                            terrain.cellsize or args.resolution)
 
-f2.close() 
-f3.close() 
-f4.close() 
+# All output files written - checkpoints no longer needed.
+if checkpoint is not None:
+    checkpoint.remove()
@@ -0,0 +1,259 @@
+'''
+Viewshed Calculations
+
+Purpose:
+    - Finds the cells of the terrain visible from observer points (e.g.
+      lift stations or cameras) given in map coordinates, with an observer
+      height above the terrain
+    - Counts, for every cell, the number of observers that can see it
+      (cumulative viewshed), using a pool of worker processes when there
+      are many observers
+
+Developer Note:
+    - Visibility is swept outwards from the observer one ring of cells at a
+      time (XDraw reference planes).  The line of sight to a cell crosses
+      the ring inside it between two cells, and the highest sight line
+      through those two cells (interpolated) gives the height the cell must
+      reach to be seen.  Each cell is visited once per observer, and each
+      ring is calculated with numpy arrays, so there is no ray cast to
+      every cell.
+    - The interpolated sight line makes this an approximation of a full
+      line of sight check, which is usual for this method.
+    - NoData (NaN) cells can not be seen and do not block the view.
+    - A target height (e.g. a skier above the snow) is only added to the
+      cell being looked at.  The cells in between block the view at their
+      terrain height.
+    - The worker processes are given the terrain once, when started,
+      rather than with each observer.
+
+Filename:
+    - viewshed.py
+
+Functions:
+    - read_observers
+    - observer_cell
+    - viewshed
+    - start_worker
+    - worker_viewshed
+    - cumulative_viewshed
+
+Input:
+    - Elevation map data array (NaN for NoData)
+    - Observer points (map coordinates) and observer height
+    - Map reference (lower left corner, cell size)
+    - No. of worker processes
+
+Output:
+    - Visible cells of each observer (boolean array)
+    - No. of observers seeing each cell (array, NaN for NoData)
+'''
+
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Terrain given to each worker process when started.
+worker_grid = None
+
+
+def read_observers(file_name):
+    '''
+    Use this function to read observer points, one x y pair (map
+    coordinates, space or comma separated) per line.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Observer file name
+
+    Output:
+        - List of (x, y)
+        - Validation exceptions (not a pair of numbers)
+    '''
+    observers = []
+
+    with open(file_name) as f:
+        for n, line in enumerate(f, 1):
+            fields = line.replace(',', ' ').split()
+            if not fields:
+                continue
+            try:
+                x, y = map(float, fields)
+            except ValueError:
+                sys.exit('Invalid observer in line #' + str(n) + ' of '
+                         + file_name + '.')
+            observers.append((x, y))
+
+    return observers
+
+
+def observer_cell(grid, x, y, x_origin, y_origin, cellsize):
+    '''
+    Use this function to find the cell an observer is in.
+
+    Triggered by:
+        - cumulative_viewshed
+        - any python program
+
+    Input:
+        - Elevation map data array (NaN for NoData)
+        - Observer x, y (map coordinates)
+        - Lower left corner map reference (x, y)
+        - Cell size
+
+    Output:
+        - Row, column of the cell
+        - Validation exceptions (outside the terrain or on NoData)
+    '''
+    y_limit, x_limit = grid.shape
+    r = y_limit - 1 - int(np.floor((y - y_origin) / cellsize))
+    c = int(np.floor((x - x_origin) / cellsize))
+
+    if not (0 <= r < y_limit and 0 <= c < x_limit) or np.isnan(grid[r, c]):
+        sys.exit('Observer ' + f'{x:g} {y:g}'
+                 + ' is outside the terrain or on NoData.')
+
+    return r, c
+
+
+def viewshed(grid, r, c, observer_height, target_height=0):
+    '''
+    Use this function to find the cells visible from an observer, sweeping
+    out one ring of cells at a time.
+
+    Triggered by:
+        - cumulative_viewshed
+        - any python program
+
+    Input:
+        - Elevation map data array (NaN for NoData)
+        - Observer row, column
+        - Observer height above the terrain
+        - Target height above the terrain
+
+    Output:
+        - Visible cells (boolean array)
+    '''
+    y_limit, x_limit = grid.shape
+    eye = grid[r, c] + observer_height
+    target = grid + target_height
+
+    # Highest sight line (or bare terrain) height through each cell swept.
+    # The target height only decides whether a cell is seen, it does not
+    # raise the terrain blocking the cells behind it.
+    horizon = grid.copy()
+    visible = np.zeros(grid.shape, dtype=bool)
+    visible[r, c] = True
+
+    for k in range(1, max(r, y_limit - 1 - r, c, x_limit - 1 - c) + 1):
+
+        # Cells of ring k within the terrain.
+        side = np.arange(-k, k + 1)
+        dy = np.concatenate((np.full(side.size, -k), np.full(side.size, k),
+                             side[1:-1], side[1:-1]))
+        dx = np.concatenate((side, side, np.full(side.size - 2, -k),
+                             np.full(side.size - 2, k)))
+        inside = (r + dy >= 0) & (r + dy < y_limit) \
+                 & (c + dx >= 0) & (c + dx < x_limit)
+        dy, dx = dy[inside], dx[inside]
+        rows, cols = r + dy, c + dx
+
+        # Ring 1 is always seen.  A NoData cell in it is taken as level
+        # with the ground under the observer.
+        if k == 1:
+            reference = np.full(rows.size, -np.inf)
+            missing = np.full(rows.size, grid[r, c])
+        else:
+            # Where the sight line crosses ring k - 1, and the 2 cells of
+            # ring k - 1 either side of it.
+            py = dy * (k - 1) / k
+            px = dx * (k - 1) / k
+            on_row = np.abs(dy) == k
+            along = np.where(on_row, px, py)
+            low = np.floor(along).astype(np.int64)
+            t = along - low
+            high = low + (t > 0)
+
+            ring = np.where(on_row, dy - np.sign(dy), dx - np.sign(dx))
+            r1 = r + np.where(on_row, ring, low)
+            c1 = c + np.where(on_row, low, ring)
+            r2 = r + np.where(on_row, ring, high)
+            c2 = c + np.where(on_row, high, ring)
+
+            # Sight line through ring k - 1, carried out to ring k.
+            crossing = horizon[r1, c1] * (1 - t) + horizon[r2, c2] * t
+            reference = eye + (crossing - eye) * k / (k - 1)
+            missing = reference
+
+        heights = grid[rows, cols]
+        visible[rows, cols] = target[rows, cols] >= reference
+        horizon[rows, cols] = np.where(np.isnan(heights), missing,
+                                       np.maximum(heights, reference))
+
+    return visible
+
+
+def start_worker(grid):
+    '''
+    Keep the terrain in a worker process.
+    '''
+    global worker_grid
+    worker_grid = grid
+
+
+def worker_viewshed(args):
+    '''
+    Find the visible cells of one observer in a worker process.
+    '''
+    return np.packbits(viewshed(worker_grid, *args))
+
+
+def cumulative_viewshed(grid, observers, observer_height, x_origin, y_origin,
+                        cellsize, target_height=0, workers=1):
+    '''
+    Use this function to count the observers that can see each cell.
+
+    Triggered by:
+        - tothemaxmain.py
+        - any python program
+
+    Input:
+        - Elevation map data (array or nested list, NaN for NoData)
+        - List of observer points (x, y map coordinates)
+        - Observer height above the terrain
+        - Lower left corner map reference (x, y)
+        - Cell size
+        - Target height above the terrain
+        - No. of worker processes
+
+    Output:
+        - No. of observers seeing each cell (array, NaN for NoData)
+        - No. of cells visible from each observer (list)
+    '''
+    grid = np.asarray(grid, dtype=np.float64)
+    cells = [observer_cell(grid, x, y, x_origin, y_origin, cellsize)
+             + (observer_height, target_height) for x, y in observers]
+    counts = np.zeros(grid.shape, dtype=np.int64)
+    seen = []
+
+    if workers > 1 and len(cells) > 1:
+        with ProcessPoolExecutor(workers, initializer=start_worker,
+                                 initargs=(grid,)) as executor:
+            for packed in executor.map(worker_viewshed, cells):
+                visible = np.unpackbits(packed, count=grid.size) \
+                            .reshape(grid.shape).astype(bool)
+                counts += visible
+                seen.append(int(visible.sum()))
+    else:
+        for args in cells:
+            visible = viewshed(grid, *args)
+            counts += visible
+            seen.append(int(visible.sum()))
+
+    counts = counts.astype(np.float64)
+    counts[np.isnan(grid)] = np.nan
+
+    return counts, seen